@@ -0,0 +1,99 @@
+"""
+Agenda individual
+Próximas missas de uma pessoa a partir do índice escala_membros e geração do
+feed iCalendar (RFC 5545) para assinatura no celular.
+"""
+from datetime import datetime, timedelta, timezone
+
+NOMES_FUNCOES = {
+    'cerimoniarios': 'Cerimoniário',
+    'veteranos': 'Veterano',
+    'mirins': 'Mirim',
+    'turibulo': 'Turíbulo',
+    'naveta': 'Naveta',
+    'tochas': 'Tochas',
+}
+
+DURACAO_MISSA = timedelta(hours=1, minutes=30)
+
+# Horários das missas são locais; o Brasil não tem horário de verão desde 2019
+FUSO = 'America/Sao_Paulo'
+VTIMEZONE = [
+    'BEGIN:VTIMEZONE',
+    f'TZID:{FUSO}',
+    'BEGIN:STANDARD',
+    'DTSTART:19700101T000000',
+    'TZOFFSETFROM:-0300',
+    'TZOFFSETTO:-0300',
+    'TZNAME:-03',
+    'END:STANDARD',
+    'END:VTIMEZONE',
+]
+
+
+def buscar_proximas_escalas(conn, nome, desde_iso):
+    """Escalas da pessoa a partir de `desde_iso` (YYYY-MM-DD), ordenadas por data"""
+    rows = conn.execute(
+        '''SELECT e.id, e.data, e.tipo_escala, e.bata_cor, m.funcao, m.data_iso
+           FROM escala_membros m
+           JOIN escalas e ON e.id = m.escala_id
+           WHERE m.nome = ? AND m.data_iso >= ?
+           ORDER BY m.data_iso, e.tipo_escala''',
+        (nome, desde_iso)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _escapar_texto(texto):
+    return (texto or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _dobrar_linha(linha):
+    """Quebra linhas com mais de 75 octetos, como exige o RFC 5545"""
+    bruto = linha.encode('utf-8')
+    if len(bruto) <= 75:
+        return linha
+    partes = []
+    atual = ''
+    for caractere in linha:
+        limite = 75 if not partes else 74
+        if len((atual + caractere).encode('utf-8')) > limite:
+            partes.append(atual)
+            atual = caractere
+        else:
+            atual += caractere
+    partes.append(atual)
+    return '\r\n '.join(partes)
+
+
+def gerar_ics(nome, itens, dominio='appigreja'):
+    """
+    Gera o calendário .ics. Cada item precisa de id, data_iso, horario,
+    tipo_escala, funcao e bata_cor. Início e fim saem no fuso de São Paulo (TZID).
+    """
+    agora = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    linhas = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{dominio}//Escalas de Coroinhas//PT-BR',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escapar_texto("Escalas - " + nome)}',
+        f'X-WR-TIMEZONE:{FUSO}',
+    ] + VTIMEZONE
+    for item in itens:
+        inicio = datetime.strptime(f"{item['data_iso']} {item['horario'] or '00:00'}", '%Y-%m-%d %H:%M')
+        fim = inicio + DURACAO_MISSA
+        funcao = NOMES_FUNCOES.get(item['funcao'], item['funcao'])
+        linhas.extend([
+            'BEGIN:VEVENT',
+            f"UID:escala-{item['id']}-{item['funcao']}@{dominio}",
+            f'DTSTAMP:{agora}',
+            f"DTSTART;TZID={FUSO}:{inicio.strftime('%Y%m%dT%H%M%S')}",
+            f"DTEND;TZID={FUSO}:{fim.strftime('%Y%m%dT%H%M%S')}",
+            f"SUMMARY:{_escapar_texto(item['tipo_escala'] + ' - ' + funcao)}",
+            f"DESCRIPTION:{_escapar_texto('Função: ' + funcao + chr(10) + (item.get('bata_cor') or 'Bata Branca'))}",
+            'END:VEVENT',
+        ])
+    linhas.append('END:VCALENDAR')
+    return '\r\n'.join(_dobrar_linha(linha) for linha in linhas) + '\r\n'
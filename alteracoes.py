@@ -0,0 +1,139 @@
+"""
+Registro de alterações (tabela alteracoes)
+Toda rota de escrita grava, na mesma transação da escrita, uma linha por
+alteração: entidade, id, mês afetado (ano/mes, nulo para dados que valem para
+todos os meses), ação, estado antes/depois (JSON), autor e data. A tabela só
+recebe INSERTs, então serve de histórico e de fonte de versões:
+
+- invalidação de caches entre processos no SQLite: cada linha leva os escopos de
+  cache que a alteração invalida e notificacoes.py lê as linhas novas (substitui
+  a antiga tabela cache_eventos; no PostgreSQL continua o LISTEN/NOTIFY);
+- ETag das páginas do mês: o maior id do mês e o maior id geral mudam a cada
+  escrita que afeta a página, em qualquer instância, sem ler as escalas.
+
+O índice (ano, mes, id) atende tanto o histórico do mês quanto o MAX(id) do ETag.
+A versão de cada mês fica em cache pelas versões dos escopos (caches.py): só é
+lida de novo depois de uma escrita que invalida o mês ou os dados de referência.
+"""
+import json
+from datetime import datetime
+
+from cachetools import TTLCache
+
+import caches
+import notificacoes
+
+# {(ano, mes, versões dos escopos): (maior id do mês, maior id geral)}; o TTL só libera memória
+_versoes_meses = TTLCache(maxsize=256, ttl=3600)
+
+# Escopos de cache invalidados por alterações que não são de um mês específico
+ESCOPOS_POR_ENTIDADE = {
+    'pessoa': ('pessoas', 'modelos'),  # desativar uma pessoa leva junto seus candidatos nos modelos
+    'modelo': ('modelos',),
+    'dia_missa': ('dias_missa',),
+    'indisponibilidade': (),
+    'banco': (caches.TODOS,),          # restauração de backup ou banco reiniciado
+}
+
+NOMES_ENTIDADES = {
+    'escala': 'Escala', 'mes': 'Mês', 'pessoa': 'Pessoa', 'modelo': 'Modelo',
+    'dia_missa': 'Dia de missa', 'indisponibilidade': 'Indisponibilidade', 'banco': 'Banco de dados',
+}
+NOMES_ACOES = {
+    'inserir': 'incluída(o)', 'atualizar': 'alterada(o)', 'remover': 'removida(o)',
+    'gerar': 'gerado', 'limpar': 'limpo', 'importar': 'importação', 'restaurar': 'restaurado',
+    'reiniciar': 'reiniciado', 'desativar': 'desativada(o)', 'reativar': 'reativada(o)',
+    'migrar': 'migrado',
+}
+
+
+def _json(valor):
+    if valor is None:
+        return None
+    return json.dumps(dict(valor) if hasattr(valor, 'keys') else valor,
+                      ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def escopos(entidade, ano=None, mes=None):
+    """Escopos de cache invalidados por uma alteração da entidade (no mês, se houver)"""
+    if ano is not None and mes is not None:
+        return caches.escopos_do_mes(ano, mes)
+    return ESCOPOS_POR_ENTIDADE.get(entidade, ())
+
+
+def mes_da_data(data_br):
+    """(ano, mes) de uma data 'DD/MM/YYYY'"""
+    _, mes, ano = data_br.split('/')
+    return int(ano), int(mes)
+
+
+def registrar(conn, entidade, acao, entidade_id=None, ano=None, mes=None, antes=None, depois=None, autor=None):
+    """Grava uma alteração na transação de `conn` (sem commit)"""
+    conn.execute(
+        '''INSERT INTO alteracoes (entidade, entidade_id, ano, mes, acao, antes, depois, escopos, autor, origem, criado_em)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (entidade, entidade_id, ano, mes, acao, _json(antes), _json(depois),
+         ','.join(escopos(entidade, ano, mes)), autor, notificacoes.ORIGEM,
+         datetime.now().isoformat(timespec='seconds'))
+    )
+
+
+def registrar_escala(conn, acao, escala_id, data_br, antes=None, depois=None, autor=None):
+    """Atalho para alterações de uma escala (o mês vem da data)"""
+    ano, mes = mes_da_data(data_br)
+    registrar(conn, 'escala', acao, escala_id, ano, mes, antes, depois, autor)
+
+
+def versao_do_mes(conn, ano, mes):
+    """(maior id do mês, maior id geral): muda a cada escrita que afeta a página do mês"""
+    # Toda alteração do mês ou geral que aparece na página invalida um destes escopos
+    # (indisponibilidades não aparecem e não invalidam nenhum)
+    chave = (ano, mes) + caches.versoes(caches.escopo_mes(ano, mes), *caches.ESCOPOS)
+
+    def calcular():
+        # Duas buscas pelo índice em uma ida ao banco (um OR entre elas leria todas as linhas)
+        row = conn.execute(
+            '''SELECT (SELECT MAX(id) FROM alteracoes WHERE ano = ? AND mes = ?) AS do_mes,
+                      (SELECT MAX(id) FROM alteracoes WHERE ano IS NULL) AS geral''',
+            (ano, mes)
+        ).fetchone()
+        return row['do_mes'] or 0, row['geral'] or 0
+
+    return caches.obter_ou_calcular(_versoes_meses, chave, calcular)
+
+
+def _campos_alterados(antes, depois):
+    """[(campo, antes, depois)] dos campos que mudaram (ou de todos, em inclusões/remoções)"""
+    antes = antes if isinstance(antes, dict) else {}
+    depois = depois if isinstance(depois, dict) else {}
+    campos = []
+    for campo in list(antes) + [c for c in depois if c not in antes]:
+        if campo in ('id', 'versao'):
+            continue
+        if antes.get(campo) != depois.get(campo):
+            campos.append((campo, antes.get(campo), depois.get(campo)))
+    return campos
+
+
+def listar(conn, ano=None, mes=None, limite=200):
+    """
+    Alterações mais recentes com os campos alterados: as do mês mais as gerais
+    (pessoas, modelos, dias de missa), com ano/mes, ou todas.
+    """
+    if ano is not None and mes is not None:
+        rows = conn.execute(
+            'SELECT * FROM alteracoes WHERE (ano = ? AND mes = ?) OR ano IS NULL ORDER BY id DESC LIMIT ?',
+            (ano, mes, limite)
+        ).fetchall()
+    else:
+        rows = conn.execute('SELECT * FROM alteracoes ORDER BY id DESC LIMIT ?', (limite,)).fetchall()
+    registros = []
+    for row in rows:
+        registro = dict(row)
+        registro['antes'] = json.loads(registro['antes']) if registro['antes'] else None
+        registro['depois'] = json.loads(registro['depois']) if registro['depois'] else None
+        registro['campos'] = _campos_alterados(registro['antes'], registro['depois'])
+        registro['entidade_nome'] = NOMES_ENTIDADES.get(registro['entidade'], registro['entidade'])
+        registro['acao_nome'] = NOMES_ACOES.get(registro['acao'], registro['acao'])
+        registros.append(registro)
+    return registros
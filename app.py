@@ -1,15 +1,35 @@
-import random
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, make_response, Response, stream_with_context, session, has_request_context
 import os
 import pandas as pd
 from calendar import monthrange
+import hashlib
 import io
 import json
+import time
 from database import (
-    get_db_connection, create_tables, USE_POSTGRES, DB_TYPE,
-    IntegrityError, OperationalError, build_date_filter_query
+    get_db_connection, create_tables, USE_POSTGRES, USA_REPLICA, DB_TYPE,
+    IntegrityError, OperationalError, build_date_filter_query, inserir_retornando_id
 )
+import busca
+import caches
+import agenda
+import rollups
+import modelos
+import cadastro
+import notificacoes
+import visao_mes
+import lote
+import importacao
+import backup
+import indisponibilidades
+import gerador
+import geracoes
+import concorrencia
+import alteracoes
+import desativacao
+import fragmentos
+import impressao
 # xlsxwriter é usado como engine do pandas, não precisa importar diretamente
 
 # --- Configurações do Flask ---
@@ -22,6 +42,8 @@ app = Flask(__name__,
             static_folder=STATIC_DIR,
             static_url_path='/static',
             template_folder=TEMPLATES_DIR)
+# Templates compilados em disco: um processo novo não precisa compilar index.html de novo (ver fragmentos.py)
+app.jinja_env.bytecode_cache = fragmentos.cache_de_bytecode()
 # Chave secreta - em produção, usar variável de ambiente
 app.secret_key = os.environ.get('SECRET_KEY', 'sua_chave_secreta_aqui_altere_em_producao')
 # Configuração de banco de dados
@@ -29,20 +51,13 @@ app.secret_key = os.environ.get('SECRET_KEY', 'sua_chave_secreta_aqui_altere_em_
 # Caso contrário, usa SQLite para desenvolvimento local
 EXCEL_FILE = os.path.join(BASE_DIR, 'BASE DE DADOS COROINHAS.xlsx')
 
-# --- GRUPOS E TIPOS DE ESCALA (PADRONIZADO) ---
-GRUPO_MIRINS = 'mirins'
-GRUPO_VETERANO = 'veterano'
-GRUPO_CERIMONIARIO = 'cerimoniario'
-TIPO_ESCALA_DOMINGO_MANHA = 'Domingo Manhã'
-TIPO_ESCALA_DOMINGO_NOITE = 'Domingo Noite'
-
-# --- CONSTANTES DE HORÁRIOS ---
-HORARIO_DOMINGO_MANHA = '07:00'
-HORARIO_DOMINGO_NOITE = '18:00'
-HORARIO_SEMANA = '19:00'
-
-# --- SEPARADOR DE NOMES (PADRONIZADO) ---
-SEPARADOR_NOMES = ', '  # Vírgula e espaço
+# --- GRUPOS, TIPOS DE ESCALA, HORÁRIOS E SEPARADOR (PADRONIZADOS, definidos em gerador.py) ---
+from gerador import (
+    GRUPO_MIRINS, GRUPO_VETERANO, GRUPO_CERIMONIARIO,
+    TIPO_ESCALA_DOMINGO_MANHA, TIPO_ESCALA_DOMINGO_NOITE,
+    HORARIO_DOMINGO_MANHA, HORARIO_DOMINGO_NOITE, HORARIO_SEMANA,
+    SEPARADOR_NOMES
+)
 
 # --- Listas de Candidatos para Templates Iniciais ---
 g_terca_template_initial = [
@@ -110,16 +125,9 @@ def obter_horario_por_tipo_escala(tipo_escala, dias_missa_horarios=None):
     else:
         return HORARIO_SEMANA
 
-def parsear_nomes(campo):
-    """Parseia uma string de nomes separados por vírgula, suportando ambos os formatos"""
-    if not campo:
-        return []
-    # Suporta tanto ', ' quanto ',' como separador
-    return [nome.strip() for nome in campo.replace(', ', ',').split(',') if nome.strip()]
-
-def juntar_nomes(lista_nomes):
-    """Junta uma lista de nomes usando o separador padronizado"""
-    return SEPARADOR_NOMES.join(lista_nomes)
+# Listas de nomes das escalas: formato único em busca.py (também usado pelo índice escala_membros)
+parsear_nomes = busca.parsear_nomes
+juntar_nomes = busca.juntar_nomes
 
 def contar_membros(campo):
     """Conta o número de membros em um campo de nomes"""
@@ -160,11 +168,42 @@ def get_db():
     
     return conn
 
+# Depois de uma escrita, a sessão lê do primário por este tempo (a réplica pode estar atrasada)
+JANELA_LEITURA_PROPRIA = float(os.environ.get('REPLICA_JANELA_SEGUNDOS', '15'))
+
+def get_db_leitura():
+    """
+    Conexão para rotas que só leem: a réplica (DATABASE_READ_URL), se configurada,
+    exceto para quem acabou de gravar, que continua no primário e vê a própria escrita.
+    """
+    if not USA_REPLICA or time.time() - session.get('ultima_escrita', 0) < JANELA_LEITURA_PROPRIA:
+        return get_db()
+    caches.lendo_da_replica(True)
+    return get_db_connection(leitura=True)
+
+# Muda a cada nova versão do código das páginas do mês, para que o ETag não sobreviva a um deploy
+ASSINATURA_PAGINAS = max(os.path.getmtime(os.path.join(BASE_DIR, caminho))
+                         for caminho in ('app.py', 'visao_mes.py', os.path.join('templates', 'index.html'),
+                                         os.path.join('templates', '_escalas_mes.html')))
+ASSINATURA_AGENDA = max(os.path.getmtime(os.path.join(BASE_DIR, caminho))
+                        for caminho in ('app.py', 'agenda.py', os.path.join('templates', 'pessoa_escalas.html')))
+
+def autor_da_requisicao():
+    """Autor registrado em alteracoes: sem login, fica o endereço de origem da requisição"""
+    if not has_request_context():
+        return 'sistema'
+    origem = request.headers.get('X-Forwarded-For') or request.remote_addr or ''
+    return origem.split(',')[0].strip() or None
+
 def init_db():
     """Inicializa o banco de dados criando as tabelas se não existirem"""
     conn = get_db_connection()
     try:
         create_tables(conn)
+        busca.reconstruir_indice_se_necessario(conn)
+        rollups.reconstruir_se_necessario(conn)
+        modelos.migrar_templates_legados(conn)
+        caches.invalidar('modelos')
         print(f"Banco de dados {DB_TYPE} inicializado/verificado.")
     except Exception as e:
         print(f"Erro ao inicializar banco de dados: {e}")
@@ -182,6 +221,8 @@ def popular_templates_iniciais():
             for tipo, data in templates_map.items():
                 cursor.execute(''' INSERT INTO escala_templates (tipo_escala, cerimoniarios_template, veteranos_template, mirins_template, turibulo_template, naveta_template, tochas_template) VALUES (?, ?, ?, ?, ?, ?, ?) ''', ( tipo, SEPARADOR_NOMES.join(data.get('cerims', [])), SEPARADOR_NOMES.join(data.get('vets', [])), SEPARADOR_NOMES.join(data.get('kids', [])), SEPARADOR_NOMES.join(data.get('turib', [])), SEPARADOR_NOMES.join(data.get('nav', [])), SEPARADOR_NOMES.join(data.get('tochas', [])) ))
             db.commit()
+            modelos.migrar_templates_legados(db)
+            caches.invalidar('modelos')
             print("Modelos de escala (templates) populados!")
         db.close()
 
@@ -201,6 +242,7 @@ def popular_dias_missa_iniciais():
             for dia_semana, tipo_escala, horario, ativo, ordem in dias_iniciais:
                 cursor.execute(''' INSERT INTO dias_missa (dia_semana, tipo_escala, horario, ativo, ordem) VALUES (?, ?, ?, ?, ?) ''', (dia_semana, tipo_escala, horario, ativo, ordem))
             db.commit()
+            caches.invalidar('dias_missa')
             print("Dias de missa populados!")
         db.close()
 
@@ -210,105 +252,67 @@ def importar_dados_iniciais_do_excel():
         cursor = db.cursor()
         if cursor.execute("SELECT COUNT(*) FROM pessoas").fetchone()[0] == 0:
             print(f"Tentando importar pessoas do arquivo: {EXCEL_FILE}")
-            try:
-                if os.path.exists(EXCEL_FILE):
-                    # Tenta ler o arquivo Excel se existir
-                    df = pd.read_excel(EXCEL_FILE)
-                    print(f"Arquivo Excel encontrado. Use o script cadastra_pessoas.py para importar dados.")
-                else:
-                    print(f"Arquivo Excel não encontrado em {EXCEL_FILE}. Use o script cadastra_pessoas.py para importar dados.")
-            except Exception as e:
-                print(f"Erro ao tentar ler arquivo Excel: {e}. Use o script cadastra_pessoas.py para importar dados.")
-            print("Importação do Excel concluída (se aplicável).")
+            if os.path.exists(EXCEL_FILE):
+                try:
+                    with open(EXCEL_FILE, 'rb') as arquivo:
+                        resultado = importacao.importar(db, importacao.ler_arquivo(arquivo, EXCEL_FILE))
+                    alteracoes.registrar(db, 'pessoa', 'importar', depois={'arquivo': EXCEL_FILE, 'inseridos': resultado.inseridos},
+                                         autor=autor_da_requisicao())
+                    notificacoes.confirmar(db, 'pessoas')
+                    print(f"Importação do Excel concluída: {resultado.resumo()}.")
+                    for mensagem in resultado.ignorados:
+                        print(f"  {mensagem}")
+                except Exception as e:
+                    db.rollback()
+                    print(f"Erro ao importar o arquivo Excel: {e}")
+            else:
+                print(f"Arquivo Excel não encontrado em {EXCEL_FILE}. Use a importação de planilha em Gerenciar Pessoas.")
         db.close()
 
 def limpar_db_e_reimportar():
     with app.app_context():
         db = get_db()
         cursor = db.cursor()
+        if not USE_POSTGRES:
+            cursor.execute("DROP TABLE IF EXISTS escala_membros_fts")
+        cursor.execute("DROP TABLE IF EXISTS escala_membros")
+        cursor.execute("DROP TABLE IF EXISTS frequencia_mensal")
+        cursor.execute("DROP TABLE IF EXISTS visao_mensal")
+        cursor.execute("DROP TABLE IF EXISTS template_candidatos")
+        cursor.execute("DROP TABLE IF EXISTS indisponibilidades")
+        cursor.execute("DROP TABLE IF EXISTS geracoes")
         cursor.execute("DROP TABLE IF EXISTS escalas"); cursor.execute("DROP TABLE IF EXISTS pessoas"); cursor.execute("DROP TABLE IF EXISTS escala_templates"); cursor.execute("DROP TABLE IF EXISTS dias_missa")
         db.commit()
+        caches.invalidar(caches.TODOS)
         print("Tabelas removidas.")
         init_db()
         importar_dados_iniciais_do_excel()
         popular_templates_iniciais()
         popular_dias_missa_iniciais()
+        # Avisar as outras instâncias de que todos os caches ficaram inválidos
+        alteracoes.registrar(db, 'banco', 'reiniciar', autor=autor_da_requisicao())
+        notificacoes.confirmar(db, caches.TODOS)
         db.close()
         flash("Banco de dados reiniciado e dados reimportados com sucesso!", 'success')
 
 
 
-def gerar_escala_para_mes(mes, ano):
+def gerar_escala_para_mes(mes, ano, dia_inicio=None, dia_fim=None, escala_ids=None, semente=None, candidatos=None):
     """
     Gera a escala para o mês com regras avançadas de sorteio, distribuição e
-    um relatório de frequência ao final.
+    um relatório de frequência ao final. O sorteio em si fica em gerador.py;
+    aqui ficam a leitura/gravação no banco e o registro da execução em geracoes
+    (com a semente, para reproduzir o mesmo resultado).
+
+    São sorteadas `candidatos` versões do mês (padrão geracoes.CANDIDATOS_POR_GERACAO)
+    e fica a de menor pontuação; com `semente`, repete exatamente aquele sorteio.
+    Retorna a pontuação da escolhida (veja gerador.pontuar).
+
+    Modo incremental: com `escala_ids` (apenas essas escalas) ou `dia_inicio`/`dia_fim`
+    (apenas os dias do intervalo), só esses horários são apagados e sorteados de novo.
+    As demais escalas do mês ficam como estão e entram na contagem de serviços e nas
+    restrições de repetição no mesmo dia.
     """
-    QUANTIDADES_POR_FUNCAO = {
-        'domingo_e_solenidade': {
-            # DOMINGOS: 2 Cerimoniários, 2 Veteranos, 2 Mirins, 2 Tochas, 1 Turíbulo, 1 Naveta
-            'cerimoniarios': 2, 'veteranos': 2, 'mirins': 2,
-            'turibulo': 1, 'naveta': 1, 'tochas': 2
-        },
-        'semana': {
-            # TERÇA E QUINTA: 1 Cerimoniário, 2 Veteranos, 2 Mirins
-            'cerimoniarios': 1, 'veteranos': 2, 'mirins': 2,
-            'turibulo': 0, 'naveta': 0, 'tochas': 0
-        }
-    }
-    DIAS_SOLENES = {
-        "01-01": "Solenidade de Santa Maria, Mãe de Deus",
-        "08-12": "Solenidade da Imaculada Conceição",
-        "25-12": "Natal do Senhor"
-    }
-
-    def sortear_pessoas(lista_candidatos, quantidade, ja_escalados):
-        if not lista_candidatos: return []
-
-        candidatos_disponiveis = [nome for nome in lista_candidatos if nome not in ja_escalados]
-        
-        # ESTRATÉGIA MELHORADA: Priorizar fortemente pessoas que ainda não serviram 2 vezes
-        # Ordenar por: primeiro quem tem menos de 2 serviços (0 ou 1), depois por quantidade de serviços
-        def prioridade_servico(nome):
-            servicos = contagem_servicos.get(nome, 0)
-            # Prioridade máxima: quem tem 0 serviços
-            if servicos == 0:
-                return (0, 0)  # Máxima prioridade
-            # Segunda prioridade: quem tem 1 serviço
-            elif servicos == 1:
-                return (1, 1)  # Alta prioridade
-            # Terceira prioridade: quem tem exatamente 2 serviços
-            elif servicos == 2:
-                return (2, 2)  # Prioridade média
-            # Última prioridade: quem já tem 3 ou mais serviços
-            else:
-                return (3, servicos)  # Baixa prioridade
-        
-        # Separar candidatos por prioridade
-        candidatos_0_servicos = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) == 0]
-        candidatos_1_servico = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) == 1]
-        candidatos_2_servicos = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) == 2]
-        candidatos_3_mais = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) >= 3]
-        
-        # Embaralhar cada grupo para ter aleatoriedade dentro da mesma prioridade
-        random.shuffle(candidatos_0_servicos)
-        random.shuffle(candidatos_1_servico)
-        random.shuffle(candidatos_2_servicos)
-        random.shuffle(candidatos_3_mais)
-        
-        # Montar lista ordenada por prioridade
-        candidatos_ordenados = candidatos_0_servicos + candidatos_1_servico + candidatos_2_servicos + candidatos_3_mais
-        
-        # Selecionar apenas a quantidade necessária, respeitando a prioridade
-        quantidade_real = min(len(candidatos_ordenados), quantidade)
-        selecionados = candidatos_ordenados[:quantidade_real]
-
-        for nome in selecionados:
-            ja_escalados.add(nome)
-            contagem_servicos[nome] = contagem_servicos.get(nome, 0) + 1
-
-        return selecionados
-
-    # --- LÓGICA PRINCIPAL ---
     db = None
     try:
         db = get_db()
@@ -319,264 +323,73 @@ def gerar_escala_para_mes(mes, ano):
         if ano < 2000 or ano > 2100:
             raise ValueError(f"Ano inválido: {ano}. Deve ser entre 2000 e 2100.")
         
+        # Uma geração do mês por vez, também entre processos (espera a outra terminar)
+        geracoes.travar_mes(db, ano, mes)
+        
         # Deletar escalas do mês/ano usando função compatível
         date_filter, date_params = build_date_filter_query(mes, ano)
-        db.execute(f"DELETE FROM escalas {date_filter}", date_params)
-
-        # Usar db.execute() que retorna cursor, não cursor.execute() diretamente
-        templates = {row['tipo_escala']: row for row in db.execute('SELECT * FROM escala_templates').fetchall()}
-        
-        # Carregar pessoas do banco com seus grupos e funções
-        pessoas_rows = db.execute('SELECT nome, grupo, funcoes FROM pessoas').fetchall()
-        pessoas_e_grupos = {row['nome']: row['grupo'] for row in pessoas_rows}
-        pessoas_e_funcoes = {}
-        for row in pessoas_rows:
-            nome = row['nome']
-            funcoes_str = row['funcoes'] or ''
-            # Parsear funções: pode ser "turibulo,naveta" ou "turibulo, naveta" ou apenas "turibulo"
-            funcoes_list = [f.strip().lower() for f in funcoes_str.split(',') if f.strip()]
-            pessoas_e_funcoes[nome] = set(funcoes_list)
-        
-        # Validar que há pessoas cadastradas
-        if not pessoas_e_grupos:
-            raise ValueError("Não há pessoas cadastradas no sistema. Por favor, cadastre pessoas antes de gerar escalas.")
-        
-        # Validar que há templates configurados
-        if not templates:
-            raise ValueError("Não há modelos de escala configurados. Por favor, configure os modelos antes de gerar escalas.")
-        
-        # Verificar se há pelo menos um template para os tipos de escala necessários
-        tipos_necessarios = {TIPO_ESCALA_DOMINGO_MANHA, TIPO_ESCALA_DOMINGO_NOITE, 'Terça', 'Quinta'}
-        templates_encontrados = set(templates.keys())
-        templates_faltando = tipos_necessarios - templates_encontrados
-        if templates_faltando:
-            print(f"AVISO: Alguns templates não foram encontrados: {templates_faltando}. A função tentará usar fallback.")
-        
-        contagem_servicos = {nome: 0 for nome in pessoas_e_grupos.keys()}
-
-        primeiro_dia = datetime(ano, mes, 1)
-        num_dias = monthrange(ano, mes)[1]
-        ultimo_dia = datetime(ano, mes, num_dias)
-        data_atual = primeiro_dia
-
-
-        # Buscar configuração de dias de missa do banco
-        # IMPORTANTE: Na geração automática, apenas gerar para Domingo, Terça e Quinta
-        # 0=Segunda, 1=Terça, 2=Quarta, 3=Quinta, 4=Sexta, 5=Sábado, 6=Domingo
-        DIAS_PERMITIDOS_GERACAO = {6, 1, 3}  # Domingo, Terça, Quinta
-        
-        try:
-            dias_missa_config = db.execute('SELECT * FROM dias_missa WHERE ativo = 1 ORDER BY ordem').fetchall()
-        except OperationalError:
-            # Tabela pode não existir ainda, usar configuração padrão
-            print("Tabela dias_missa não encontrada, usando configuração padrão.")
-            dias_missa_config = []
-        
-        dias_missa_map = {}  # {dia_semana: [(tipo_escala, horario), ...]}
-        for config in dias_missa_config:
-            try:
-                dia_sem = config['dia_semana']
-                # FILTRO: Apenas incluir dias permitidos na geração automática
-                if dia_sem not in DIAS_PERMITIDOS_GERACAO:
-                    continue
-                    
-                tipo_escala = config['tipo_escala']
-                # Verificar se a coluna horario existe e não é None
-                horario = ''
-                try:
-                    horario_val = config['horario']
-                    horario = horario_val if horario_val else ''
-                except (KeyError, IndexError):
-                    horario = ''
-                
-                if dia_sem not in dias_missa_map:
-                    dias_missa_map[dia_sem] = []
-                dias_missa_map[dia_sem].append((tipo_escala, horario))
-            except (KeyError, IndexError) as e:
-                print(f"Erro ao processar configuração de dia de missa: {e}")
-                continue
-        
-        # Se não houver configuração no banco, usar padrão: Domingo (manhã e noite), Terça, Quinta
-        if not dias_missa_map:
-            print("Usando configuração padrão: Domingo (Manhã e Noite), Terça, Quinta")
-            dias_missa_map = {
-                6: [(TIPO_ESCALA_DOMINGO_MANHA, HORARIO_DOMINGO_MANHA), (TIPO_ESCALA_DOMINGO_NOITE, HORARIO_DOMINGO_NOITE)],  # Domingo
-                1: [('Terça', HORARIO_SEMANA)],  # Terça
-                3: [('Quinta', HORARIO_SEMANA)]  # Quinta
-            }
-        
-        print(f"Configuração de dias de missa: {dias_missa_map}")
-        print(f"Templates disponíveis: {list(templates.keys())}")
-        print(f"Total de pessoas cadastradas: {len(pessoas_e_grupos)}")
-
-        escalas_geradas = 0
-        while data_atual <= ultimo_dia:
-            data_chave = data_atual.strftime("%d-%m")
-            dia_da_semana = data_atual.weekday()
-            escalados_no_dia_inteiro = set()  # Previne repetição no mesmo dia em funções diferentes
-            escalados_domingo = set()  # Previne repetição entre manhã e noite no domingo
-            
-            # Verificar se é solenidade (dia solene que não é domingo)
-            is_solenidade = data_chave in DIAS_SOLENES and dia_da_semana != 6
-            
-            # Se for domingo solene, tratar como domingo normal
-            is_domingo_solenidade = data_chave in DIAS_SOLENES and dia_da_semana == 6
-            
-            # Buscar tipos de escala configurados para este dia da semana
-            tipos_escala_do_dia = []
-            if is_solenidade:
-                # Dia solene que não é domingo - usar regras de domingo (solenidade)
-                tipos_escala_do_dia = [DIAS_SOLENES[data_chave]]
-            elif is_domingo_solenidade:
-                # Domingo que é solenidade - usar regras normais de domingo (manhã e noite)
-                tipos_escala_do_dia = [tipo for tipo, _ in dias_missa_map.get(6, [])]
-            elif dia_da_semana in dias_missa_map:
-                tipos_escala_do_dia = [tipo for tipo, _ in dias_missa_map[dia_da_semana]]
-            
-            # Se não houver tipos de escala para este dia, pular (não gerar escala)
-            if not tipos_escala_do_dia:
-                data_atual += timedelta(days=1)
-                continue
-            
-            # Se for domingo (incluindo domingo solene), garantir que ninguém serve na manhã E à noite
-            is_domingo = dia_da_semana == 6
-            
-            for tipo_escala in tipos_escala_do_dia:
-                # Determinar template base - SEMPRE usar o template correspondente ao tipo_escala
-                if is_solenidade:
-                    # Dia solene que não é domingo - usar template de domingo manhã
-                    template_base_nome = TIPO_ESCALA_DOMINGO_MANHA
-                elif "Noite" in tipo_escala or tipo_escala == TIPO_ESCALA_DOMINGO_NOITE:
-                    template_base_nome = TIPO_ESCALA_DOMINGO_NOITE
-                elif "Manhã" in tipo_escala or tipo_escala == TIPO_ESCALA_DOMINGO_MANHA:
-                    template_base_nome = TIPO_ESCALA_DOMINGO_MANHA
-                # Remover verificação de 'Manha' sem til - usar sempre 'Manhã'
-                else:
-                    # Usar o tipo_escala diretamente como nome do template
-                    template_base_nome = tipo_escala
-                
-                # SEMPRE tentar usar o template - se não existir, criar um básico ou usar fallback
-                if template_base_nome in templates:
-                    template = templates[template_base_nome]
+        incremental = bool(escala_ids) or dia_inicio is not None or dia_fim is not None
+        escalas_mantidas = []
+        ids_refazer = []
+        refazer = None
+        if incremental:
+            num_dias_mes = monthrange(ano, mes)[1]
+            dia_inicio = dia_inicio or 1
+            dia_fim = dia_fim or num_dias_mes
+            if not 1 <= dia_inicio <= dia_fim <= num_dias_mes:
+                raise ValueError(f"Intervalo de dias inválido: {dia_inicio} a {dia_fim}.")
+            ids_alvo = sorted({int(i) for i in escala_ids or []})
+            refazer = {'dia_inicio': dia_inicio, 'dia_fim': dia_fim, 'escala_ids': ids_alvo, 'por_data': {}, 'cores': []}
+
+            for escala in db.execute(f"SELECT * FROM escalas {date_filter} ORDER BY data, tipo_escala", date_params).fetchall():
+                if ids_alvo:
+                    alvo = escala['id'] in ids_alvo
                 else:
-                    # Se o template não existe, criar um template vazio para usar fallback
-                    print(f"AVISO: Template '{template_base_nome}' não encontrado. Usando fallback com todas as pessoas.")
-                    template = {
-                        'cerimoniarios_template': '',
-                        'veteranos_template': '',
-                        'mirins_template': '',
-                        'turibulo_template': '',
-                        'naveta_template': '',
-                        'tochas_template': ''
-                    }
-                
-                # CORREÇÃO: Usar todos os nomes do template, não filtrar por grupo
-                # Isso resolve a inconsistência onde nomes não aparecem
-                # Função auxiliar para acessar chaves do template com segurança
-                def get_template_value(key, default=''):
-                    try:
-                        val = template[key] if key in template.keys() else default
-                        return val if val else default
-                    except (KeyError, IndexError):
-                        return default
-                
-                # Obter candidatos do template - se vazio, usar todas as pessoas do banco como fallback
-                candidatos_cerim_modelo = parsear_nomes(get_template_value('cerimoniarios_template', ''))
-                candidatos_vet_modelo = parsear_nomes(get_template_value('veteranos_template', ''))
-                candidatos_mir_modelo = parsear_nomes(get_template_value('mirins_template', ''))
-                candidatos_turib_modelo = parsear_nomes(get_template_value('turibulo_template', ''))
-                candidatos_nav_modelo = parsear_nomes(get_template_value('naveta_template', ''))
-                candidatos_tochas_modelo = parsear_nomes(get_template_value('tochas_template', ''))
-                
-                # Verificar se é evento especial (pelo nome do tipo de escala)
-                # Eventos especiais podem ter turíbulo, naveta e tochas mesmo em dias de semana
-                palavras_eventos_especiais = ['festejo', 'casamento', 'solenidade', 'especial', 'batizado', 'primeira comunhão', 'confirmação', 'ordenação']
-                is_evento_especial = any(palavra.lower() in tipo_escala.lower() for palavra in palavras_eventos_especiais)
-                
-                # Determinar regras de quantidade
-                # Domingos e solenidades usam regras de domingo
-                if is_solenidade or is_domingo or tipo_escala in [TIPO_ESCALA_DOMINGO_MANHA, TIPO_ESCALA_DOMINGO_NOITE]:
-                    regras_qtd = QUANTIDADES_POR_FUNCAO['domingo_e_solenidade']
-                else:
-                    regras_qtd = QUANTIDADES_POR_FUNCAO['semana'].copy()  # Usar copy() para não modificar o original
-                    
-                    # Se for evento especial E o template tiver candidatos configurados, permitir funções especiais
-                    if is_evento_especial:
-                        # Verificar se há candidatos configurados no template
-                        tem_turibulo = len(candidatos_turib_modelo) > 0
-                        tem_naveta = len(candidatos_nav_modelo) > 0
-                        tem_tochas = len(candidatos_tochas_modelo) > 0
-                        
-                        # Se houver candidatos configurados, usar quantidade padrão de domingo
-                        if tem_turibulo:
-                            regras_qtd['turibulo'] = 1
-                        if tem_naveta:
-                            regras_qtd['naveta'] = 1
-                        if tem_tochas:
-                            regras_qtd['tochas'] = 2
-                
-                # Se o template estiver vazio, usar todas as pessoas do banco como fallback
-                todas_pessoas_nomes = list(pessoas_e_grupos.keys())
-                
-                # Filtrar apenas pessoas que existem no banco
-                # Se o template estiver vazio, usar todas as pessoas do grupo correspondente
-                cerimoniarios_aptos = candidatos_cerim_modelo if candidatos_cerim_modelo else [nome for nome in todas_pessoas_nomes if pessoas_e_grupos.get(nome) == GRUPO_CERIMONIARIO]
-                veteranos_aptos = candidatos_vet_modelo if candidatos_vet_modelo else [nome for nome in todas_pessoas_nomes if pessoas_e_grupos.get(nome) == GRUPO_VETERANO]
-                mirins_aptos = candidatos_mir_modelo if candidatos_mir_modelo else [nome for nome in todas_pessoas_nomes if pessoas_e_grupos.get(nome) == GRUPO_MIRINS]
-                
-                # Para funções especiais:
-                # - Se houver candidatos no template, usar apenas esses candidatos
-                # - Se não houver candidatos no template, usar apenas pessoas que tenham a função cadastrada no campo 'funcoes'
-                # - NUNCA usar todas as pessoas como fallback
-                
-                # Filtrar pessoas que têm a função específica cadastrada
-                pessoas_com_turibulo = [nome for nome in todas_pessoas_nomes if 'turibulo' in pessoas_e_funcoes.get(nome, set())]
-                pessoas_com_naveta = [nome for nome in todas_pessoas_nomes if 'naveta' in pessoas_e_funcoes.get(nome, set())]
-                pessoas_com_tochas = [nome for nome in todas_pessoas_nomes if 'tochas' in pessoas_e_funcoes.get(nome, set())]
-                
-                # Usar candidatos do template se existirem, senão usar apenas pessoas com a função cadastrada
-                turibulo_aptos = candidatos_turib_modelo if candidatos_turib_modelo else pessoas_com_turibulo
-                naveta_aptos = candidatos_nav_modelo if candidatos_nav_modelo else pessoas_com_naveta
-                tochas_aptos = candidatos_tochas_modelo if candidatos_tochas_modelo else pessoas_com_tochas
-                
-                # Garantir que apenas pessoas que existem no banco sejam consideradas
-                cerimoniarios_aptos = [nome for nome in cerimoniarios_aptos if nome in pessoas_e_grupos]
-                veteranos_aptos = [nome for nome in veteranos_aptos if nome in pessoas_e_grupos]
-                mirins_aptos = [nome for nome in mirins_aptos if nome in pessoas_e_grupos]
-                turibulo_aptos = [nome for nome in turibulo_aptos if nome in pessoas_e_grupos]
-                naveta_aptos = [nome for nome in naveta_aptos if nome in pessoas_e_grupos]
-                tochas_aptos = [nome for nome in tochas_aptos if nome in pessoas_e_grupos]
-                
-                # Para domingos, garantir que ninguém serve na manhã E à noite
-                # Se for domingo, usar escalados_domingo além de escalados_no_dia_inteiro
-                conjunto_restricao = escalados_no_dia_inteiro.copy()
-                if is_domingo:
-                    conjunto_restricao.update(escalados_domingo)
-                
-                # ESTRATÉGIA: Sempre priorizar pessoas com menos de 2 serviços
-                # Se houver pessoas com menos de 2 serviços disponíveis, tentar usá-las primeiro
-                cerimoniarios = sortear_pessoas(cerimoniarios_aptos, regras_qtd['cerimoniarios'], conjunto_restricao)
-                veteranos = sortear_pessoas(veteranos_aptos, regras_qtd['veteranos'], conjunto_restricao)
-                mirins = sortear_pessoas(mirins_aptos, regras_qtd['mirins'], conjunto_restricao)
-                turibulo = sortear_pessoas(turibulo_aptos, regras_qtd['turibulo'], conjunto_restricao)
-                naveta = sortear_pessoas(naveta_aptos, regras_qtd['naveta'], conjunto_restricao)
-                tochas = sortear_pessoas(tochas_aptos, regras_qtd['tochas'], conjunto_restricao)
-                
-                # Adicionar todos os escalados ao conjunto do dia
-                todos_escalados_esta_missa = set(cerimoniarios + veteranos + mirins + turibulo + naveta + tochas)
-                escalados_no_dia_inteiro.update(todos_escalados_esta_missa)
-                
-                # Se for domingo, adicionar também ao conjunto de domingo para prevenir repetição entre manhã/noite
-                if is_domingo:
-                    escalados_domingo.update(todos_escalados_esta_missa)
-                db.execute('''INSERT INTO escalas (data, tipo_escala, bata_cor, cerimoniarios, veteranos, mirins, turibulo, naveta, tochas)
-                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                              (data_atual.strftime('%d/%m/%Y'), tipo_escala, 'Branca', juntar_nomes(cerimoniarios), juntar_nomes(veteranos), juntar_nomes(mirins), juntar_nomes(turibulo), juntar_nomes(naveta), juntar_nomes(tochas)))
-                escalas_geradas += 1
-
-            data_atual += timedelta(days=1)
+                    alvo = dia_inicio <= int(escala['data'][:2]) <= dia_fim
+                if not alvo:
+                    escalas_mantidas.append(escala)
+                    continue
+                ids_refazer.append(escala['id'])
+                refazer['por_data'].setdefault(escala['data'], []).append(escala['tipo_escala'])
+                refazer['cores'].append([escala['data'], escala['tipo_escala'], escala['bata_cor']])
+
+            if ids_alvo and not ids_refazer:
+                raise ValueError(f"Nenhuma das escalas selecionadas pertence a {mes}/{ano}.")
+            for escala_id in ids_refazer:
+                busca.remover_escala_do_indice(db, escala_id)
+            if ids_refazer:
+                marcadores = ', '.join('?' for _ in ids_refazer)
+                db.execute(f"DELETE FROM escalas WHERE id IN ({marcadores})", ids_refazer)
+        else:
+            busca.remover_mes_do_indice(db, mes, ano)
+            db.execute(f"DELETE FROM escalas {date_filter}", date_params)
+
+        # Sorteio determinístico a partir do instantâneo das entradas; fica a melhor de N candidatas
+        entradas = gerador.montar_entradas(db, mes, ano, escalas_mantidas, refazer)
+        execucao = geracoes.melhor_de(entradas, candidatos, semente)
+        resultado = execucao.resultado
+        contagem_servicos = resultado['contagem']
+
+        for nova_escala in resultado['escalas']:
+            escala_id = inserir_retornando_id(db, '''INSERT INTO escalas (data, tipo_escala, bata_cor, cerimoniarios, veteranos, mirins, turibulo, naveta, tochas)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (nova_escala['data'], nova_escala['tipo_escala'], nova_escala['bata_cor'], nova_escala['cerimoniarios'], nova_escala['veteranos'], nova_escala['mirins'], nova_escala['turibulo'], nova_escala['naveta'], nova_escala['tochas']))
+            busca.indexar_escala(db, escala_id, nova_escala['data'], nova_escala)
+        escalas_geradas = len(resultado['escalas'])
         
-        print(f"Total de escalas geradas: {escalas_geradas}")
+        rollups.atualizar_mes(db, mes, ano)
+        visao_mes.atualizar_mes(db, mes, ano)
+        geracao_id = geracoes.salvar(db, execucao)
+        alteracoes.registrar(db, 'mes', 'gerar', None, ano, mes,
+                             antes={'escalas_removidas': len(ids_refazer) if incremental else None,
+                                    'escalas_mantidas': len(escalas_mantidas)},
+                             depois={'geracao_id': geracao_id, 'semente': execucao.semente,
+                                     'escalas': len(resultado['escalas']), 'refazer': refazer and {
+                                         'dia_inicio': refazer['dia_inicio'], 'dia_fim': refazer['dia_fim'],
+                                         'escala_ids': refazer['escala_ids']}},
+                             autor=autor_da_requisicao())
+        print(f"Total de escalas geradas: {escalas_geradas} (geração #{geracao_id}, semente {execucao.semente}, "
+              f"melhor de {len(execucao.candidatas)} em {execucao.duracao_total_ms:.1f} ms, pontuação {execucao.pontuacao})")
 
 
         print("\n" + "="*50)
@@ -613,9 +426,17 @@ def gerar_escala_para_mes(mes, ano):
         print("="*50 + "\n")
         # --- FIM DO RELATÓRIO ---
 
-        db.commit()
+        notificacoes.confirmar(db, *caches.escopos_do_mes(ano, mes))
         db.close()
-        flash(f'Escalas geradas com sucesso para {mes}/{ano} com as novas regras de grupo!', 'success')
+        if incremental:
+            flash(f'{escalas_geradas} escala(s) refeita(s) em {mes}/{ano}; as outras {len(escalas_mantidas)} foram mantidas (semente {execucao.semente}).', 'success')
+        else:
+            flash(f'Escalas geradas com sucesso para {mes}/{ano} com as novas regras de grupo! (semente {execucao.semente})', 'success')
+        p = execucao.pontuacao
+        flash(f"Melhor de {len(execucao.candidatas)} sorteio(s), pontuação {p['total']} (menor é melhor): "
+              f"{p['abaixo_de_2']} pessoa(s) com menos de 2 serviços, {p['vagas_vazias']} vaga(s) vazia(s), "
+              f"{p['domingo_duplo']} dupla(s) no mesmo domingo, {p['repeticoes']} repetição(ões) da mesma pessoa no mesmo tipo de missa.", 'info')
+        return execucao.pontuacao
     except Exception as e:
         if db:
             try:
@@ -638,162 +459,134 @@ def get_escala_por_id(escala_id):
     finally:
         conn.close()
 
-def atualizar_escala(escala_id, dados):
+CAMPOS_NOMES_ESCALA = busca.FUNCOES_ESCALA
+ROTULOS_ESCALA = {'bata_cor': 'Cor da bata', 'cerimoniarios': 'Cerimoniários', 'veteranos': 'Veteranos',
+                  'mirins': 'Mirins', 'turibulo': 'Turíbulo', 'naveta': 'Naveta', 'tochas': 'Tochas'}
+
+def atualizar_escala(escala_id, dados, versao=None):
+    """
+    Grava a edição se a escala ainda estiver na `versao` que o formulário leu.
+    Retorna (data, None) se gravou (ou se não havia o que mudar), (None, escala_atual)
+    se outra pessoa salvou antes (nada é gravado) e (None, None) se a escala não
+    existe mais ou deu erro.
+    """
     conn = get_db()
     try:
-        conn.execute( '''UPDATE escalas SET bata_cor=?, cerimoniarios=?, veteranos=?, mirins=?, turibulo=?, naveta=?, tochas=? WHERE id=?''', (dados['bata_cor'], dados['cerimoniarios'], dados['veteranos'], dados['mirins'], dados['turibulo'], dados['naveta'], dados['tochas'], escala_id) )
-        conn.commit(); flash('Escala atualizada com sucesso!', 'success')
-    except Exception as e: flash(f'Erro ao atualizar a escala: {e}', 'error')
+        antes = conn.execute('SELECT * FROM escalas WHERE id = ?', (escala_id,)).fetchone()
+        if (antes is not None and versao in (None, antes['versao'])
+                and all((antes[campo] or '') == (valor or '') for campo, valor in dados.items())):
+            # Salvo sem mudanças: sem UPDATE, registro ou invalidação (a versão e o ETag do mês não mudam)
+            conn.rollback()
+            flash('Nenhuma alteração na escala.', 'info')
+            return antes['data'], None
+        if not concorrencia.atualizar_com_versao(conn, 'escalas', escala_id, versao, dados):
+            conn.rollback()
+            if antes is None:
+                flash('Escala não encontrada: ela foi removida ou o mês foi gerado de novo.', 'error')
+            return None, antes
+        escala = conn.execute('SELECT * FROM escalas WHERE id = ?', (escala_id,)).fetchone()
+        alteracoes.registrar_escala(conn, 'atualizar', escala_id, escala['data'], antes, escala, autor=autor_da_requisicao())
+        busca.indexar_escala(conn, escala_id, escala['data'], dados)
+        rollups.atualizar_mes_da_data(conn, escala['data'])
+        visao_mes.atualizar_mes_da_data(conn, escala['data'])
+        notificacoes.confirmar(conn, *caches.escopos_da_data(escala['data']))
+        flash('Escala atualizada com sucesso!', 'success')
+        return escala['data'], None
+    except Exception as e:
+        conn.rollback()
+        flash(f'Erro ao atualizar a escala: {e}', 'error')
+        return None, None
     finally: conn.close()
 
-
 ###############################################################
 ## ROTA PRINCIPAL (INDEX)
 ###############################################################
+@app.before_request
+def sincronizar_caches():
+    """Aplica invalidações de cache feitas por outras instâncias"""
+    caches.lendo_da_replica(False)
+    notificacoes.sincronizar()
+
+@app.after_request
+def registrar_escrita(resposta):
+    """Marca a sessão após um POST bem-sucedido (leitura da própria escrita, ver get_db_leitura)"""
+    if USA_REPLICA and request.method == 'POST' and resposta.status_code < 400:
+        session['ultima_escrita'] = time.time()
+    return resposta
+
 @app.route('/favicon.ico')
 def favicon():
     """Evita erro 404 no log para favicon"""
     return '', 204
 
-@app.route('/')
-def index():
+def renderizar_mes(is_view_only):
+    """
+    Página do mês (admin e pública). Os registros já vêm prontos da visão
+    pré-processada do mês; o filtro por nome só seleciona quais exibir.
+    """
     hoje = datetime.today()
     mes = int(request.args.get('mes', hoje.month))
     ano = int(request.args.get('ano', hoje.year))
     filtro_nome = request.args.get('filtro_nome', None)
 
-    conn = get_db()
-    todas_as_pessoas = conn.execute("SELECT nome FROM pessoas ORDER BY nome").fetchall()
-    date_filter, date_params = build_date_filter_query(mes, ano)
-    query = f"SELECT * FROM escalas {date_filter}"
-    params = list(date_params)
-
-    if filtro_nome:
-        # Busca parcial e case-insensitive: converte tudo para minúsculas antes de comparar
-        filtro_nome_lower = filtro_nome.lower()
-        query += " AND (LOWER(cerimoniarios) LIKE ? OR LOWER(veteranos) LIKE ? OR LOWER(mirins) LIKE ? OR LOWER(turibulo) LIKE ? OR LOWER(naveta) LIKE ? OR LOWER(tochas) LIKE ?)"
-        for _ in range(6):
-            params.append(f'%{filtro_nome_lower}%')
-
-    query += " ORDER BY data, tipo_escala"
-    escalas = conn.execute(query, params).fetchall()
-    conn.close()
-
-    # Buscar horários dos dias_missa
-    conn = get_db()
-    dias_missa_horarios = {}
+    conn = get_db_leitura()
     try:
-        dias_missa_rows = conn.execute('SELECT tipo_escala, horario FROM dias_missa WHERE ativo = 1').fetchall()
-        for row in dias_missa_rows:
-            dias_missa_horarios[row['tipo_escala']] = row['horario'] or ''
-    except Exception as e:
-        print(f"Erro ao buscar horários dos dias_missa: {e}")
+        # ETag a partir do registro de alterações: se nada que aparece na página mudou
+        # (em qualquer instância), responde 304 sem montar nem renderizar o mês
+        etag = hashlib.sha1(repr((ASSINATURA_PAGINAS, is_view_only, mes, ano, filtro_nome, hoje.date(),
+                                  alteracoes.versao_do_mes(conn, ano, mes))).encode()).hexdigest()
+        if '_flashes' not in session and request.if_none_match.contains(etag):
+            resposta = make_response('', 304)
+            resposta.set_etag(etag)
+            return resposta
+
+        # Versão lida antes da visão: um fragmento nunca fica guardado com uma versão mais nova que seus dados
+        chave_fragmentos = (ano, mes, is_view_only) + visao_mes.versao_do_mes(mes, ano)
+        visao = visao_mes.obter_mes(conn, mes, ano)
+        escalas_processadas = visao['escalas']
+        calendar_events = visao['eventos']
+
+        if filtro_nome:
+            # Página filtrada: os fragmentos dependem do filtro e não são guardados
+            chave_fragmentos = None
+            # Busca parcial, sem diferenciar acentos/maiúsculas, pelo índice escala_membros
+            date_filter, date_params = build_date_filter_query(mes, ano)
+            filtro_sql, filtro_params = busca.filtro_escalas_por_nome(conn, filtro_nome, mes, ano)
+            ids = {row['id'] for row in conn.execute(
+                f"SELECT id FROM escalas {date_filter}{filtro_sql}", list(date_params) + list(filtro_params)
+            ).fetchall()}
+            escalas_processadas = [e for e in escalas_processadas if e['id'] in ids]
+            calendar_events = [e for e in calendar_events if e['id'] in ids]
     finally:
         conn.close()
 
-    # Processar escalas para adicionar informações extras
-    escalas_processadas = []
-    calendar_events = []
-    
-    for escala in escalas:
-        try:
-            # Converter Row para dict se necessário
-            escala_dict = dict(escala) if hasattr(escala, 'keys') else escala
-            
-            data_obj = datetime.strptime(escala_dict['data'], '%d/%m/%Y')
-            data_correta_calendario = data_obj.strftime('%Y-%m-%d')
-            
-            # Formatar data para exibição
-            dias_semana = ['Segunda-Feira', 'Terça-Feira', 'Quarta-Feira', 'Quinta-Feira', 'Sexta-Feira', 'Sábado', 'Domingo']
-            meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
-                          'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-            dia_semana_nome = dias_semana[data_obj.weekday()]
-            mes_nome = meses_nomes[data_obj.month - 1]
-            data_formatada = f"{dia_semana_nome}, {data_obj.day} De {mes_nome} De {data_obj.year}"
-            
-            # Obter horário (obrigatório - deve estar configurado em dias_missa)
-            horario = dias_missa_horarios.get(escala_dict.get('tipo_escala', ''), '') or ''
-            
-            # Contar membros
-            def contar_membros(campo):
-                if not campo:
-                    return 0
-                return len([n for n in campo.split(', ') if n.strip()])
-            
-            total_membros = (contar_membros(escala_dict.get('cerimoniarios')) + 
-                           contar_membros(escala_dict.get('veteranos')) + 
-                           contar_membros(escala_dict.get('mirins')) + 
-                           contar_membros(escala_dict.get('turibulo')) + 
-                           contar_membros(escala_dict.get('naveta')) + 
-                           contar_membros(escala_dict.get('tochas')))
-            
-            # Mapear cor da bata
-            bata_cor = escala_dict.get('bata_cor') or 'Bata Branca'
-            cor_class = 'branco'
-            if 'Vermelha' in bata_cor or 'vermelha' in bata_cor or 'Vermelho' in bata_cor:
-                cor_class = 'vermelho'
-                bata_cor = 'Bata Vermelha'
-            else:
-                cor_class = 'branco'
-                bata_cor = 'Bata Branca'
-            
-            # Adicionar informações extras à escala
-            escala_dict['data_formatada'] = data_formatada
-            escala_dict['horario'] = horario
-            escala_dict['bata_cor_class'] = cor_class
-            escala_dict['bata_cor'] = bata_cor
-            escalas_processadas.append(escala_dict)
-            
-            # Preparar evento do calendário
-            desc = ""
-            if escala_dict.get('bata_cor'):
-                desc += f"<b>Cor da Túnica:</b> {bata_cor}<br><br>"
-            desc += f"<b>Cerimoniários:</b> {escala_dict.get('cerimoniarios') or ''}<br><b>Veteranos:</b> {escala_dict.get('veteranos') or ''}<br><b>Mirins:</b> {escala_dict.get('mirins') or ''}"
-            if escala_dict.get('turibulo'): desc += f"<br><b>Turíbulo:</b> {escala_dict['turibulo']}"
-            if escala_dict.get('naveta'): desc += f"<br><b>Naveta:</b> {escala_dict['naveta']}"
-            if escala_dict.get('tochas'): desc += f"<br><b>Tochas:</b> {escala_dict['tochas']}"
-            
-            # Preparar membros estruturados por categoria (usando função auxiliar)
-            members_structured = {
-                'cerimoniarios': parsear_nomes(escala_dict.get('cerimoniarios')),
-                'veteranos': parsear_nomes(escala_dict.get('veteranos')),
-                'mirins': parsear_nomes(escala_dict.get('mirins')),
-                'turibulo': parsear_nomes(escala_dict.get('turibulo')),
-                'naveta': parsear_nomes(escala_dict.get('naveta')),
-                'tochas': parsear_nomes(escala_dict.get('tochas'))
-            }
-            
-            calendar_events.append({
-                'id': escala_dict['id'],
-                'title': escala_dict.get('tipo_escala', ''),
-                'start': data_correta_calendario,
-                'extendedProps': { 
-                    'description': desc,
-                    'bataCor': bata_cor,
-                    'corClass': cor_class,
-                    'horario': horario,
-                    'memberCount': total_membros,
-                    'members': members_structured
-                },
-                'classNames': [cor_class]
-            })
-        except (ValueError, TypeError) as e:
-            continue
-
     # Nome do mês
-    meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
-                   'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    mes_nome = meses_nomes[mes - 1]
+    mes_nome = visao_mes.MESES[mes - 1]
+
+    # Lista de escalas e eventos do calendário: renderizados uma vez por versão do mês
+    escalas_html = fragmentos.renderizar('_escalas_mes.html', chave_fragmentos,
+                                         escalas=escalas_processadas, mes=mes, ano=ano, is_view_only=is_view_only)
+    eventos_json = fragmentos.json_seguro(chave_fragmentos, calendar_events)
 
-    return render_template('index.html',
+    resposta = make_response(render_template('index.html',
                            escalas=escalas_processadas,
+                           escalas_html=escalas_html,
                            mes=mes,
                            ano=ano,
                            mes_nome=mes_nome,
-                           todas_as_pessoas=todas_as_pessoas,
                            filtro_nome_ativo=filtro_nome,
-                           calendar_events=calendar_events,
-                           is_view_only=False)
+                           eventos_json=eventos_json,
+                           is_view_only=is_view_only,
+                           candidatos_padrao=geracoes.CANDIDATOS_POR_GERACAO))
+    resposta.set_etag(etag)
+    # O navegador guarda a página, mas confirma a cada acesso (barato: só o ETag é recalculado)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+
+@app.route('/')
+def index():
+    return renderizar_mes(is_view_only=False)
 
 
 @app.route('/visualizar')
@@ -801,138 +594,99 @@ def visualizar_escala():
     """
     Nova rota para a visualização pública da escala, sem painéis de admin.
     """
-    hoje = datetime.today()
-    mes = int(request.args.get('mes', hoje.month))
-    ano = int(request.args.get('ano', hoje.year))
-    filtro_nome = request.args.get('filtro_nome', None)
-
-    conn = get_db()
-    todas_as_pessoas = conn.execute("SELECT nome FROM pessoas ORDER BY nome").fetchall()
-
-    date_filter, date_params = build_date_filter_query(mes, ano)
-    query = f"SELECT * FROM escalas {date_filter}"
-    params = list(date_params)
-    if filtro_nome:
-        # Busca parcial e case-insensitive: converte tudo para minúsculas antes de comparar
-        filtro_nome_lower = filtro_nome.lower()
-        query += " AND (LOWER(cerimoniarios) LIKE ? OR LOWER(veteranos) LIKE ? OR LOWER(mirins) LIKE ? OR LOWER(turibulo) LIKE ? OR LOWER(naveta) LIKE ? OR LOWER(tochas) LIKE ?)"
-        for _ in range(6):
-            params.append(f'%{filtro_nome_lower}%')
-    query += " ORDER BY data, tipo_escala"
-
-    escalas = conn.execute(query, params).fetchall()
-    conn.close()
-
-    # Buscar horários dos dias_missa
-    conn = get_db()
-    dias_missa_horarios = {}
+    return renderizar_mes(is_view_only=True)
+
+@app.route('/api/pessoas/autocompletar')
+def autocompletar_pessoas_api():
+    """Sugestões de nomes para o campo de busca (sem acentos, tolerante a erros de digitação)"""
+    termo = request.args.get('q', '').strip()
+    if not termo:
+        return jsonify([])
+    conn = get_db_leitura()
     try:
-        dias_missa_rows = conn.execute('SELECT tipo_escala, horario FROM dias_missa WHERE ativo = 1').fetchall()
-        for row in dias_missa_rows:
-            dias_missa_horarios[row['tipo_escala']] = row['horario'] or ''
-    except Exception as e:
-        print(f"Erro ao buscar horários dos dias_missa: {e}")
+        return jsonify(busca.autocompletar_pessoas(conn, termo))
     finally:
         conn.close()
 
-    # Processar escalas para adicionar informações extras
-    escalas_processadas = []
-    calendar_events = []
-    
-    for escala in escalas:
-        try:
-            # Converter Row para dict se necessário
-            escala_dict = dict(escala) if hasattr(escala, 'keys') else escala
-            
-            data_obj = datetime.strptime(escala_dict['data'], '%d/%m/%Y')
-            data_correta_calendario = data_obj.strftime('%Y-%m-%d')
-            
-            # Formatar data para exibição
-            dias_semana = ['Segunda-Feira', 'Terça-Feira', 'Quarta-Feira', 'Quinta-Feira', 'Sexta-Feira', 'Sábado', 'Domingo']
-            meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
-                          'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-            dia_semana_nome = dias_semana[data_obj.weekday()]
-            mes_nome = meses_nomes[data_obj.month - 1]
-            data_formatada = f"{dia_semana_nome}, {data_obj.day} De {mes_nome} De {data_obj.year}"
-            
-            # Obter horário (obrigatório - deve estar configurado em dias_missa)
-            horario = dias_missa_horarios.get(escala_dict.get('tipo_escala', ''), '') or ''
-            
-            # Contar membros
-            def contar_membros(campo):
-                if not campo:
-                    return 0
-                return len([n for n in campo.split(', ') if n.strip()])
-            
-            total_membros = (contar_membros(escala_dict.get('cerimoniarios')) + 
-                           contar_membros(escala_dict.get('veteranos')) + 
-                           contar_membros(escala_dict.get('mirins')) + 
-                           contar_membros(escala_dict.get('turibulo')) + 
-                           contar_membros(escala_dict.get('naveta')) + 
-                           contar_membros(escala_dict.get('tochas')))
-            
-            # Mapear cor da bata
-            bata_cor = escala_dict.get('bata_cor') or 'Bata Branca'
-            cor_class = 'branco'
-            if 'Vermelha' in bata_cor or 'vermelha' in bata_cor or 'Vermelho' in bata_cor:
-                cor_class = 'vermelho'
-                bata_cor = 'Bata Vermelha'
-            else:
-                cor_class = 'branco'
-                bata_cor = 'Bata Branca'
-            
-            # Adicionar informações extras à escala
-            escala_dict['data_formatada'] = data_formatada
-            escala_dict['horario'] = horario
-            escala_dict['bata_cor_class'] = cor_class
-            escala_dict['bata_cor'] = bata_cor
-            escalas_processadas.append(escala_dict)
-            
-            # Preparar evento do calendário
-            desc = f"<b>Cor da Túnica:</b> {bata_cor}<br><br>"
-            desc += f"<b>Cerimoniários:</b> {escala_dict.get('cerimoniarios') or ''}<br><b>Veteranos:</b> {escala_dict.get('veteranos') or ''}<br><b>Mirins:</b> {escala_dict.get('mirins') or ''}"
-            if escala_dict.get('turibulo'): desc += f"<br><b>Turíbulo:</b> {escala_dict['turibulo']}"
-            if escala_dict.get('naveta'): desc += f"<br><b>Naveta:</b> {escala_dict['naveta']}"
-            if escala_dict.get('tochas'): desc += f"<br><b>Tochas:</b> {escala_dict['tochas']}"
-
-            # Preparar membros estruturados por categoria (usando função auxiliar)
-            members_structured = {
-                'cerimoniarios': parsear_nomes(escala_dict.get('cerimoniarios')),
-                'veteranos': parsear_nomes(escala_dict.get('veteranos')),
-                'mirins': parsear_nomes(escala_dict.get('mirins')),
-                'turibulo': parsear_nomes(escala_dict.get('turibulo')),
-                'naveta': parsear_nomes(escala_dict.get('naveta')),
-                'tochas': parsear_nomes(escala_dict.get('tochas'))
-            }
-
-            calendar_events.append({
-                'id': escala_dict['id'], 
-                'title': escala_dict.get('tipo_escala', ''), 
-                'start': data_correta_calendario,
-                'extendedProps': { 
-                    'description': desc,
-                    'bataCor': bata_cor,
-                    'corClass': cor_class,
-                    'horario': horario,
-                    'memberCount': total_membros,
-                    'members': members_structured
-                },
-                'classNames': [cor_class]
-            })
-        except (ValueError, TypeError) as e:
-            continue
+def obter_agenda_pessoa(pessoa_id):
+    """
+    Retorna (pessoa, itens) com as próximas missas da pessoa, usando o cache por
+    pessoa (invalidado pelas escritas em escalas e dias_missa). pessoa é None se
+    o id não existir.
+    """
+    hoje_iso = datetime.today().strftime('%Y-%m-%d')
+    chave = (pessoa_id, hoje_iso) + caches.versoes('escalas', 'dias_missa', 'pessoas')
 
-    # Nome do mês
-    meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
-                   'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    mes_nome = meses_nomes[mes - 1]
+    def calcular():
+        conn = get_db_leitura()
+        try:
+            pessoa = cadastro.obter_pessoas(conn).por_id.get(pessoa_id)
+            if pessoa is None:
+                return None, []
+            itens = agenda.buscar_proximas_escalas(conn, pessoa['nome'], hoje_iso)
+            dias_missa_horarios = {}
+            try:
+                dias_missa_horarios = cadastro.obter_dias_missa(conn).horarios
+            except Exception as e:
+                print(f"Erro ao buscar horários dos dias_missa: {e}")
+            for item in itens:
+                item['horario'] = obter_horario_por_tipo_escala(item['tipo_escala'], dias_missa_horarios)
+                item['data_formatada'] = formatar_data_pt_br(datetime.strptime(item['data'], '%d/%m/%Y'))
+                item['funcao_nome'] = agenda.NOMES_FUNCOES.get(item['funcao'], item['funcao'])
+            return dict(pessoa), itens
+        finally:
+            conn.close()
 
-    return render_template('index.html',
-                           escalas=escalas_processadas, mes=mes, ano=ano, mes_nome=mes_nome,
-                           todas_as_pessoas=todas_as_pessoas,
-                           filtro_nome_ativo=filtro_nome,
-                           calendar_events=calendar_events,
-                           is_view_only=True)
+    return caches.obter_ou_calcular(caches.agendas_pessoas, chave, calcular)
+
+def etag_da_agenda(pessoa, itens, *extras):
+    """ETag pelos dados da agenda (calculado antes de montar a resposta, para o 304 não custar nada)"""
+    return hashlib.sha1(repr((ASSINATURA_AGENDA, pessoa['id'], pessoa['nome'],
+                              [sorted(item.items()) for item in itens]) + extras).encode()).hexdigest()
+
+def resposta_nao_modificada(etag):
+    """304 se o cliente já tem a versão `etag`, senão None"""
+    if request.if_none_match.contains(etag):
+        resposta = make_response('', 304)
+        resposta.set_etag(etag)
+        return resposta
+    return None
+
+@app.route('/pessoa/<int:pessoa_id>/escalas')
+def escalas_pessoa_web(pessoa_id):
+    """Próximas missas de uma pessoa, com link para assinar o calendário"""
+    pessoa, itens = obter_agenda_pessoa(pessoa_id)
+    if pessoa is None:
+        flash('Pessoa não encontrada.', 'error')
+        return redirect(url_for('visualizar_escala'))
+    hoje = datetime.today()
+    # no-cache: o navegador sempre revalida, então uma edição ou desativação aparece na hora
+    etag = etag_da_agenda(pessoa, itens, request.host_url, hoje.month, hoje.year)
+    resposta = resposta_nao_modificada(etag)
+    if resposta is not None:
+        return resposta
+    resposta = make_response(render_template('pessoa_escalas.html', pessoa=pessoa, itens=itens, mes=hoje.month, ano=hoje.year))
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.set_etag(etag)
+    return resposta
+
+@app.route('/pessoa/<int:pessoa_id>.ics')
+def calendario_pessoa_ics(pessoa_id):
+    """Feed iCalendar da pessoa: assinado uma vez no celular, atualizado automaticamente"""
+    pessoa, itens = obter_agenda_pessoa(pessoa_id)
+    if pessoa is None:
+        return 'Pessoa não encontrada', 404
+    # ETag pelos dados da agenda: o DTSTAMP (hora da geração) muda a cada resposta
+    etag = etag_da_agenda(pessoa, itens)
+    resposta = resposta_nao_modificada(etag)
+    if resposta is not None:
+        return resposta
+    resposta = make_response(agenda.gerar_ics(pessoa['nome'], itens))
+    resposta.headers['Content-Type'] = 'text/calendar; charset=utf-8'
+    resposta.headers['Content-Disposition'] = f'inline; filename="escalas_{pessoa_id}.ics"'
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.set_etag(etag)
+    return resposta
 
 ###############################################################
 ## ROTAS DE AÇÃO E GERENCIAMENTO
@@ -952,10 +706,27 @@ def gerar_escala_web():
             flash(f'Erro: Ano inválido ({ano}). Deve ser entre 2020 e 2050.', 'error')
             return redirect(url_for('index', mes=mes, ano=datetime.today().year))
         
+        # Modo incremental (opcional): só um intervalo de dias ou só as escalas marcadas
+        dia_inicio = int(request.form['dia_inicio']) if request.form.get('dia_inicio') else None
+        dia_fim = int(request.form['dia_fim']) if request.form.get('dia_fim') else None
+        escala_ids = [int(i) for i in request.form.getlist('escala_ids') if i]
+        # Semente opcional: repete o sorteio de uma geração anterior (com os mesmos dados)
+        semente = int(request.form['semente']) if request.form.get('semente', '').strip() else None
+        candidatos = int(request.form['candidatos']) if request.form.get('candidatos', '').strip() else None
+        
         print(f"Iniciando geração de escala para {mes}/{ano}...")
         try:
-            gerar_escala_para_mes(mes, ano)
-            print(f"Escala gerada com sucesso para {mes}/{ano}")
+            # Cliques duplos e pedidos simultâneos do mesmo mês esperam e compartilham uma geração
+            parametros = (dia_inicio, dia_fim, tuple(escala_ids), semente, candidatos)
+            pontuacao, compartilhado = geracoes.voo_unico(
+                ano, mes, parametros,
+                lambda: gerar_escala_para_mes(mes, ano, dia_inicio=dia_inicio, dia_fim=dia_fim, escala_ids=escala_ids,
+                                              semente=semente, candidatos=candidatos)
+            )
+            if compartilhado:
+                flash(f'A escala de {mes}/{ano} já estava sendo gerada por outro pedido; o resultado dela foi '
+                      f'aproveitado (pontuação {pontuacao["total"]}).', 'info')
+            print(f"Escala gerada com sucesso para {mes}/{ano}" + (" (resultado compartilhado)" if compartilhado else ""))
             return redirect(url_for('index', mes=mes, ano=ano))
         except Exception as e:
             # Re-raise para ser capturado pelo except externo
@@ -973,23 +744,116 @@ def gerar_escala_web():
         print(f"Traceback completo:\n{traceback.format_exc()}")
         return redirect(url_for('index', mes=mes if 1 <= mes <= 12 else datetime.today().month, ano=ano))
 
+@app.route('/alteracoes')
+def alteracoes_web():
+    """Histórico de alterações do mês (com mes e ano) ou de todos os meses"""
+    mes = request.args.get('mes', type=int)
+    ano = request.args.get('ano', type=int)
+    conn = get_db_leitura()
+    try:
+        registros = alteracoes.listar(conn, ano, mes)
+    finally:
+        conn.close()
+    return render_template('alteracoes.html', alteracoes=registros, mes=mes, ano=ano,
+                           mes_nome=visao_mes.MESES[mes - 1] if mes and 1 <= mes <= 12 else None)
+
+@app.route('/geracoes')
+def geracoes_web():
+    conn = get_db()
+    try:
+        return render_template('geracoes.html', geracoes=geracoes.listar(conn), versao_atual=gerador.VERSAO_GERADOR)
+    finally:
+        conn.close()
+
+@app.route('/geracoes/<int:geracao_id>/reproduzir', methods=['POST'])
+def reproduzir_geracao_web(geracao_id):
+    """Roda o gerador atual sobre as entradas gravadas e compara com o resultado original"""
+    conn = get_db()
+    try:
+        comparacao = geracoes.reproduzir(conn, geracao_id)
+    except Exception as e:
+        flash(f'Erro ao reproduzir a geração #{geracao_id}: {str(e)}', 'error')
+        return redirect(url_for('geracoes_web'))
+    finally:
+        conn.close()
+    if comparacao is None:
+        flash('Geração não encontrada.', 'error')
+    elif comparacao['identico']:
+        flash(f"Geração #{geracao_id} reproduzida: resultado idêntico "
+              f"({comparacao['duracao_ms']:.1f} ms agora, {comparacao['duracao_original_ms']:.1f} ms na original).", 'success')
+    else:
+        flash(f"Geração #{geracao_id} reproduzida com a versão {comparacao['versao_atual']} do gerador "
+              f"(original: {comparacao['versao_original']}): {comparacao['escalas_diferentes']} escala(s) diferente(s); "
+              f"meta de 2+ serviços {comparacao['resumo_atual']['percentual_meta']:.1f}% "
+              f"(original {comparacao['resumo_original']['percentual_meta']:.1f}%), "
+              f"{comparacao['duracao_ms']:.1f} ms (original {comparacao['duracao_original_ms']:.1f} ms).", 'warning')
+    return redirect(url_for('geracoes_web'))
+
 @app.route('/reiniciar_db', methods=['POST'])
 def reiniciar_db_web():
     limpar_db_e_reimportar()
     return redirect(url_for('index'))
 
+@app.route('/backup')
+def backup_web():
+    """Download do backup completo (NDJSON), gerado em fluxo"""
+    def gerar():
+        conn = get_db_leitura()
+        try:
+            yield from backup.exportar(conn)
+        finally:
+            conn.close()
+    nome = f"backup_escalas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={nome}'})
+
+@app.route('/restaurar', methods=['POST'])
+def restaurar_web():
+    """Substitui os dados pelo backup enviado (campo 'arquivo'), em uma única transação"""
+    arquivo = request.files.get('arquivo')
+    if arquivo is None or not arquivo.filename:
+        flash('Escolha um arquivo de backup (.ndjson) para restaurar.', 'error')
+        return redirect(url_for('index'))
+
+    conn = get_db()
+    inicio = time.perf_counter()
+    try:
+        totais = backup.restaurar(conn, io.TextIOWrapper(arquivo.stream, encoding='utf-8'))
+        alteracoes.registrar(conn, 'banco', 'restaurar', depois={'arquivo': arquivo.filename, 'linhas': totais},
+                             autor=autor_da_requisicao())
+        notificacoes.confirmar(conn, caches.TODOS)
+        flash(f"Backup restaurado: {sum(totais.values())} registro(s) em {len(totais)} tabela(s) "
+              f"em {(time.perf_counter() - inicio) * 1000:.0f} ms.", 'success')
+    except ValueError as e:
+        flash(f'Erro no arquivo de backup: {str(e)}', 'error')
+    except Exception as e:
+        flash(f'Erro ao restaurar backup: {str(e)}', 'error')
+        print(f"ERRO ao restaurar backup: {e}")
+    finally:
+        conn.close()
+    return redirect(url_for('index'))
+
 @app.route('/gerenciar_pessoas')
 def gerenciar_pessoas_web():
+    todas_as_pessoas = cadastro.obter_pessoas().lista
     conn = get_db()
-    todas_as_pessoas = conn.execute("SELECT * FROM pessoas ORDER BY nome").fetchall()
-    conn.close()
+    try:
+        inativas = [dict(row) for row in conn.execute(
+            'SELECT id, nome, grupo, desativado_em FROM pessoas WHERE ativo = 0 ORDER BY nome'
+        ).fetchall()]
+    finally:
+        conn.close()
+    for pessoa in inativas:
+        if pessoa['desativado_em']:
+            pessoa['desativado_em'] = datetime.strptime(pessoa['desativado_em'], '%Y-%m-%d').strftime('%d/%m/%Y')
     mestres_de_cerimonia = [p for p in todas_as_pessoas if p['grupo'] == GRUPO_CERIMONIARIO]
     experientes = [p for p in todas_as_pessoas if p['grupo'] == GRUPO_VETERANO]
     mirins = [p for p in todas_as_pessoas if p['grupo'] == GRUPO_MIRINS]
     # Debug: verificar se está lendo corretamente
     print(f"[DEBUG] Total de pessoas lidas: {len(todas_as_pessoas)}")
     print(f"[DEBUG] Mestres: {len(mestres_de_cerimonia)}, Experientes: {len(experientes)}, Mirins: {len(mirins)}")
-    return render_template('gerenciar_pessoas.html', mestres_de_cerimonia=mestres_de_cerimonia, experientes=experientes, mirins=mirins)
+    return render_template('gerenciar_pessoas.html', mestres_de_cerimonia=mestres_de_cerimonia, experientes=experientes, mirins=mirins,
+                           inativas=inativas)
 
 @app.route('/adicionar_pessoa', methods=['POST'])
 def adicionar_pessoa_web():
@@ -999,8 +863,21 @@ def adicionar_pessoa_web():
     if nome and grupo:
         conn = get_db()
         try:
-            conn.execute('INSERT INTO pessoas (nome, grupo, funcoes) VALUES (?, ?, ?)', (nome, grupo, funcoes))
-            conn.commit()
+            inativa = conn.execute('SELECT id, nome, grupo, funcoes FROM pessoas WHERE nome = ? AND ativo = 0', (nome,)).fetchone()
+            if inativa is not None:
+                # Mesmo nome de uma pessoa desativada: ela volta ao cadastro com os dados novos
+                concorrencia.atualizar_com_versao(conn, 'pessoas', inativa['id'], None,
+                                                  {'grupo': grupo, 'funcoes': funcoes, 'ativo': 1, 'desativado_em': None})
+                alteracoes.registrar(conn, 'pessoa', 'reativar', inativa['id'], antes=inativa,
+                                     depois={'nome': nome, 'grupo': grupo, 'funcoes': funcoes}, autor=autor_da_requisicao())
+                notificacoes.confirmar(conn, 'pessoas')
+                flash(f'"{nome}" estava desativado(a) e foi reativado(a).', 'success')
+                return redirect(url_for('gerenciar_pessoas_web'))
+            pessoa_id = inserir_retornando_id(conn, 'INSERT INTO pessoas (nome, grupo, funcoes, nome_busca) VALUES (?, ?, ?, ?)',
+                                              (nome, grupo, funcoes, busca.normalizar_nome(nome)))
+            alteracoes.registrar(conn, 'pessoa', 'inserir', pessoa_id,
+                                 depois={'nome': nome, 'grupo': grupo, 'funcoes': funcoes}, autor=autor_da_requisicao())
+            notificacoes.confirmar(conn, 'pessoas')
             flash(f'"{nome}" adicionado(a) com sucesso!', 'success')
         except IntegrityError:
             flash(f'Erro: Já existe uma pessoa com o nome "{nome}".', 'error')
@@ -1012,11 +889,25 @@ def adicionar_pessoa_web():
 
 @app.route('/remover_pessoa/<int:pessoa_id>', methods=['POST'])
 def remover_pessoa_web(pessoa_id):
+    # A pessoa é desativada (não apagada) e sai das escalas a partir de hoje e dos modelos, tudo em uma transação
     conn = get_db()
     try:
-        conn.execute('DELETE FROM pessoas WHERE id = ?', (pessoa_id,))
-        conn.commit()
-        flash('Pessoa removida com sucesso!', 'success')
+        antes = conn.execute('SELECT id, nome, grupo, funcoes FROM pessoas WHERE id = ? AND ativo = 1', (pessoa_id,)).fetchone()
+        if antes is None:
+            flash('Pessoa não encontrada.', 'error')
+            return redirect(url_for('gerenciar_pessoas_web'))
+        resultado = desativacao.desativar(conn, [pessoa_id])
+        autor = autor_da_requisicao()
+        alteracoes.registrar(conn, 'pessoa', 'desativar', pessoa_id, antes=antes, depois=dict(antes, ativo=0), autor=autor)
+        for escala in resultado['escalas']:
+            alteracoes.registrar_escala(conn, 'atualizar', escala['id'], escala['data'],
+                                        escala['antes'], escala['depois'], autor=autor)
+        escopos = [escopo for ano, mes in resultado['meses'] for escopo in caches.escopos_do_mes(ano, mes)]
+        notificacoes.confirmar(conn, 'pessoas', 'modelos', *escopos)
+        print(f"Pessoa {antes['nome']} desativada: {len(resultado['escalas'])} escala(s) futura(s), "
+              f"{len(resultado['modelos'])} modelo(s)")
+        flash(f'"{antes["nome"]}" desativado(a): retirado(a) de {len(resultado["escalas"])} escala(s) a partir de hoje '
+              f'e de {len(resultado["modelos"])} modelo(s).', 'success')
     except Exception as e:
         conn.rollback()
         flash(f'Erro ao remover pessoa: {str(e)}', 'error')
@@ -1025,6 +916,29 @@ def remover_pessoa_web(pessoa_id):
         conn.close()
     return redirect(url_for('gerenciar_pessoas_web'))
 
+@app.route('/reativar_pessoa/<int:pessoa_id>', methods=['POST'])
+def reativar_pessoa_web(pessoa_id):
+    conn = get_db()
+    try:
+        antes = conn.execute('SELECT id, nome, grupo, funcoes, desativado_em FROM pessoas WHERE id = ?', (pessoa_id,)).fetchone()
+        if antes is None or not desativacao.reativar(conn, pessoa_id):
+            conn.rollback()
+            flash('Pessoa não encontrada ou já ativa.', 'error')
+            return redirect(url_for('gerenciar_pessoas_web'))
+        alteracoes.registrar(conn, 'pessoa', 'reativar', pessoa_id, antes=antes,
+                             depois=dict(antes, desativado_em=None), autor=autor_da_requisicao())
+        notificacoes.confirmar(conn, 'pessoas')
+        flash(f'"{antes["nome"]}" reativado(a). As escalas de que foi retirado(a) não são refeitas.', 'success')
+    except Exception as e:
+        conn.rollback()
+        flash(f'Erro ao reativar pessoa: {str(e)}', 'error')
+        print(f"ERRO ao reativar pessoa: {e}")
+    finally:
+        conn.close()
+    return redirect(url_for('gerenciar_pessoas_web'))
+
+ROTULOS_PESSOA = {'grupo': 'Grupo principal', 'funcoes': 'Funções adicionais'}
+
 @app.route('/editar_pessoa/<int:pessoa_id>', methods=['GET', 'POST'])
 def editar_pessoa_web(pessoa_id):
     conn = get_db()
@@ -1035,20 +949,99 @@ def editar_pessoa_web(pessoa_id):
             return redirect(url_for('gerenciar_pessoas_web'))
         
         if request.method == 'POST':
-            novo_grupo = request.form['grupo']
-            novas_funcoes = ','.join(request.form.getlist('funcoes'))
-            conn.execute('UPDATE pessoas SET grupo = ?, funcoes = ? WHERE id = ?', (novo_grupo, novas_funcoes, pessoa_id))
-            conn.commit()
+            dados = {'grupo': request.form['grupo'], 'funcoes': ','.join(request.form.getlist('funcoes'))}
+            versao = concorrencia.versao_do_formulario(request.form)
+            if not concorrencia.atualizar_com_versao(conn, 'pessoas', pessoa_id, versao, dados):
+                # Outra pessoa salvou antes: mostrar a edição mesclada para revisão
+                conn.rollback()
+                base = concorrencia.base_do_formulario(request.form, ROTULOS_PESSOA)
+                mesclado, conflito = concorrencia.montar_conflito(
+                    versao, base, dados, pessoa, ROTULOS_PESSOA,
+                    campos_lista=['funcoes'], campos_simples=['grupo']
+                )
+                mesclado['funcoes'] = ','.join(mesclado['funcoes'])
+                return render_template('editar_pessoa.html', pessoa=dict(pessoa, **mesclado),
+                                       base={campo: pessoa[campo] or '' for campo in ROTULOS_PESSOA}, conflito=conflito)
+            alteracoes.registrar(conn, 'pessoa', 'atualizar', pessoa_id,
+                                 antes={campo: pessoa[campo] for campo in ('nome', 'grupo', 'funcoes')},
+                                 depois=dict(dados, nome=pessoa['nome']), autor=autor_da_requisicao())
+            notificacoes.confirmar(conn, 'pessoas')
             flash(f'Dados de "{pessoa["nome"]}" atualizados com sucesso!', 'success')
             return redirect(url_for('gerenciar_pessoas_web'))
         
-        return render_template('editar_pessoa.html', pessoa=pessoa)
+        return render_template('editar_pessoa.html', pessoa=pessoa,
+                               base={campo: pessoa[campo] or '' for campo in ROTULOS_PESSOA})
     except Exception as e:
         flash(f'Erro ao processar: {str(e)}', 'error')
         return redirect(url_for('gerenciar_pessoas_web'))
     finally:
         conn.close()
 
+@app.route('/indisponibilidades')
+def gerenciar_indisponibilidades_web():
+    conn = get_db()
+    try:
+        # Ausências já encerradas não interessam mais à geração; mostrar só as atuais e futuras
+        registros = indisponibilidades.listar(conn, a_partir_de=datetime.today().strftime('%Y-%m-%d'))
+        pessoas = cadastro.obter_pessoas(conn).lista
+        return render_template('gerenciar_indisponibilidades.html', registros=registros, pessoas=pessoas,
+                               nomes_dias=indisponibilidades.DIAS_SEMANA)
+    except Exception as e:
+        flash(f'Erro ao carregar indisponibilidades: {str(e)}', 'error')
+        return redirect(url_for('gerenciar_pessoas_web'))
+    finally:
+        conn.close()
+
+@app.route('/adicionar_indisponibilidade', methods=['POST'])
+def adicionar_indisponibilidade_web():
+    try:
+        pessoa_id = int(request.form['pessoa_id'])
+        data_inicio, data_fim, dias_semana = indisponibilidades.validar(
+            request.form.get('data_inicio'), request.form.get('data_fim'), request.form.getlist('dias_semana')
+        )
+    except (ValueError, KeyError) as e:
+        flash(f'Erro ao processar dados: {str(e)}', 'error')
+        return redirect(url_for('gerenciar_indisponibilidades_web'))
+
+    conn = get_db()
+    try:
+        motivo = request.form.get('motivo', '').strip() or None
+        indisponibilidade_id = inserir_retornando_id(
+            conn, 'INSERT INTO indisponibilidades (pessoa_id, data_inicio, data_fim, dias_semana, motivo) VALUES (?, ?, ?, ?, ?)',
+            (pessoa_id, data_inicio, data_fim, dias_semana, motivo)
+        )
+        alteracoes.registrar(conn, 'indisponibilidade', 'inserir', indisponibilidade_id,
+                             depois={'pessoa_id': pessoa_id, 'data_inicio': data_inicio, 'data_fim': data_fim,
+                                     'dias_semana': dias_semana, 'motivo': motivo},
+                             autor=autor_da_requisicao())
+        conn.commit()
+        flash('Indisponibilidade cadastrada. Ela será respeitada nas próximas gerações de escala.', 'success')
+    except Exception as e:
+        conn.rollback()
+        flash(f'Erro ao cadastrar indisponibilidade: {str(e)}', 'error')
+        print(f"ERRO ao cadastrar indisponibilidade: {e}")
+    finally:
+        conn.close()
+    return redirect(url_for('gerenciar_indisponibilidades_web'))
+
+@app.route('/remover_indisponibilidade/<int:indisponibilidade_id>', methods=['POST'])
+def remover_indisponibilidade_web(indisponibilidade_id):
+    conn = get_db()
+    try:
+        antes = conn.execute('SELECT * FROM indisponibilidades WHERE id = ?', (indisponibilidade_id,)).fetchone()
+        conn.execute('DELETE FROM indisponibilidades WHERE id = ?', (indisponibilidade_id,))
+        if antes is not None:
+            alteracoes.registrar(conn, 'indisponibilidade', 'remover', indisponibilidade_id, antes=antes,
+                                 autor=autor_da_requisicao())
+        conn.commit()
+        flash('Indisponibilidade removida.', 'success')
+    except Exception as e:
+        conn.rollback()
+        flash(f'Erro ao remover indisponibilidade: {str(e)}', 'error')
+    finally:
+        conn.close()
+    return redirect(url_for('gerenciar_indisponibilidades_web'))
+
 # Em app.py, substitua a função inteira
 
 @app.route('/editar_escala/<int:escala_id>', methods=['GET', 'POST'])
@@ -1063,30 +1056,50 @@ def editar_escala_web(escala_id):
             'naveta': juntar_nomes(request.form.getlist('naveta')),
             'tochas': juntar_nomes(request.form.getlist('tochas'))
         }
-        atualizar_escala(escala_id, dados)
-        escala = get_escala_por_id(escala_id)
-        data_obj = datetime.strptime(escala['data'], '%d/%m/%Y')
+        versao = concorrencia.versao_do_formulario(request.form)
+        data, atual = atualizar_escala(escala_id, dados, versao)
+        if atual is not None:
+            # Outra pessoa salvou antes: mostrar a edição mesclada com o estado atual para revisão
+            base = concorrencia.base_do_formulario(request.form, ROTULOS_ESCALA)
+            mesclado, conflito = concorrencia.montar_conflito(
+                versao, base, dados, atual, ROTULOS_ESCALA,
+                campos_lista=CAMPOS_NOMES_ESCALA, campos_simples=['bata_cor']
+            )
+            return _renderizar_edicao_escala(atual, mesclado, conflito)
+        if not data:
+            return redirect(url_for('index'))
+        data_obj = datetime.strptime(data, '%d/%m/%Y')
         return redirect(url_for('index', mes=data_obj.month, ano=data_obj.year))
 
     escala = get_escala_por_id(escala_id)
     if not escala:
         flash('Escala não encontrada.', 'error')
         return redirect(url_for('index'))
+    return _renderizar_edicao_escala(escala)
 
+def _renderizar_edicao_escala(escala, valores=None, conflito=None):
+    """
+    Formulário de edição da escala. `valores` (campos a mostrar no lugar dos
+    salvos) e `conflito` vêm da mesclagem depois de um conflito de versão; a
+    versão e a base do formulário são sempre as da escala salva.
+    """
     escala_editavel = dict(escala)
-    for key in ['cerimoniarios', 'veteranos', 'mirins', 'turibulo', 'naveta', 'tochas']:
+    base = {campo: escala_editavel.get(campo) or '' for campo in ROTULOS_ESCALA}
+    escala_editavel.update(valores or {})
+    for key in CAMPOS_NOMES_ESCALA:
         if key in escala_editavel and escala_editavel[key]:
             # Usar função auxiliar para parsear nomes
-            escala_editavel[key] = parsear_nomes(escala_editavel[key])
+            if isinstance(escala_editavel[key], str):
+                escala_editavel[key] = parsear_nomes(escala_editavel[key])
         else:
             escala_editavel[key] = []
 
-    conn = get_db()
+    pessoas = cadastro.obter_pessoas()
 
     # 1. Pega a lista de todas as pessoas que PERTENCEM atualmente a cada grupo
-    todos_cerimoniarios_atuais = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_CERIMONIARIO,))]
-    todos_veteranos_atuais = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_VETERANO,))]
-    todas_mirins_atuais = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_MIRINS,))]
+    todos_cerimoniarios_atuais = pessoas.nomes_do_grupo(GRUPO_CERIMONIARIO)
+    todos_veteranos_atuais = pessoas.nomes_do_grupo(GRUPO_VETERANO)
+    todas_mirins_atuais = pessoas.nomes_do_grupo(GRUPO_MIRINS)
 
     # 2. Une a lista atual com a lista de quem JÁ ESTAVA selecionado na escala,
     opcoes_cerimoniarios = sorted(list(set(todos_cerimoniarios_atuais + escala_editavel['cerimoniarios'])))
@@ -1094,7 +1107,7 @@ def editar_escala_web(escala_id):
     opcoes_mirins = sorted(list(set(todas_mirins_atuais + escala_editavel['mirins'])))
 
     # Buscar TODAS as pessoas para disponibilizar em Turíbulo, Naveta e Tochas
-    todas_as_pessoas = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas ORDER BY nome").fetchall()]
+    todas_as_pessoas = pessoas.nomes
     
     # Incluir também os nomes já selecionados (caso não estejam mais no banco)
     candidatos_funcoes = sorted(list(set(
@@ -1104,18 +1117,12 @@ def editar_escala_web(escala_id):
         escala_editavel['tochas']
     )))
 
-    conn.close()
-
     # Buscar horário do dias_missa (usando função auxiliar)
-    conn = get_db()
     dias_missa_horarios = {}
     try:
-        dias_missa_rows = conn.execute('SELECT tipo_escala, horario FROM dias_missa WHERE ativo = 1').fetchall()
-        for row in dias_missa_rows:
-            dias_missa_horarios[row['tipo_escala']] = row['horario'] or ''
+        dias_missa_horarios = cadastro.obter_dias_missa().horarios
     except:
         pass
-    conn.close()
     
     horario = obter_horario_por_tipo_escala(escala['tipo_escala'], dias_missa_horarios)
     
@@ -1132,6 +1139,8 @@ def editar_escala_web(escala_id):
 
     return render_template('editar_escala.html',
                            escala=escala_editavel,
+                           base=base,
+                           conflito=conflito,
                            todos_cerimoniarios=opcoes_cerimoniarios,
                            todos_veteranos=opcoes_veteranos,
                            todas_mirins=opcoes_mirins,
@@ -1153,16 +1162,22 @@ def adicionar_escala_web(ano, mes, dia):
                 (data_para_db,)
             ).fetchall()
             
-            todos_cerimoniarios = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_CERIMONIARIO,)).fetchall()]
-            todos_veteranos = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_VETERANO,)).fetchall()]
-            todas_mirins = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_MIRINS,)).fetchall()]
-            # Buscar TODAS as pessoas para disponibilizar em Turíbulo, Naveta e Tochas
-            todas_as_pessoas = [p['nome'] for p in conn.execute("SELECT nome FROM pessoas ORDER BY nome").fetchall()]
-            candidatos_funcoes = sorted(todas_as_pessoas)
+            # Seleção de membros: renderizada uma vez por versão do cadastro de pessoas
+            chave_pessoas = caches.versoes('pessoas')
+            pessoas = cadastro.obter_pessoas(conn)
         finally:
             conn.close()
+        selecao_equipe_html = fragmentos.renderizar(
+            '_selecao_equipe.html', chave_pessoas,
+            todos_cerimoniarios=pessoas.nomes_do_grupo(GRUPO_CERIMONIARIO),
+            todos_veteranos=pessoas.nomes_do_grupo(GRUPO_VETERANO),
+            todas_mirins=pessoas.nomes_do_grupo(GRUPO_MIRINS),
+            # TODAS as pessoas para disponibilizar em Turíbulo, Naveta e Tochas
+            candidatos_funcoes=pessoas.nomes
+        )
         
-        return render_template('adicionar_escala.html', data_para_db=data_para_db, data_para_exibir=data_para_exibir, todos_cerimoniarios=todos_cerimoniarios, todos_veteranos=todos_veteranos, todas_mirins=todas_mirins, candidatos_funcoes=candidatos_funcoes, escalas_existentes=escalas_existentes)
+        return render_template('adicionar_escala.html', data_para_db=data_para_db, data_para_exibir=data_para_exibir,
+                               selecao_equipe_html=selecao_equipe_html, escalas_existentes=escalas_existentes)
     except (ValueError, TypeError) as e:
         flash(f'Erro ao processar data: {str(e)}', 'error')
         return redirect(url_for('index'))
@@ -1187,8 +1202,18 @@ def salvar_nova_escala_web():
         
         conn = get_db()
         try:
-            conn.execute('INSERT INTO escalas (data, tipo_escala, bata_cor, cerimoniarios, veteranos, mirins, turibulo, naveta, tochas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (data, tipo_escala, bata_cor, cerimoniarios, veteranos, mirins, turibulo, naveta, tochas))
-            conn.commit()
+            escala_id = inserir_retornando_id(conn, 'INSERT INTO escalas (data, tipo_escala, bata_cor, cerimoniarios, veteranos, mirins, turibulo, naveta, tochas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (data, tipo_escala, bata_cor, cerimoniarios, veteranos, mirins, turibulo, naveta, tochas))
+            busca.indexar_escala(conn, escala_id, data, {
+                'cerimoniarios': cerimoniarios, 'veteranos': veteranos, 'mirins': mirins,
+                'turibulo': turibulo, 'naveta': naveta, 'tochas': tochas
+            })
+            rollups.atualizar_mes_da_data(conn, data)
+            visao_mes.atualizar_mes_da_data(conn, data)
+            alteracoes.registrar_escala(conn, 'inserir', escala_id, data, depois={
+                'data': data, 'tipo_escala': tipo_escala, 'bata_cor': bata_cor, 'cerimoniarios': cerimoniarios,
+                'veteranos': veteranos, 'mirins': mirins, 'turibulo': turibulo, 'naveta': naveta, 'tochas': tochas
+            }, autor=autor_da_requisicao())
+            notificacoes.confirmar(conn, *caches.escopos_da_data(data))
             flash(f'Nova escala para {data} foi adicionada com sucesso!', 'success')
         except Exception as e:
             conn.rollback()
@@ -1210,14 +1235,55 @@ def salvar_nova_escala_web():
         flash(f'Erro ao processar formulário: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+@app.route('/api/escalas/lote', methods=['POST'])
+def editar_escalas_em_lote_api():
+    """
+    Aplica um lote de alterações (ver lote.py) em uma única transação e devolve
+    o diff. Com "simular": true, devolve o diff sem gravar.
+    """
+    dados = request.get_json(silent=True)
+    if not isinstance(dados, dict):
+        return jsonify({'erro': 'Envie um objeto JSON com inicio, fim e operacoes.'}), 400
+    simular = bool(dados.get('simular'))
+
+    conn = get_db()
+    try:
+        diff, meses = lote.aplicar(conn, dados)
+        if simular or not diff['escalas']:
+            conn.rollback()
+        else:
+            autor = autor_da_requisicao()
+            for escala in diff['escalas']:
+                campos = escala['alteracoes']
+                alteracoes.registrar_escala(conn, 'atualizar', escala['id'], escala['data'],
+                                            {campo: valor['antes'] for campo, valor in campos.items()},
+                                            {campo: valor['depois'] for campo, valor in campos.items()}, autor=autor)
+            escopos = [escopo for ano, mes in meses for escopo in caches.escopos_do_mes(ano, mes)]
+            notificacoes.confirmar(conn, *escopos)
+        diff['simulado'] = simular
+        return jsonify(diff)
+    except ValueError as e:
+        conn.rollback()
+        return jsonify({'erro': str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO na edição em lote: {e}")
+        return jsonify({'erro': f'Erro ao aplicar o lote: {e}'}), 500
+    finally:
+        conn.close()
+
 @app.route('/remover_escala/<int:escala_id>', methods=['POST'])
 def remover_escala_web(escala_id):
     conn = get_db()
     try:
-        escala = conn.execute('SELECT data FROM escalas WHERE id = ?', (escala_id,)).fetchone()
+        escala = conn.execute('SELECT * FROM escalas WHERE id = ?', (escala_id,)).fetchone()
         if escala:
+            busca.remover_escala_do_indice(conn, escala_id)
             conn.execute('DELETE FROM escalas WHERE id = ?', (escala_id,))
-            conn.commit()
+            alteracoes.registrar_escala(conn, 'remover', escala_id, escala['data'], antes=escala, autor=autor_da_requisicao())
+            rollups.atualizar_mes_da_data(conn, escala['data'])
+            visao_mes.atualizar_mes_da_data(conn, escala['data'])
+            notificacoes.confirmar(conn, *caches.escopos_da_data(escala['data']))
             flash('Escala removida com sucesso!', 'success')
             try:
                 data_obj = datetime.strptime(escala['data'], '%d/%m/%Y')
@@ -1237,19 +1303,14 @@ def remover_escala_web(escala_id):
 
 @app.route('/gerenciar_modelos')
 def gerenciar_modelos_web():
-    conn = get_db()
     try:
-        cursor = conn.execute("SELECT * FROM escala_templates ORDER BY tipo_escala")
-        templates = cursor.fetchall()
-        cursor.close()
-        return render_template('gerenciar_modelos.html', templates=templates)
+        referencia = cadastro.obter_modelos()
+        return render_template('gerenciar_modelos.html', templates=referencia.lista, candidatos=referencia.candidatos)
     except Exception as e:
         flash(f'Erro ao carregar modelos: {str(e)}', 'error')
         import traceback
         traceback.print_exc()
-        return render_template('gerenciar_modelos.html', templates=[])
-    finally:
-        conn.close()
+        return render_template('gerenciar_modelos.html', templates=[], candidatos={})
 
 @app.route('/editar_modelo/<tipo_escala>', methods=['GET'])
 def editar_modelo_web(tipo_escala):
@@ -1258,39 +1319,30 @@ def editar_modelo_web(tipo_escala):
     # Decodificar o tipo_escala que vem URL-encoded
     tipo_escala_decodificado = unquote(tipo_escala)
     
-    conn = get_db()
     try:
-        # Buscar template usando o tipo decodificado
-        cursor = conn.execute('SELECT * FROM escala_templates WHERE tipo_escala = ?', (tipo_escala_decodificado,))
-        template = cursor.fetchone()
-        cursor.close()
+        # Modelo e pessoas vêm do cache de referência
+        referencia = cadastro.obter_modelos()
+        template = referencia.por_tipo.get(tipo_escala_decodificado)
         
         if template is None:
             flash(f'Modelo "{tipo_escala_decodificado}" não encontrado.', 'error')
             return redirect(url_for('gerenciar_modelos_web'))
         
         # Filtrar pessoas por grupo para cada campo
-        cursor = conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_CERIMONIARIO,))
-        cerimoniarios = [row['nome'] for row in cursor.fetchall()]
-        cursor.close()
-        
-        cursor = conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_VETERANO,))
-        veteranos = [row['nome'] for row in cursor.fetchall()]
-        cursor.close()
-        
-        cursor = conn.execute("SELECT nome FROM pessoas WHERE grupo = ? ORDER BY nome", (GRUPO_MIRINS,))
-        mirins = [row['nome'] for row in cursor.fetchall()]
-        cursor.close()
+        pessoas = cadastro.obter_pessoas()
+        cerimoniarios = pessoas.nomes_do_grupo(GRUPO_CERIMONIARIO)
+        veteranos = pessoas.nomes_do_grupo(GRUPO_VETERANO)
+        mirins = pessoas.nomes_do_grupo(GRUPO_MIRINS)
         
         # Para funções especiais, permitir cerimoniários e veteranos
-        # Buscar TODAS as pessoas para disponibilizar em Turíbulo, Naveta e Tochas
-        cursor = conn.execute("SELECT nome FROM pessoas ORDER BY nome")
-        todas_as_pessoas = [p['nome'] for p in cursor.fetchall()]
-        cursor.close()
-        candidatos_funcoes = sorted(todas_as_pessoas)
+        # TODAS as pessoas para disponibilizar em Turíbulo, Naveta e Tochas
+        candidatos_funcoes = pessoas.nomes
         
+        selecionados = referencia.candidatos.get(template['id'], {})
         return render_template('editar_modelo.html', 
                              template=template, 
+                             selecionados=selecionados,
+                             base={funcao: juntar_nomes(selecionados.get(funcao, [])) for funcao in modelos.FUNCOES_TEMPLATE},
                              cerimoniarios=cerimoniarios,
                              veteranos=veteranos,
                              mirins=mirins,
@@ -1300,26 +1352,49 @@ def editar_modelo_web(tipo_escala):
         import traceback
         traceback.print_exc()
         return redirect(url_for('gerenciar_modelos_web'))
-    finally:
-        conn.close()
 
 @app.route('/atualizar_modelo/<tipo_escala>', methods=['POST'])
 def atualizar_modelo_web(tipo_escala):
     from urllib.parse import unquote
     # Decodificar o tipo_escala que vem URL-encoded
     tipo_escala = unquote(tipo_escala)
-    cerimoniarios = juntar_nomes(request.form.getlist('cerimoniarios'))
-    veteranos = juntar_nomes(request.form.getlist('veteranos'))
-    mirins = juntar_nomes(request.form.getlist('mirins'))
-    turibulo = juntar_nomes(request.form.getlist('turibulo'))
-    naveta = juntar_nomes(request.form.getlist('naveta'))
-    tochas = juntar_nomes(request.form.getlist('tochas'))
+    candidatos = {funcao: request.form.getlist(funcao) for funcao in modelos.FUNCOES_TEMPLATE}
+    versao = concorrencia.versao_do_formulario(request.form)
     conn = get_db()
     try:
-        cursor = conn.execute(''' UPDATE escala_templates SET cerimoniarios_template = ?, veteranos_template = ?, mirins_template = ?, turibulo_template = ?, naveta_template = ?, tochas_template = ? WHERE tipo_escala = ? ''', (cerimoniarios, veteranos, mirins, turibulo, naveta, tochas, tipo_escala))
-        cursor.close()
-        conn.commit()
+        template = conn.execute('SELECT id, tipo_escala, versao FROM escala_templates WHERE tipo_escala = ?', (tipo_escala,)).fetchone()
+        if template is None:
+            flash(f'Modelo "{tipo_escala}" não encontrado.', 'error')
+            return redirect(url_for('gerenciar_modelos_web'))
+        if not concorrencia.atualizar_com_versao(conn, 'escala_templates', template['id'], versao, {}):
+            # Outra pessoa salvou antes: mostrar a edição mesclada com os candidatos atuais
+            atual = dict(modelos.carregar_candidatos_template(conn, template['id']), versao=template['versao'])
+            conn.rollback()
+            base = concorrencia.base_do_formulario(request.form, modelos.FUNCOES_TEMPLATE)
+            rotulos = {funcao: ROTULOS_ESCALA[funcao] for funcao in modelos.FUNCOES_TEMPLATE}
+            mesclado, conflito = concorrencia.montar_conflito(
+                versao, base, candidatos, atual, rotulos, campos_lista=modelos.FUNCOES_TEMPLATE
+            )
+            pessoas = cadastro.obter_pessoas()
+            return render_template('editar_modelo.html',
+                                   template=dict(template),
+                                   selecionados=mesclado,
+                                   base={funcao: juntar_nomes(atual[funcao]) for funcao in modelos.FUNCOES_TEMPLATE},
+                                   conflito=conflito,
+                                   cerimoniarios=pessoas.nomes_do_grupo(GRUPO_CERIMONIARIO),
+                                   veteranos=pessoas.nomes_do_grupo(GRUPO_VETERANO),
+                                   mirins=pessoas.nomes_do_grupo(GRUPO_MIRINS),
+                                   candidatos_funcoes=pessoas.nomes)
+        antes = modelos.carregar_candidatos_template(conn, template['id'])
+        nao_encontrados = modelos.salvar_candidatos_template(conn, template['id'], candidatos)
+        alteracoes.registrar(conn, 'modelo', 'atualizar', template['id'],
+                             antes=dict(antes, tipo_escala=tipo_escala),
+                             depois=dict(modelos.carregar_candidatos_template(conn, template['id']), tipo_escala=tipo_escala),
+                             autor=autor_da_requisicao())
+        notificacoes.confirmar(conn, 'modelos')
         flash(f'Modelo "{tipo_escala}" atualizado com sucesso!', 'success')
+        if nao_encontrados:
+            flash(f"Nomes ignorados (não cadastrados): {', '.join(nao_encontrados)}", 'warning')
     except Exception as e:
         conn.rollback()
         flash(f'Erro ao atualizar modelo: {str(e)}', 'error')
@@ -1330,28 +1405,29 @@ def atualizar_modelo_web(tipo_escala):
 
 # Em app.py
 
-@app.route('/exportar/<int:ano>/<int:mes>')
-def exportar_mes(ano, mes):
-    conn = get_db()
+# Colunas do Excel exportado (id, cor da túnica e versão não interessam fora do sistema)
+COLUNAS_EXPORTACAO = ['data', 'tipo_escala'] + CAMPOS_NOMES_ESCALA
+
+def escalas_do_mes_para_exportar(mes, ano):
+    """Escalas do mês para o Excel e a impressão: as da visão pré-processada do mês (não alterar)"""
+    conn = get_db_leitura()
     try:
-        date_filter, date_params = build_date_filter_query(mes, ano)
-        escalas_db = conn.execute(
-            f"SELECT * FROM escalas {date_filter} ORDER BY data, tipo_escala",
-            date_params
-        ).fetchall()
+        return visao_mes.obter_mes(conn, mes, ano)['escalas']
     finally:
         conn.close()
 
+@app.route('/exportar/<int:ano>/<int:mes>')
+def exportar_mes(ano, mes):
+    escalas_db = escalas_do_mes_para_exportar(mes, ano)
+
     if not escalas_db:
         flash(f"Nenhuma escala encontrada para {mes}/{ano} para exportar.", 'warning')
         return redirect(url_for('index', mes=mes, ano=ano))
 
     try:
-        # Converte os dados para um DataFrame do pandas
-        df = pd.DataFrame([dict(row) for row in escalas_db])
-        # Remove colunas que não são úteis na exportação
-        if 'id' in df.columns: df = df.drop(columns=['id'])
-        if 'bata_cor' in df.columns: df = df.drop(columns=['bata_cor'])
+        # Converte os dados para um DataFrame do pandas, só com as colunas úteis na exportação
+        df = pd.DataFrame([{coluna: escala.get(coluna) for coluna in COLUNAS_EXPORTACAO} for escala in escalas_db],
+                          columns=COLUNAS_EXPORTACAO)
 
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
@@ -1377,39 +1453,74 @@ def exportar_mes(ano, mes):
         flash(f"Ocorreu um erro ao gerar o arquivo Excel: {e}", 'error')
         return redirect(url_for('index', mes=mes, ano=ano))
 
+def enviar_impressao(escalas, mes, ano, pessoa=None):
+    """Envia a escala para impressão (PDF ou HTML, ?formato=) a partir do arquivo em disco"""
+    formato = request.args.get('formato', 'pdf')
+    if formato not in impressao.TIPOS:
+        formato = 'pdf'
+    caminho, formato = impressao.obter_arquivo(escalas, mes, ano, formato, pessoa)
+    if caminho is None:
+        return None
+    nome_arquivo = f"escala_coroinhas_{mes}_{ano}" + (f"_{pessoa['nome'].replace(' ', '_')}" if pessoa else '')
+    resposta = send_file(caminho, mimetype=impressao.TIPOS[formato], download_name=f"{nome_arquivo}.{formato}",
+                         max_age=0)
+    # O nome do arquivo muda a cada versão do mês: o ETag do send_file serve para revalidar
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+@app.route('/imprimir/<int:ano>/<int:mes>')
+def imprimir_mes(ano, mes):
+    """Escala do mês para o mural: PDF (ou HTML otimizado para impressão), gerado uma vez por versão do mês"""
+    try:
+        resposta = enviar_impressao(escalas_do_mes_para_exportar(mes, ano), mes, ano)
+    except Exception as e:
+        print(f"ERRO AO GERAR IMPRESSÃO: {e}")
+        flash(f"Ocorreu um erro ao gerar a escala para impressão: {e}", 'error')
+        return redirect(url_for('index', mes=mes, ano=ano))
+    if resposta is None:
+        flash(f"Nenhuma escala encontrada para {mes}/{ano} para imprimir.", 'warning')
+        return redirect(url_for('index', mes=mes, ano=ano))
+    return resposta
+
+@app.route('/pessoa/<int:pessoa_id>/imprimir/<int:ano>/<int:mes>')
+def imprimir_mes_pessoa(pessoa_id, ano, mes):
+    """Missas de uma pessoa no mês, para impressão"""
+    pessoa = cadastro.obter_pessoas().por_id.get(pessoa_id)
+    if pessoa is None:
+        flash('Pessoa não encontrada.', 'error')
+        return redirect(url_for('visualizar_escala'))
+    try:
+        resposta = enviar_impressao(escalas_do_mes_para_exportar(mes, ano), mes, ano, pessoa)
+    except Exception as e:
+        print(f"ERRO AO GERAR IMPRESSÃO: {e}")
+        flash(f"Ocorreu um erro ao gerar a escala para impressão: {e}", 'error')
+        return redirect(url_for('visualizar_escala', mes=mes, ano=ano))
+    if resposta is None:
+        flash(f"{pessoa['nome']} não tem escalas em {mes}/{ano}.", 'warning')
+        return redirect(url_for('visualizar_escala', mes=mes, ano=ano))
+    return resposta
+
 @app.route('/exportar_modelo/<tipo_escala>')
 def exportar_modelo_web(tipo_escala):
     from urllib.parse import unquote
     # Decodificar o tipo_escala que vem URL-encoded
     tipo_escala = unquote(tipo_escala)
     
-    conn = get_db()
-    try:
-        cursor = conn.execute('SELECT * FROM escala_templates WHERE tipo_escala = ?', (tipo_escala,))
-        template = cursor.fetchone()
-        cursor.close()
-        if not template:
-            flash(f'Modelo "{tipo_escala}" não encontrado.', 'error')
-            return redirect(url_for('gerenciar_modelos_web'))
-    finally:
-        conn.close()
-    
-    # Função auxiliar para acessar chaves do template com segurança
-    def get_template_value(key, default=''):
-        try:
-            val = template[key] if key in template.keys() else default
-            return val if val else default
-        except (KeyError, IndexError):
-            return default
+    referencia = cadastro.obter_modelos()
+    template = referencia.por_tipo.get(tipo_escala)
+    if not template:
+        flash(f'Modelo "{tipo_escala}" não encontrado.', 'error')
+        return redirect(url_for('gerenciar_modelos_web'))
+    candidatos = referencia.candidatos.get(template['id'], {})
     
     try:
         dados = { 
-            'Cerimoniarios': parsear_nomes(get_template_value('cerimoniarios_template', '')), 
-            'Veteranos': parsear_nomes(get_template_value('veteranos_template', '')), 
-            'Mirins': parsear_nomes(get_template_value('mirins_template', '')), 
-            'Turibulo': parsear_nomes(get_template_value('turibulo_template', '')), 
-            'Naveta': parsear_nomes(get_template_value('naveta_template', '')), 
-            'Tochas': parsear_nomes(get_template_value('tochas_template', '')) 
+            'Cerimoniarios': candidatos.get('cerimoniarios', []), 
+            'Veteranos': candidatos.get('veteranos', []), 
+            'Mirins': candidatos.get('mirins', []), 
+            'Turibulo': candidatos.get('turibulo', []), 
+            'Naveta': candidatos.get('naveta', []), 
+            'Tochas': candidatos.get('tochas', []) 
         }
         df = pd.DataFrame.from_dict(dados, orient='index').transpose()
         output = io.BytesIO()
@@ -1452,8 +1563,13 @@ def limpar_mes_web():
             
             # Deletar as escalas
             date_filter, date_params = build_date_filter_query(mes, ano)
+            busca.remover_mes_do_indice(conn, mes, ano)
             conn.execute(f"DELETE FROM escalas {date_filter}", date_params)
-            conn.commit()
+            rollups.atualizar_mes(conn, mes, ano)
+            visao_mes.atualizar_mes(conn, mes, ano)
+            alteracoes.registrar(conn, 'mes', 'limpar', None, ano, mes, antes={'escalas_removidas': total_escalas},
+                                 autor=autor_da_requisicao())
+            notificacoes.confirmar(conn, *caches.escopos_do_mes(ano, mes))
             flash(f"Todas as {total_escalas} escala(s) do mês {mes}/{ano} foram apagadas com sucesso.", 'success')
         except Exception as e:
             conn.rollback()
@@ -1482,8 +1598,8 @@ def forcar_populacao_modelos():
 def gerenciar_dias_missa_web():
     conn = get_db()
     try:
-        dias_missa = conn.execute('SELECT * FROM dias_missa ORDER BY ordem, dia_semana').fetchall()
-        todos_tipos = conn.execute('SELECT tipo_escala FROM escala_templates ORDER BY tipo_escala').fetchall()
+        dias_missa = cadastro.obter_dias_missa(conn).todos
+        todos_tipos = cadastro.obter_modelos(conn).lista
         nomes_dias = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
         return render_template('gerenciar_dias_missa.html', dias_missa=dias_missa, todos_tipos=todos_tipos, nomes_dias=nomes_dias)
     except Exception as e:
@@ -1513,9 +1629,15 @@ def adicionar_dia_missa_web():
             # Buscar maior ordem atual
             max_ordem_result = conn.execute('SELECT MAX(ordem) as max_ord FROM dias_missa').fetchone()
             max_ordem = max_ordem_result['max_ord'] if max_ordem_result and max_ordem_result['max_ord'] else 0
-            conn.execute('INSERT INTO dias_missa (dia_semana, tipo_escala, horario, ativo, ordem) VALUES (?, ?, ?, ?, ?)',
-                        (dia_semana, tipo_escala, horario, ativo, max_ordem + 1))
-            conn.commit()
+            dia_id = inserir_retornando_id(conn, 'INSERT INTO dias_missa (dia_semana, tipo_escala, horario, ativo, ordem) VALUES (?, ?, ?, ?, ?)',
+                                           (dia_semana, tipo_escala, horario, ativo, max_ordem + 1))
+            alteracoes.registrar(conn, 'dia_missa', 'inserir', dia_id,
+                                 depois={'dia_semana': dia_semana, 'tipo_escala': tipo_escala, 'horario': horario,
+                                         'ativo': ativo, 'ordem': max_ordem + 1},
+                                 autor=autor_da_requisicao())
+            # O horário faz parte da visão pré-processada dos meses
+            visao_mes.descartar_todas(conn)
+            notificacoes.confirmar(conn, 'dias_missa')
             flash('Dia de missa adicionado com sucesso!', 'success')
         except Exception as e:
             conn.rollback()
@@ -1547,9 +1669,15 @@ def editar_dia_missa_web(dia_id):
         
         conn = get_db()
         try:
+            antes = conn.execute('SELECT * FROM dias_missa WHERE id = ?', (dia_id,)).fetchone()
             conn.execute('UPDATE dias_missa SET dia_semana=?, tipo_escala=?, horario=?, ativo=?, ordem=? WHERE id=?',
                         (dia_semana, tipo_escala, horario, ativo, ordem, dia_id))
-            conn.commit()
+            alteracoes.registrar(conn, 'dia_missa', 'atualizar', dia_id, antes=antes,
+                                 depois=conn.execute('SELECT * FROM dias_missa WHERE id = ?', (dia_id,)).fetchone(),
+                                 autor=autor_da_requisicao())
+            # O horário faz parte da visão pré-processada dos meses
+            visao_mes.descartar_todas(conn)
+            notificacoes.confirmar(conn, 'dias_missa')
             flash('Dia de missa atualizado com sucesso!', 'success')
         except Exception as e:
             conn.rollback()
@@ -1566,8 +1694,13 @@ def editar_dia_missa_web(dia_id):
 def remover_dia_missa_web(dia_id):
     conn = get_db()
     try:
+        antes = conn.execute('SELECT * FROM dias_missa WHERE id = ?', (dia_id,)).fetchone()
         conn.execute('DELETE FROM dias_missa WHERE id = ?', (dia_id,))
-        conn.commit()
+        if antes is not None:
+            alteracoes.registrar(conn, 'dia_missa', 'remover', dia_id, antes=antes, autor=autor_da_requisicao())
+        # O horário faz parte da visão pré-processada dos meses
+        visao_mes.descartar_todas(conn)
+        notificacoes.confirmar(conn, 'dias_missa')
         flash('Dia de missa removido com sucesso!', 'success')
     except Exception as e:
         conn.rollback()
@@ -1578,12 +1711,12 @@ def remover_dia_missa_web(dia_id):
     return redirect(url_for('gerenciar_dias_missa_web'))
 
 
-def contar_frequencia_no_mes(mes, ano):
+def contar_frequencia_no_mes(mes, ano, leitura=False):
     """
     Busca todas as escalas de um mês e conta quantas vezes cada pessoa aparece.
-    Retorna um dicionário {'Nome': contagem}.
+    Retorna um dicionário {'Nome': contagem}. leitura=True usa get_db_leitura().
     """
-    conn = get_db()
+    conn = get_db_leitura() if leitura else get_db()
     date_filter, date_params = build_date_filter_query(mes, ano)
     escalas = conn.execute(
         f"SELECT * FROM escalas {date_filter}",
@@ -1596,7 +1729,7 @@ def contar_frequencia_no_mes(mes, ano):
         return contagem
 
     for escala in escalas:
-        for funcao in ['cerimoniarios', 'veteranos', 'mirins', 'turibulo', 'naveta', 'tochas']:
+        for funcao in CAMPOS_NOMES_ESCALA:
             valor = escala[funcao] if funcao in escala.keys() else None
             if valor:
                 # Usar função auxiliar para parsear nomes
@@ -1615,17 +1748,10 @@ def relatorio_frequencia_web():
     mes = int(request.args.get('mes', hoje.month))
     ano = int(request.args.get('ano', hoje.year))
 
-    frequencia = contar_frequencia_no_mes(mes, ano)
+    frequencia = contar_frequencia_no_mes(mes, ano, leitura=True)
     
-    # Buscar informações das pessoas (grupo)
-    conn = get_db()
-    try:
-        pessoas_info = {}
-        pessoas_rows = conn.execute('SELECT nome, grupo FROM pessoas').fetchall()
-        for row in pessoas_rows:
-            pessoas_info[row['nome']] = row['grupo']
-    finally:
-        conn.close()
+    # Informações das pessoas (grupo), do cache de referência
+    pessoas_info = cadastro.obter_pessoas().grupos
     
     # Organizar por grupos
     frequencia_por_grupo = {
@@ -1692,83 +1818,109 @@ def relatorio_frequencia_web():
                            pessoas_info=pessoas_info)
 
 
+@app.route('/relatorio_periodo')
+def relatorio_periodo_web():
+    """
+    Relatório de equilíbrio de vários meses (últimos N meses ou ano corrente),
+    calculado a partir dos rollups mensais.
+    """
+    hoje = datetime.today()
+    try:
+        mes = int(request.args.get('mes', hoje.month))
+        ano = int(request.args.get('ano', hoje.year))
+        quantidade_meses = max(1, min(120, int(request.args.get('meses', 6))))
+    except ValueError:
+        flash('Erro: parâmetros de período inválidos.', 'error')
+        return redirect(url_for('relatorio_frequencia_web'))
+    ano_corrente = request.args.get('periodo') == 'ano'
+    if ano_corrente:
+        meses = rollups.meses_do_periodo(mes, ano, mes)
+    else:
+        meses = rollups.meses_do_periodo(mes, ano, quantidade_meses)
+
+    conn = get_db_leitura()
+    try:
+        rows = rollups.carregar_periodo(conn, meses)
+        pessoas_info = cadastro.obter_pessoas(conn).grupos
+    finally:
+        conn.close()
+
+    analise = rollups.analisar_periodo(rows, meses, pessoas_info)
+    meses_nomes = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+    rotulos_meses = [f"{meses_nomes[m - 1]}/{a}" for a, m in meses]
+
+    return render_template('relatorio_periodo.html',
+                           analise=analise,
+                           rotulos_meses=rotulos_meses,
+                           funcoes=rollups.FUNCOES,
+                           mes=mes,
+                           ano=ano,
+                           quantidade_meses=len(meses),
+                           ano_corrente=ano_corrente)
+
+
 @app.route('/cadastrar_pessoas', methods=['GET', 'POST'])
 def cadastrar_pessoas():
-    """Rota administrativa para cadastrar todas as pessoas em massa"""
-    # Dados das pessoas para cadastrar
-    pessoas_para_cadastrar = {
-        'cerimoniario': [
-            "Alejandro", "João Pedro", "Pedro Reis", "Adriano",
-            "Lucas", "André", "Pedro Barroso"
-        ],
-        'veterano': [
-            "Ana Julia", "Vitória", "Sofia Reis", "Armando", "Karla",
-            "Mateus", "João Raffael", "Pedro Cutrim", "Gabriel Mendes"
-        ],
-        'mirins': [
-            "João Gabriel", "Luiza", "Miguel", "Rafael", "Antony",
-            "Maria Celida", "Cauan", "Theo", "Alexia", "Davi Barbalho",
-            "Helisa", "Thiago Alex", "Gabriel Carvalho", "Mariana Jansen",
-            "Bernardo"
-        ]
-    }
-    
+    """Rota administrativa para cadastrar o elenco inicial em massa (nomes existentes não são alterados)"""
     try:
         conn = get_db()
-        cursor = conn.cursor()
-        
-        total_cadastrados = 0
-        total_ignorados = 0
-        pessoas_cadastradas = []
-        pessoas_ignoradas = []
-        
-        # Itera sobre cada grupo e sua lista de nomes
-        for grupo, nomes in pessoas_para_cadastrar.items():
-            for nome in nomes:
-                nome_limpo = nome.strip()
-                
-                # Verifica se a pessoa já existe no banco
-                cursor.execute("SELECT grupo FROM pessoas WHERE nome = ?", (nome_limpo,))
-                pessoa_existente = cursor.fetchone()
-                
-                if pessoa_existente:
-                    grupo_existente = pessoa_existente[0]
-                    if grupo_existente == grupo:
-                        pessoas_ignoradas.append(f"'{nome_limpo}' já está cadastrado(a) no grupo '{grupo}'")
-                    else:
-                        pessoas_ignoradas.append(f"'{nome_limpo}' já existe no grupo '{grupo_existente}' (não alterado para '{grupo}')")
-                    total_ignorados += 1
-                else:
-                    # Pessoa não existe, pode cadastrar
-                    try:
-                        cursor.execute(
-                            "INSERT INTO pessoas (nome, grupo, funcoes) VALUES (?, ?, ?)",
-                            (nome_limpo, grupo, '')
-                        )
-                        pessoas_cadastradas.append(f"'{nome_limpo}' cadastrado(a) no grupo '{grupo}'")
-                        total_cadastrados += 1
-                    except IntegrityError:
-                        pessoas_ignoradas.append(f"Erro ao cadastrar '{nome_limpo}' (pode já existir)")
-                        total_ignorados += 1
-        
-        conn.commit()
+        resultado = importacao.importar(conn, importacao.linhas_iniciais(), atualizar=False)
+        alteracoes.registrar(conn, 'pessoa', 'importar', depois={'inseridos': resultado.inseridos},
+                             autor=autor_da_requisicao())
+        modelos.migrar_templates_legados(conn)
+        notificacoes.confirmar(conn, 'pessoas', 'modelos')
         conn.close()
-        
-        mensagem = f"Cadastro concluído! {total_cadastrados} pessoas novas cadastradas, {total_ignorados} nomes ignorados."
-        flash(mensagem, 'success')
-        
-        # Retornar página com resultado
-        return render_template('cadastro_pessoas_resultado.html',
-                             total_cadastrados=total_cadastrados,
-                             total_ignorados=total_ignorados,
-                             pessoas_cadastradas=pessoas_cadastradas,
-                             pessoas_ignoradas=pessoas_ignoradas)
-        
+
+        flash(f"Cadastro concluído! {resultado.resumo()}.", 'success')
+        return _renderizar_resultado_importacao(resultado)
+
     except Exception as e:
         flash(f'Erro ao cadastrar pessoas: {str(e)}', 'error')
         return redirect(url_for('index'))
 
 
+@app.route('/importar_pessoas', methods=['POST'])
+def importar_pessoas_web():
+    """Importa pessoas de uma planilha .xlsx/.csv (insere as novas e atualiza grupo e funções das existentes)"""
+    arquivo = request.files.get('arquivo')
+    if arquivo is None or not arquivo.filename:
+        flash('Escolha um arquivo .xlsx ou .csv para importar.', 'error')
+        return redirect(url_for('gerenciar_pessoas_web'))
+
+    conn = get_db()
+    try:
+        resultado = importacao.importar(conn, importacao.ler_arquivo(arquivo.stream, arquivo.filename))
+        alteracoes.registrar(conn, 'pessoa', 'importar',
+                             depois={'arquivo': arquivo.filename, 'inseridos': resultado.inseridos,
+                                     'atualizados': resultado.atualizados},
+                             autor=autor_da_requisicao())
+        notificacoes.confirmar(conn, 'pessoas')
+    except ValueError as e:
+        conn.rollback()
+        flash(f'Erro na planilha: {str(e)}', 'error')
+        return redirect(url_for('gerenciar_pessoas_web'))
+    except Exception as e:
+        conn.rollback()
+        flash(f'Erro ao importar pessoas: {str(e)}', 'error')
+        print(f"ERRO ao importar pessoas: {e}")
+        return redirect(url_for('gerenciar_pessoas_web'))
+    finally:
+        conn.close()
+
+    flash(f"Importação concluída! {resultado.resumo()}.", 'success')
+    return _renderizar_resultado_importacao(resultado)
+
+
+def _renderizar_resultado_importacao(resultado):
+    return render_template('cadastro_pessoas_resultado.html',
+                           total_cadastrados=len(resultado.inseridos),
+                           total_atualizados=len(resultado.atualizados),
+                           total_ignorados=len(resultado.ignorados),
+                           pessoas_cadastradas=resultado.inseridos,
+                           pessoas_atualizadas=resultado.atualizados,
+                           pessoas_ignoradas=resultado.ignorados)
+
+
 # Inicialização do banco de dados (executada apenas uma vez)
 # Na Vercel, isso será executado automaticamente quando a função for chamada pela primeira vez
 def init_app():
@@ -1779,52 +1931,28 @@ def init_app():
         popular_templates_iniciais()
         popular_dias_missa_iniciais()
         
-        # Cadastrar pessoas automaticamente se o banco estiver vazio
+        # Cadastrar o elenco inicial se o banco continuar vazio (sem planilha importada)
         db = get_db()
         cursor = db.cursor()
         count_pessoas = cursor.execute("SELECT COUNT(*) FROM pessoas").fetchone()[0]
-        db.close()
-        
         if count_pessoas == 0:
             print("Banco vazio detectado. Cadastrando pessoas automaticamente...")
-            # Chamar a função de cadastro de pessoas
             try:
-                pessoas_para_cadastrar = {
-                    'cerimoniario': [
-                        "Alejandro", "João Pedro", "Pedro Reis", "Adriano",
-                        "Lucas", "André", "Pedro Barroso"
-                    ],
-                    'veterano': [
-                        "Ana Julia", "Vitória", "Sofia Reis", "Armando", "Karla",
-                        "Mateus", "João Raffael", "Pedro Cutrim", "Gabriel Mendes"
-                    ],
-                    'mirins': [
-                        "João Gabriel", "Luiza", "Miguel", "Rafael", "Antony",
-                        "Maria Celida", "Cauan", "Theo", "Alexia", "Davi Barbalho",
-                        "Helisa", "Thiago Alex", "Gabriel Carvalho", "Mariana Jansen",
-                        "Bernardo"
-                    ]
-                }
-                
-                db = get_db()
-                cursor = db.cursor()
-                total = 0
-                for grupo, nomes in pessoas_para_cadastrar.items():
-                    for nome in nomes:
-                        nome_limpo = nome.strip()
-                        try:
-                            cursor.execute(
-                                "INSERT INTO pessoas (nome, grupo, funcoes) VALUES (?, ?, ?)",
-                                (nome_limpo, grupo, '')
-                            )
-                            total += 1
-                        except IntegrityError:
-                            pass  # Já existe
-                db.commit()
-                db.close()
-                print(f"✅ {total} pessoas cadastradas automaticamente!")
+                resultado = importacao.importar(db, importacao.linhas_iniciais())
+                alteracoes.registrar(db, 'pessoa', 'importar', depois={'inseridos': resultado.inseridos},
+                                     autor=autor_da_requisicao())
+                notificacoes.confirmar(db, 'pessoas')
+                print(f"✅ {len(resultado.inseridos)} pessoas cadastradas automaticamente!")
             except Exception as e:
+                db.rollback()
                 print(f"⚠️ Erro ao cadastrar pessoas automaticamente: {e}")
+        db.close()
+        
+        # Modelos iniciais são gravados com nomes; convertê-los em candidatos agora que há pessoas
+        db = get_db()
+        modelos.migrar_templates_legados(db)
+        db.close()
+        caches.invalidar('modelos')
 
 # Executar inicialização apenas se não estiver em ambiente serverless (Vercel)
 # Na Vercel, a inicialização será feita na primeira requisição
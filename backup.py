@@ -0,0 +1,254 @@
+"""
+Backup e restauração do banco (JSON por linha)
+O backup é um arquivo NDJSON: um cabeçalho, depois, para cada tabela, uma linha
+{"tabela", "colunas"} seguida de uma linha (lista JSON) por registro. As linhas
+são lidas e escritas em fluxo (cursor nomeado no PostgreSQL), então a memória
+usada não cresce com o tamanho do banco.
+
+A restauração apaga as tabelas do backup e as recarrega em uma única transação:
+COPY FROM STDIN no PostgreSQL e executemany no SQLite, ambos alimentados pelo
+próprio arquivo. As sequências de id são ajustadas no final. Como o formato é o
+mesmo nos dois bancos, serve também para levar dados do SQLite local para o
+Supabase e vice-versa.
+
+Uso:
+    python backup.py exportar backup.ndjson
+    python backup.py restaurar backup.ndjson
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from database import DB_TYPE, USE_POSTGRES, get_db_connection
+
+FORMATO = 'appigreja-backup'
+VERSAO_FORMATO = 1
+
+# Ordem de carga (tabelas referenciadas antes das que as referenciam). Os índices e
+# rollups também vão no backup para que a restauração não precise recalculá-los;
+# o índice FTS do SQLite é mantido por triggers. alteracoes fica de fora: é o histórico
+# deste banco (a restauração entra nele) e seus ids não podem voltar atrás.
+TABELAS = [
+    'pessoas', 'escala_templates', 'template_candidatos', 'dias_missa', 'escalas',
+    'escala_membros', 'frequencia_mensal', 'visao_mensal', 'indisponibilidades', 'geracoes',
+]
+
+LINHAS_POR_LEITURA = 2000
+
+
+def _colunas_existentes(conn, tabela):
+    if USE_POSTGRES:
+        rows = conn.execute(
+            '''SELECT column_name FROM information_schema.columns
+               WHERE table_schema = current_schema() AND table_name = ? ORDER BY ordinal_position''',
+            (tabela,)
+        ).fetchall()
+        return [row['column_name'] for row in rows]
+    return [row['name'] for row in conn.execute(f'PRAGMA table_info({tabela})').fetchall()]
+
+
+def _ler_tabela(conn, tabela, colunas):
+    """Gera as linhas da tabela como tuplas, em blocos, sem carregar tudo em memória"""
+    query = f"SELECT {', '.join(colunas)} FROM {tabela}"
+    if USE_POSTGRES:
+        # Cursor nomeado = cursor no servidor; o cursor padrão traria o resultado inteiro
+        cursor = conn.conn.cursor(name=f'backup_{tabela}')
+        cursor.itersize = LINHAS_POR_LEITURA
+        try:
+            cursor.execute(query)
+            for row in cursor:
+                yield tuple(row[coluna] for coluna in colunas)
+        finally:
+            cursor.close()
+    else:
+        cursor = conn.execute(query)
+        while True:
+            bloco = cursor.fetchmany(LINHAS_POR_LEITURA)
+            if not bloco:
+                break
+            for row in bloco:
+                yield tuple(row)
+
+
+def _json(valor):
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+
+
+def exportar(conn):
+    """Gera o backup linha a linha (str terminadas em '\\n'); imprime o tempo por tabela"""
+    inicio_total = time.perf_counter()
+    yield _json({'formato': FORMATO, 'versao': VERSAO_FORMATO, 'banco': DB_TYPE,
+                 'criado_em': datetime.now().isoformat(timespec='seconds')})
+    for tabela in TABELAS:
+        colunas = _colunas_existentes(conn, tabela)
+        if not colunas:
+            continue
+        inicio = time.perf_counter()
+        yield _json({'tabela': tabela, 'colunas': colunas})
+        total = 0
+        for linha in _ler_tabela(conn, tabela, colunas):
+            total += 1
+            yield _json(list(linha))
+        print(f"Backup: {tabela} com {total} linha(s) em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    print(f"Backup concluído em {(time.perf_counter() - inicio_total) * 1000:.1f} ms")
+
+
+def _copia_texto(valor):
+    """Valor no formato texto do COPY do PostgreSQL"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    return (str(valor).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class _FluxoCopy:
+    """Objeto tipo arquivo que entrega as linhas ao COPY FROM STDIN sob demanda"""
+    def __init__(self, linhas):
+        self._linhas = linhas
+        self._buffer = ''
+
+    def _proxima(self):
+        linha = next(self._linhas, None)
+        return None if linha is None else '\t'.join(_copia_texto(v) for v in linha) + '\n'
+
+    def readline(self, tamanho=-1):
+        return self._proxima() or ''
+
+    def read(self, tamanho=-1):
+        while tamanho < 0 or len(self._buffer) < tamanho:
+            linha = self._proxima()
+            if linha is None:
+                break
+            self._buffer += linha
+        if tamanho < 0:
+            dados, self._buffer = self._buffer, ''
+        else:
+            dados, self._buffer = self._buffer[:tamanho], self._buffer[tamanho:]
+        return dados
+
+
+def _carregar(conn, tabela, colunas, linhas):
+    if USE_POSTGRES:
+        cursor = conn.cursor()
+        try:
+            cursor.copy_expert(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN", _FluxoCopy(linhas))
+        finally:
+            cursor.close()
+    else:
+        conn.executemany(
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' for _ in colunas)})",
+            linhas
+        )
+
+
+def _ajustar_sequencia(conn, tabela):
+    # Depois de inserir ids explícitos, o próximo id gerado precisa vir depois do maior
+    if USE_POSTGRES:
+        conn.execute(
+            f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {tabela}"
+        )
+
+
+def restaurar(conn, arquivo_texto):
+    """
+    Substitui o conteúdo das tabelas pelo backup lido de `arquivo_texto` (iterável
+    de linhas) em uma única transação. Retorna {tabela: linhas}. Levanta
+    ValueError se o arquivo não for um backup válido; em caso de erro nada muda.
+    """
+    linhas = iter(arquivo_texto)
+    try:
+        cabecalho = json.loads(next(linhas))
+    except (StopIteration, ValueError):
+        raise ValueError("Arquivo de backup vazio ou inválido.")
+    if not isinstance(cabecalho, dict) or cabecalho.get('formato') != FORMATO:
+        raise ValueError("O arquivo não é um backup deste sistema.")
+    if cabecalho.get('versao', 0) > VERSAO_FORMATO:
+        raise ValueError("Backup gerado por uma versão mais nova do sistema.")
+
+    inicio_total = time.perf_counter()
+    totais = {}
+    try:
+        # Apagar na ordem inversa da carga por causa das chaves estrangeiras
+        for tabela in reversed(TABELAS):
+            if _colunas_existentes(conn, tabela):
+                conn.execute(f'DELETE FROM {tabela}')
+
+        secao = None  # {'tabela', 'indices', 'colunas'} da tabela sendo lida
+        pendente = None
+
+        def registros_da_secao():
+            # Consome linhas até o próximo cabeçalho de tabela (guardado em `pendente`)
+            nonlocal pendente
+            for texto in linhas:
+                if not texto.strip():
+                    continue
+                valor = json.loads(texto)
+                if isinstance(valor, dict):
+                    pendente = valor
+                    return
+                totais[secao['tabela']] += 1
+                yield tuple(valor[i] for i in secao['indices'])
+
+        proxima = next(linhas, None)
+        pendente = json.loads(proxima) if proxima and proxima.strip() else None
+        while pendente is not None:
+            cabecalho_tabela, pendente = pendente, None
+            if not isinstance(cabecalho_tabela, dict) or 'tabela' not in cabecalho_tabela:
+                raise ValueError("Arquivo de backup corrompido (cabeçalho de tabela esperado).")
+            tabela = cabecalho_tabela['tabela']
+            if tabela not in TABELAS:
+                raise ValueError(f"Tabela desconhecida no backup: {tabela}")
+            # Colunas que existem nos dois lados (backups de versões anteriores ou posteriores)
+            existentes = set(_colunas_existentes(conn, tabela))
+            colunas = [c for c in cabecalho_tabela['colunas'] if c in existentes]
+            secao = {'tabela': tabela, 'colunas': colunas,
+                     'indices': [cabecalho_tabela['colunas'].index(c) for c in colunas]}
+            totais[tabela] = 0
+            inicio = time.perf_counter()
+            if colunas:
+                _carregar(conn, tabela, colunas, registros_da_secao())
+            else:
+                for _ in registros_da_secao():
+                    pass
+            if 'id' in colunas:
+                _ajustar_sequencia(conn, tabela)
+            print(f"Restauração: {tabela} com {totais[tabela]} linha(s) em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    except Exception:
+        conn.rollback()
+        raise
+
+    print(f"Restauração concluída em {(time.perf_counter() - inicio_total) * 1000:.1f} ms")
+    return totais
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backup e restauração do banco de escalas (NDJSON)")
+    parser.add_argument('acao', choices=['exportar', 'restaurar'])
+    parser.add_argument('arquivo')
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection()
+    try:
+        if args.acao == 'exportar':
+            with open(args.arquivo, 'w', encoding='utf-8') as saida:
+                saida.writelines(exportar(conn))
+        else:
+            import alteracoes
+            import caches
+            import notificacoes
+            with open(args.arquivo, encoding='utf-8') as entrada:
+                totais = restaurar(conn, entrada)
+            alteracoes.registrar(conn, 'banco', 'restaurar', depois={'arquivo': args.arquivo, 'linhas': totais},
+                                 autor='linha de comando')
+            notificacoes.confirmar(conn, caches.TODOS)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
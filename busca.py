@@ -0,0 +1,264 @@
+"""
+Módulo de busca por nome
+Mantém o índice escala_membros (uma linha por pessoa escalada, com nome sem acentos
+e em minúsculas) e monta os filtros de busca usando pg_trgm no PostgreSQL e FTS5
+(tokenizer trigram) no SQLite, com fallback para LIKE quando nenhum está disponível.
+
+Também é a fonte das funções de escala e do formato das listas de nomes
+(parsear_nomes/juntar_nomes), e de reescrever_nomes(), que altera as listas de
+várias escalas mantendo o índice em dia (edição em lote, desativação de pessoas).
+"""
+import difflib
+import unicodedata
+
+from database import USE_POSTGRES, executar_em_lote, marcadores
+
+FUNCOES_ESCALA = ['cerimoniarios', 'veteranos', 'mirins', 'turibulo', 'naveta', 'tochas']
+SEPARADOR_NOMES = ', '  # Vírgula e espaço
+
+# Limite de similaridade para sugestões por erro de digitação (difflib)
+SIMILARIDADE_MINIMA = 0.75
+
+_fts_disponivel = None
+
+
+def normalizar_nome(nome):
+    """Remove acentos, converte para minúsculas e colapsa espaços ('João  Gabriel' -> 'joao gabriel')"""
+    if not nome:
+        return ''
+    decomposto = unicodedata.normalize('NFKD', nome)
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
+
+def data_para_iso(data_br):
+    """Converte 'DD/MM/YYYY' para 'YYYY-MM-DD' (ordenável e comparável como texto)"""
+    dia, mes, ano = data_br.split('/')
+    return f"{ano}-{mes}-{dia}"
+
+
+def intervalo_mes_iso(mes, ano):
+    """Retorna (primeiro_dia, ultimo_dia) do mês em ISO, para filtros por data_iso"""
+    return f"{ano:04d}-{mes:02d}-01", f"{ano:04d}-{mes:02d}-31"
+
+
+def parsear_nomes(campo):
+    """Nomes de uma coluna de escalas (aceita ', ' e o ',' sem espaço das linhas antigas)"""
+    if not campo:
+        return []
+    return [nome.strip() for nome in campo.replace(', ', ',').split(',') if nome.strip()]
+
+
+def juntar_nomes(lista_nomes):
+    """Junta uma lista de nomes usando o separador padronizado"""
+    return SEPARADOR_NOMES.join(lista_nomes)
+
+
+def _usar_fts(conn):
+    """Verifica (uma vez por processo) se a tabela FTS5 existe no SQLite"""
+    global _fts_disponivel
+    if USE_POSTGRES:
+        return False
+    if _fts_disponivel is None:
+        row = conn.execute(
+            "SELECT COUNT(*) AS total FROM sqlite_master WHERE name = 'escala_membros_fts'"
+        ).fetchone()
+        _fts_disponivel = bool(row['total'])
+    return _fts_disponivel
+
+
+def indexar_escala(conn, escala_id, data, escala):
+    """
+    (Re)indexa os membros de uma escala. `escala` é um dict/Row com os seis campos
+    de nomes. Não faz commit: roda na mesma transação da escrita da escala.
+    """
+    conn.execute('DELETE FROM escala_membros WHERE escala_id = ?', (escala_id,))
+    data_iso = data_para_iso(data)
+    linhas = []
+    for funcao in FUNCOES_ESCALA:
+        for nome in parsear_nomes(escala[funcao] if funcao in escala.keys() else None):
+            linhas.append((escala_id, data_iso, funcao, nome, normalizar_nome(nome)))
+    executar_em_lote(
+        conn,
+        'INSERT INTO escala_membros (escala_id, data_iso, funcao, nome, nome_busca) VALUES (?, ?, ?, ?, ?)',
+        linhas
+    )
+
+
+
+def carregar_escalas(conn, ids):
+    """{id: dict da linha} das escalas com os `ids`"""
+    if not ids:
+        return {}
+    ids = sorted(ids)
+    return {row['id']: dict(row) for row in conn.execute(
+        f"SELECT * FROM escalas WHERE id IN ({marcadores(ids)})", ids
+    ).fetchall()}
+
+
+def reescrever_nomes(conn, funcoes_por_id, transformar):
+    """
+    Aplica transformar(nomes) -> nomes às listas das funções indicadas de cada
+    escala ({escala_id: funções}). Só as escalas em que algum valor muda são
+    gravadas (UPDATEs em lote por conjunto de colunas, versao + 1) e reindexadas.
+    Não faz commit. Retorna {escala_id: (escala antes, {função: valor novo})}.
+    """
+    alteradas = {}
+    updates = {}
+    for escala_id, escala in carregar_escalas(conn, funcoes_por_id).items():
+        novos = {}
+        for funcao in FUNCOES_ESCALA:
+            if funcao not in funcoes_por_id[escala_id]:
+                continue
+            valor = juntar_nomes(transformar(parsear_nomes(escala[funcao])))
+            if valor != (escala[funcao] or ''):
+                novos[funcao] = valor
+        if novos:
+            alteradas[escala_id] = (escala, novos)
+            updates.setdefault(tuple(novos), []).append(tuple(novos.values()) + (escala_id,))
+
+    for colunas, linhas in updates.items():
+        atribuicoes = ', '.join(f'{funcao} = ?' for funcao in colunas)
+        executar_em_lote(conn, f'UPDATE escalas SET {atribuicoes}, versao = versao + 1 WHERE id = ?', linhas)
+    for escala_id, (escala, novos) in alteradas.items():
+        indexar_escala(conn, escala_id, escala['data'], dict(escala, **novos))
+    return alteradas
+
+def remover_escala_do_indice(conn, escala_id):
+    conn.execute('DELETE FROM escala_membros WHERE escala_id = ?', (escala_id,))
+
+
+def remover_mes_do_indice(conn, mes, ano):
+    inicio, fim = intervalo_mes_iso(mes, ano)
+    conn.execute('DELETE FROM escala_membros WHERE data_iso BETWEEN ? AND ?', (inicio, fim))
+
+
+def reconstruir_indice(conn):
+    """Reconstrói escala_membros e pessoas.nome_busca a partir das tabelas principais"""
+    conn.execute('DELETE FROM escala_membros')
+    escalas = conn.execute('SELECT * FROM escalas').fetchall()
+    for escala in escalas:
+        try:
+            indexar_escala(conn, escala['id'], escala['data'], escala)
+        except (ValueError, AttributeError) as e:
+            print(f"AVISO: escala {escala['id']} com data inválida ignorada no índice: {e}")
+    atualizar_nomes_busca_pessoas(conn)
+    conn.commit()
+    print(f"Índice de busca reconstruído ({len(escalas)} escalas).")
+
+
+def atualizar_nomes_busca_pessoas(conn, apenas_vazios=False):
+    """Preenche pessoas.nome_busca (todas ou apenas as que ainda estão sem valor)"""
+    query = 'SELECT id, nome FROM pessoas'
+    if apenas_vazios:
+        query += ' WHERE nome_busca IS NULL'
+    for row in conn.execute(query).fetchall():
+        conn.execute('UPDATE pessoas SET nome_busca = ? WHERE id = ?', (normalizar_nome(row['nome']), row['id']))
+
+
+def reconstruir_indice_se_necessario(conn):
+    """Na inicialização: popula o índice se há escalas mas o índice está vazio (bancos antigos)"""
+    total_escalas = conn.execute('SELECT COUNT(*) AS total FROM escalas').fetchone()['total']
+    total_indice = conn.execute('SELECT COUNT(*) AS total FROM escala_membros').fetchone()['total']
+    if total_escalas and not total_indice:
+        reconstruir_indice(conn)
+    else:
+        atualizar_nomes_busca_pessoas(conn, apenas_vazios=True)
+        conn.commit()
+
+
+def _nomes_parecidos(conn, termo_normalizado, mes, ano):
+    """Tolerância a erros de digitação no SQLite: nomes escalados no mês parecidos com o termo"""
+    inicio, fim = intervalo_mes_iso(mes, ano)
+    nomes = [row['nome_busca'] for row in conn.execute(
+        'SELECT DISTINCT nome_busca FROM escala_membros WHERE data_iso BETWEEN ? AND ?', (inicio, fim)
+    ).fetchall()]
+    parecidos = set(difflib.get_close_matches(termo_normalizado, nomes, n=5, cutoff=SIMILARIDADE_MINIMA))
+    # Também comparar com cada palavra do nome ("joao" ~ "joa" em "joao gabriel")
+    for nome in nomes:
+        if difflib.get_close_matches(termo_normalizado, nome.split(), n=1, cutoff=SIMILARIDADE_MINIMA):
+            parecidos.add(nome)
+    return sorted(parecidos)
+
+
+def filtro_escalas_por_nome(conn, termo, mes, ano):
+    """
+    Monta o trecho SQL para filtrar escalas do mês que tenham alguém cujo nome
+    contenha `termo` (sem diferenciar acentos/maiúsculas). Retorna (sql, params)
+    para anexar com AND à query de escalas.
+    """
+    termo_normalizado = normalizar_nome(termo)
+    inicio, fim = intervalo_mes_iso(mes, ano)
+    if not termo_normalizado:
+        return '', []
+
+    if USE_POSTGRES:
+        # LIKE '%termo%' usa o índice GIN trigram; o operador % (similaridade) cobre erros de digitação
+        sql = (" AND id IN (SELECT escala_id FROM escala_membros WHERE data_iso BETWEEN ? AND ?"
+               " AND (nome_busca LIKE ? OR nome_busca %% ?))")
+        return sql, [inicio, fim, f'%{termo_normalizado}%', termo_normalizado]
+
+    if _usar_fts(conn) and len(termo_normalizado) >= 3:
+        frase = '"' + termo_normalizado.replace('"', '""') + '"'
+        ids = [row['escala_id'] for row in conn.execute(
+            '''SELECT DISTINCT m.escala_id FROM escala_membros_fts f
+               JOIN escala_membros m ON m.id = f.rowid
+               WHERE escala_membros_fts MATCH ? AND m.data_iso BETWEEN ? AND ?''',
+            (frase, inicio, fim)
+        ).fetchall()]
+    else:
+        # Termos com menos de 3 letras não geram trigramas: LIKE simples no mês
+        ids = [row['escala_id'] for row in conn.execute(
+            'SELECT DISTINCT escala_id FROM escala_membros WHERE data_iso BETWEEN ? AND ? AND nome_busca LIKE ?',
+            (inicio, fim, f'%{termo_normalizado}%')
+        ).fetchall()]
+
+    if not ids:
+        parecidos = _nomes_parecidos(conn, termo_normalizado, mes, ano)
+        if parecidos:
+            marcadores = ', '.join('?' for _ in parecidos)
+            ids = [row['escala_id'] for row in conn.execute(
+                f'SELECT DISTINCT escala_id FROM escala_membros WHERE data_iso BETWEEN ? AND ? AND nome_busca IN ({marcadores})',
+                [inicio, fim] + parecidos
+            ).fetchall()]
+
+    if not ids:
+        return ' AND 1 = 0', []
+    marcadores = ', '.join('?' for _ in ids)
+    return f' AND id IN ({marcadores})', ids
+
+
+def autocompletar_pessoas(conn, termo, limite=10):
+    """Sugestões de nomes de pessoas: prefixo primeiro, depois substring e nomes parecidos"""
+    termo_normalizado = normalizar_nome(termo)
+    if not termo_normalizado:
+        return []
+
+    if USE_POSTGRES:
+        rows = conn.execute(
+            '''SELECT nome FROM pessoas
+               WHERE ativo = 1 AND (nome_busca LIKE ? OR nome_busca %% ?)
+               ORDER BY (nome_busca LIKE ?) DESC, similarity(nome_busca, ?) DESC, nome
+               LIMIT ?''',
+            (f'%{termo_normalizado}%', termo_normalizado, f'{termo_normalizado}%', termo_normalizado, limite)
+        ).fetchall()
+        return [row['nome'] for row in rows]
+
+    # Prefixo como intervalo (usa o índice B-tree em nome_busca)
+    nomes = [row['nome'] for row in conn.execute(
+        'SELECT nome FROM pessoas WHERE ativo = 1 AND nome_busca >= ? AND nome_busca < ? ORDER BY nome_busca LIMIT ?',
+        (termo_normalizado, termo_normalizado + '\uffff', limite)
+    ).fetchall()]
+    if len(nomes) < limite:
+        for row in conn.execute(
+            'SELECT nome FROM pessoas WHERE ativo = 1 AND nome_busca LIKE ? ORDER BY nome_busca LIMIT ?',
+            (f'%{termo_normalizado}%', limite)
+        ).fetchall():
+            if row['nome'] not in nomes:
+                nomes.append(row['nome'])
+    if not nomes:
+        todos = {row['nome_busca']: row['nome'] for row in conn.execute('SELECT nome, nome_busca FROM pessoas WHERE ativo = 1').fetchall()
+                 if row['nome_busca']}
+        for parecido in difflib.get_close_matches(termo_normalizado, list(todos), n=limite, cutoff=SIMILARIDADE_MINIMA - 0.15):
+            nomes.append(todos[parecido])
+    return nomes[:limite]
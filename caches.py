@@ -0,0 +1,94 @@
+"""
+Caches em memória do processo
+Cada escopo (ex.: 'escalas', 'dias_missa') tem um contador de versão que as rotas
+de escrita incrementam com invalidar(). As chaves dos caches incluem as versões
+dos escopos de que dependem, então uma escrita torna as entradas antigas
+inalcançáveis imediatamente e o TTL apenas libera a memória.
+"""
+import os
+import threading
+import time
+
+from cachetools import TTLCache
+
+_lock = threading.Lock()
+_versoes = {}
+_ultima_invalidacao = 0.0
+_por_thread = threading.local()
+
+# Atraso máximo esperado da réplica de leitura: valores lidos dela logo depois de
+# uma invalidação podem ainda não refletir a escrita e não são guardados em cache
+ATRASO_MAXIMO_REPLICA = float(os.environ.get('REPLICA_ATRASO_MAXIMO', '5'))
+
+# Escopos de dados de referência e de escalas usados pelas rotas
+ESCOPOS = ('escalas', 'dias_missa', 'pessoas', 'modelos')
+# Escopo especial: invalida todos os caches (ex.: banco reiniciado)
+TODOS = '*'
+
+# Agenda de cada pessoa (rota /pessoa/<id>/escalas e feed .ics)
+agendas_pessoas = TTLCache(maxsize=1024, ttl=600)
+
+
+def versao(escopo):
+    """Versão atual de um escopo de dados"""
+    return _versoes.get(escopo, 0)
+
+
+def versoes(*escopos):
+    """Tupla com as versões dos escopos, para compor chaves de cache"""
+    return tuple(_versoes.get(escopo, 0) for escopo in escopos)
+
+
+def invalidar(*escopos):
+    """Incrementa a versão dos escopos após uma escrita (TODOS invalida tudo)"""
+    global _ultima_invalidacao
+    if TODOS in escopos:
+        invalidar_tudo()
+        return
+    with _lock:
+        _ultima_invalidacao = time.monotonic()
+        for escopo in escopos:
+            _versoes[escopo] = _versoes.get(escopo, 0) + 1
+
+
+def invalidar_tudo():
+    """Incrementa todos os escopos conhecidos (ex.: eventos de outras instâncias perdidos)"""
+    global _ultima_invalidacao
+    with _lock:
+        _ultima_invalidacao = time.monotonic()
+        for escopo in set(_versoes) | set(ESCOPOS):
+            _versoes[escopo] = _versoes.get(escopo, 0) + 1
+
+
+def escopo_mes(ano, mes):
+    """Escopo das escalas de um mês ('escalas:2026-03')"""
+    return f"escalas:{int(ano):04d}-{int(mes):02d}"
+
+
+def escopos_do_mes(ano, mes):
+    """Escopos afetados por uma escrita nas escalas de um mês"""
+    return ('escalas', escopo_mes(ano, mes))
+
+
+def escopos_da_data(data_br):
+    """Atalho para escritas de uma única escala ('DD/MM/YYYY')"""
+    _, mes, ano = data_br.split('/')
+    return escopos_do_mes(ano, mes)
+
+
+def lendo_da_replica(ativo):
+    """Marca se a requisição desta thread está lendo da réplica (ver ATRASO_MAXIMO_REPLICA)"""
+    _por_thread.replica = ativo
+
+
+def obter_ou_calcular(cache, chave, calcular):
+    """Retorna o valor em cache ou calcula, armazena e retorna"""
+    with _lock:
+        if chave in cache:
+            return cache[chave]
+    valor = calcular()
+    if getattr(_por_thread, 'replica', False) and time.monotonic() - _ultima_invalidacao < ATRASO_MAXIMO_REPLICA:
+        return valor
+    with _lock:
+        cache[chave] = valor
+    return valor
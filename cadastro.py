@@ -0,0 +1,101 @@
+"""
+Cache dos dados de referência (pessoas, dias de missa e modelos)
+Esses dados mudam pouco, mas quase toda rota de leitura precisava deles. Cada
+conjunto é carregado uma vez por processo, fica em memória por até TTL_SEGUNDOS
+e é descartado assim que uma rota de escrita chama caches.invalidar() com o
+escopo correspondente ('pessoas', 'dias_missa' ou 'modelos').
+
+Os objetos retornados são compartilhados entre requisições: não altere as
+listas e dicionários deles, copie antes.
+"""
+from cachetools import TTLCache
+
+import caches
+import modelos
+from database import get_db_connection
+
+TTL_SEGUNDOS = 300
+
+_referencia = TTLCache(maxsize=16, ttl=TTL_SEGUNDOS)
+
+
+def _parsear_funcoes(funcoes_str):
+    # Pode ser "turibulo,naveta" ou "turibulo, naveta" ou apenas "turibulo"
+    return frozenset(f.strip().lower() for f in (funcoes_str or '').split(',') if f.strip())
+
+
+class Pessoas:
+    """Instantâneo da tabela pessoas com os índices usados pelas rotas"""
+    def __init__(self, rows):
+        self.lista = sorted(
+            ({'id': row['id'], 'nome': row['nome'], 'grupo': row['grupo'], 'funcoes': row['funcoes'] or ''}
+             for row in rows),
+            key=lambda p: p['nome']
+        )
+        self.nomes = [p['nome'] for p in self.lista]
+        self.por_id = {p['id']: p for p in self.lista}
+        self.por_nome = {p['nome']: p for p in self.lista}
+        self.grupos = {p['nome']: p['grupo'] for p in self.lista}
+        self.funcoes = {p['nome']: _parsear_funcoes(p['funcoes']) for p in self.lista}
+        self.por_grupo = {}
+        self.por_funcao = {}
+        for p in self.lista:
+            self.por_grupo.setdefault(p['grupo'], []).append(p['nome'])
+            for funcao in self.funcoes[p['nome']]:
+                self.por_funcao.setdefault(funcao, []).append(p['nome'])
+
+    def nomes_do_grupo(self, grupo):
+        return self.por_grupo.get(grupo, [])
+
+    def nomes_com_funcao(self, funcao):
+        return self.por_funcao.get(funcao, [])
+
+
+class DiasMissa:
+    """Instantâneo de dias_missa: todas as linhas, as ativas e o horário por tipo"""
+    def __init__(self, rows):
+        self.todos = [dict(row) for row in rows]
+        self.ativos = sorted((d for d in self.todos if d['ativo'] == 1), key=lambda d: d['ordem'] or 0)
+        self.horarios = {d['tipo_escala']: d['horario'] or '' for d in self.ativos}
+
+
+class Modelos:
+    """Instantâneo dos modelos de escala e seus candidatos por função"""
+    def __init__(self, rows, candidatos):
+        self.lista = [dict(row) for row in rows]
+        self.tipos = [m['tipo_escala'] for m in self.lista]
+        self.por_tipo = {m['tipo_escala']: m for m in self.lista}
+        self.candidatos = candidatos
+        # {tipo_escala: {funcao: [nomes]}}, formato usado pelo gerador
+        self.candidatos_por_tipo = {m['tipo_escala']: candidatos.get(m['id'], {}) for m in self.lista}
+
+
+def _obter(escopo, carregar, conn):
+    chave = (escopo, caches.versao(escopo))
+
+    def calcular():
+        if conn is not None:
+            return carregar(conn)
+        nova_conn = get_db_connection()
+        try:
+            return carregar(nova_conn)
+        finally:
+            nova_conn.close()
+
+    return caches.obter_ou_calcular(_referencia, chave, calcular)
+
+
+def obter_pessoas(conn=None):
+    """Pessoas ativas; `conn` só é usada se o cache precisar ser recarregado"""
+    return _obter('pessoas', lambda c: Pessoas(c.execute('SELECT id, nome, grupo, funcoes FROM pessoas WHERE ativo = 1').fetchall()), conn)
+
+
+def obter_dias_missa(conn=None):
+    return _obter('dias_missa', lambda c: DiasMissa(c.execute('SELECT * FROM dias_missa ORDER BY ordem, dia_semana').fetchall()), conn)
+
+
+def obter_modelos(conn=None):
+    def carregar(c):
+        rows = c.execute('SELECT id, tipo_escala, versao FROM escala_templates ORDER BY tipo_escala').fetchall()
+        return Modelos(rows, modelos.carregar_candidatos(c))
+    return _obter('modelos', carregar, conn)
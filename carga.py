@@ -0,0 +1,275 @@
+"""
+Gerador de carga local para o sistema de escalas
+Simula o tráfego de domingo de manhã (muitos acessos a /visualizar enquanto
+um admin edita) e mede vazão, taxa de erro e latência de cauda.
+
+Uso:
+    python carga.py                                   # em processo (Flask test client)
+    python carga.py --concorrencia 1,10,50 --requisicoes 500
+    python carga.py --mix visualizar=80,index=10,relatorio=5,escrita=5 --permitir-escrita
+    python carga.py --url http://localhost:5000 --escalas 12,13   # contra servidor rodando
+
+O cenário de escrita só roda com --permitir-escrita: use um banco de teste, não o da paróquia.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+# Mistura padrão de requisições (pesos relativos)
+MIX_PADRAO = {
+    'visualizar': 70,
+    'index': 15,
+    'relatorio': 10,
+    'escrita': 5,
+}
+
+
+
+def parsear_mix(texto):
+    """Converte 'visualizar=70,index=15' em {'visualizar': 70, 'index': 15}"""
+    mix = {}
+    for parte in texto.split(','):
+        if not parte.strip():
+            continue
+        nome, _, peso = parte.partition('=')
+        nome = nome.strip()
+        if nome not in MIX_PADRAO:
+            raise ValueError(f"Cenário desconhecido: {nome}. Opções: {', '.join(MIX_PADRAO)}")
+        mix[nome] = int(peso or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("A mistura de cenários precisa ter ao menos um peso positivo.")
+    return mix
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por posição mais próxima (valores já ordenados)"""
+    if not valores_ordenados:
+        return 0.0
+    indice = max(0, min(len(valores_ordenados) - 1, int(round(p / 100.0 * len(valores_ordenados))) - 1))
+    return valores_ordenados[indice]
+
+
+class ClienteEmProcesso:
+    """Executa as requisições direto no app Flask, sem rede"""
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, caminho):
+        resposta = self.client.get(caminho)
+        return resposta.status_code
+
+    def post(self, caminho, dados):
+        resposta = self.client.post(caminho, data=dados)
+        return resposta.status_code
+
+
+class ClienteHttp:
+    """Executa as requisições contra um servidor já em execução"""
+    def __init__(self, url_base, timeout=30):
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+
+    def _abrir(self, requisicao):
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                resposta.read()
+                return resposta.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get(self, caminho):
+        return self._abrir(urllib.request.Request(self.url_base + caminho))
+
+    def post(self, caminho, dados):
+        corpo = urllib.parse.urlencode(dados, doseq=True).encode()
+        return self._abrir(urllib.request.Request(self.url_base + caminho, data=corpo, method='POST'))
+
+
+class Cenarios:
+    """Monta as requisições de cada cenário da mistura"""
+    def __init__(self, mes, ano, escalas_escrita):
+        self.mes = mes
+        self.ano = ano
+        # Lista de (escala_id, dados do formulário) usada pelo cenário de escrita.
+        # O formulário reenvia os mesmos valores e a versão lida, então a carga não altera a escala.
+        self.escalas_escrita = escalas_escrita
+
+    def executar(self, nome, cliente, rng):
+        if nome == 'visualizar':
+            return cliente.get(f'/visualizar?mes={self.mes}&ano={self.ano}')
+        if nome == 'index':
+            return cliente.get(f'/?mes={self.mes}&ano={self.ano}')
+        if nome == 'relatorio':
+            return cliente.get(f'/relatorio_frequencia?mes={self.mes}&ano={self.ano}')
+        if nome == 'escrita':
+            escala_id, dados = rng.choice(self.escalas_escrita)
+            return cliente.post(f'/editar_escala/{escala_id}', dados)
+        raise ValueError(f"Cenário desconhecido: {nome}")
+
+
+def dados_formulario_escala(escala):
+    """Reconstrói o formulário de edição a partir de uma linha de escalas (mesmos valores e versão)"""
+    from busca import FUNCOES_ESCALA, parsear_nomes
+    # A cor vai como está no banco (linhas antigas usam 'Branca'): trocar por 'Bata Branca' seria uma alteração
+    dados = {'versao': escala['versao'], 'bata_cor': escala['bata_cor'] or ''}
+    for campo in FUNCOES_ESCALA:
+        dados[campo] = parsear_nomes(escala[campo])
+    return dados
+
+
+def carregar_escalas_escrita(mes, ano):
+    """Busca as escalas do mês no banco local para o cenário de escrita"""
+    from app import get_db
+    from database import build_date_filter_query
+    conn = get_db()
+    try:
+        date_filter, date_params = build_date_filter_query(mes, ano)
+        escalas = conn.execute(f"SELECT * FROM escalas {date_filter} ORDER BY data", date_params).fetchall()
+    finally:
+        conn.close()
+    return [(escala['id'], dados_formulario_escala(escala)) for escala in escalas]
+
+
+def rodar_nivel(fabrica_cliente, cenarios, mix, concorrencia, total_requisicoes, semente):
+    """Executa total_requisicoes divididas entre `concorrencia` threads"""
+    nomes = list(mix.keys())
+    pesos = [mix[n] for n in nomes]
+    latencias = {nome: [] for nome in nomes}
+    erros = {nome: 0 for nome in nomes}
+    lock = threading.Lock()
+    restantes = [total_requisicoes]
+
+    def trabalhador(indice):
+        cliente = fabrica_cliente()
+        rng = random.Random(semente + indice)
+        while True:
+            with lock:
+                if restantes[0] <= 0:
+                    return
+                restantes[0] -= 1
+            nome = rng.choices(nomes, weights=pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                status = cenarios.executar(nome, cliente, rng)
+                falhou = status >= 400
+            except Exception:
+                falhou = True
+            duracao = time.perf_counter() - inicio
+            with lock:
+                latencias[nome].append(duracao)
+                if falhou:
+                    erros[nome] += 1
+
+    threads = [threading.Thread(target=trabalhador, args=(i,), daemon=True) for i in range(concorrencia)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+    return latencias, erros, decorrido
+
+
+def imprimir_relatorio(concorrencia, latencias, erros, decorrido):
+    todas = sorted(l for valores in latencias.values() for l in valores)
+    total = len(todas)
+    total_erros = sum(erros.values())
+    vazao = total / decorrido if decorrido > 0 else 0.0
+
+    print("\n" + "=" * 78)
+    print(f"CONCORRÊNCIA {concorrencia}: {total} requisições em {decorrido:.2f}s "
+          f"-> {vazao:.1f} req/s, erros {total_erros} ({(total_erros / total * 100) if total else 0:.1f}%)")
+    print("=" * 78)
+    print(f"{'cenário':<12}{'req':>7}{'erros':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    linhas = list(latencias.items()) + [('TOTAL', todas)]
+    for nome, valores in linhas:
+        valores = sorted(valores)
+        if not valores:
+            continue
+        qtd_erros = total_erros if nome == 'TOTAL' else erros[nome]
+        print(f"{nome:<12}{len(valores):>7}{qtd_erros:>7}"
+              f"{percentil(valores, 50) * 1000:>10.1f}{percentil(valores, 95) * 1000:>10.1f}"
+              f"{percentil(valores, 99) * 1000:>10.1f}{valores[-1] * 1000:>10.1f}")
+
+
+def main(argv=None):
+    hoje = datetime.today()
+    parser = argparse.ArgumentParser(description="Gerador de carga local para o sistema de escalas")
+    parser.add_argument('--url', help="URL de um servidor em execução (padrão: app em processo)")
+    parser.add_argument('--mes', type=int, default=hoje.month)
+    parser.add_argument('--ano', type=int, default=hoje.year)
+    parser.add_argument('--concorrencia', default='1,10,50',
+                        help="Níveis de concorrência separados por vírgula (padrão: 1,10,50)")
+    parser.add_argument('--requisicoes', type=int, default=300, help="Requisições por nível (padrão: 300)")
+    parser.add_argument('--mix', default=None,
+                        help="Pesos por cenário, ex.: visualizar=70,index=15,relatorio=10,escrita=5")
+    parser.add_argument('--escalas', default='',
+                        help="IDs de escalas para o cenário de escrita no modo --url (ex.: 12,13)")
+    parser.add_argument('--permitir-escrita', action='store_true',
+                        help="Habilita o cenário de escrita (POST em /editar_escala no banco configurado)")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--verbose', action='store_true', help="Não suprimir os prints do app")
+    args = parser.parse_args(argv)
+
+    mix = parsear_mix(args.mix) if args.mix else dict(MIX_PADRAO)
+    if 'escrita' in mix and not args.permitir_escrita:
+        print("AVISO: cenário de escrita desativado (grava no banco configurado); use --permitir-escrita com um banco de teste.")
+        mix.pop('escrita')
+        if not mix:
+            print("Nada para executar.")
+            return 1
+    niveis = [int(n) for n in args.concorrencia.split(',') if n.strip()]
+    silenciar = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    if args.url:
+        fabrica_cliente = lambda: ClienteHttp(args.url)
+        escalas_escrita = []
+        if 'escrita' in mix:
+            # O formulário de escrita é lido do banco configurado neste ambiente
+            # (DATABASE_URL / DATABASE_PATH), que deve ser o mesmo do servidor
+            ids_permitidos = {i.strip() for i in args.escalas.split(',') if i.strip()}
+            try:
+                with silenciar:
+                    escalas_escrita = carregar_escalas_escrita(args.mes, args.ano)
+            except Exception as e:
+                print(f"AVISO: não foi possível ler as escalas do banco para o cenário de escrita: {e}")
+            if ids_permitidos:
+                escalas_escrita = [e for e in escalas_escrita if str(e[0]) in ids_permitidos]
+    else:
+        with silenciar:
+            from app import app, init_app
+            init_app()
+            escalas_escrita = carregar_escalas_escrita(args.mes, args.ano)
+        fabrica_cliente = lambda: ClienteEmProcesso(app)
+
+    if 'escrita' in mix and not escalas_escrita:
+        print(f"AVISO: nenhuma escala em {args.mes}/{args.ano} para o cenário de escrita; cenário removido.")
+        mix.pop('escrita')
+        if not mix:
+            print("Nada para executar.")
+            return 1
+
+    cenarios = Cenarios(args.mes, args.ano, escalas_escrita)
+    alvo = args.url or f"app em processo ({os.environ.get('DATABASE_URL') and 'PostgreSQL' or 'SQLite'})"
+    print(f"Alvo: {alvo} | mês {args.mes}/{args.ano} | mistura {mix} | {args.requisicoes} req/nível")
+
+    for concorrencia in niveis:
+        with silenciar:
+            latencias, erros, decorrido = rodar_nivel(
+                fabrica_cliente, cenarios, mix, concorrencia, args.requisicoes, args.semente
+            )
+        imprimir_relatorio(concorrencia, latencias, erros, decorrido)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Controle de concorrência otimista (coluna versao)
+escalas, escala_templates e pessoas têm uma coluna `versao` que toda gravação
+incrementa. O formulário de edição leva a versão que foi mostrada e os valores
+originais (base); o UPDATE só acontece se a versão no banco ainda for a mesma
+(WHERE id = ? AND versao = ?), sem travar a linha enquanto alguém edita.
+
+Se outra pessoa salvou antes, nada é gravado: mesclar() combina a edição com o
+estado atual (listas de nomes são mescladas nome a nome; campos simples só
+entram em conflito se os dois lados mudaram o mesmo campo para valores
+diferentes) e a tela de edição é mostrada de novo com a proposta mesclada,
+para revisão antes de salvar.
+"""
+from busca import SEPARADOR_NOMES, parsear_nomes
+
+
+def _lista(valor):
+    if isinstance(valor, (list, tuple)):
+        return [nome for nome in valor if nome]
+    return parsear_nomes(valor)
+
+
+def atualizar_com_versao(conn, tabela, registro_id, versao, valores):
+    """
+    UPDATE de `valores` ({coluna: valor}) com versao = versao + 1 se a versão no
+    banco ainda for `versao` (None = sem verificação, ex.: formulário antigo).
+    Retorna True se gravou; False se a linha mudou (ou sumiu) desde a leitura.
+    """
+    colunas = [f'{coluna} = ?' for coluna in valores] + ['versao = versao + 1']
+    params = list(valores.values()) + [registro_id]
+    query = f"UPDATE {tabela} SET {', '.join(colunas)} WHERE id = ?"
+    if versao is not None:
+        query += ' AND versao = ?'
+        params.append(versao)
+    return conn.execute(query, params).rowcount == 1
+
+
+def versao_do_formulario(form):
+    """Versão enviada pelo formulário (campo oculto `versao`) ou None"""
+    valor = (form.get('versao') or '').strip()
+    return int(valor) if valor.isdigit() else None
+
+
+def base_do_formulario(form, campos):
+    """Valores originais enviados nos campos ocultos base_<campo>"""
+    return {campo: form.get(f'base_{campo}', '') for campo in campos}
+
+
+def mesclar(base, minha, atual, campos_lista=(), campos_simples=()):
+    """
+    Mescla a edição (`minha`) com o estado salvo por outra pessoa (`atual`), ambos
+    a partir de `base`. Listas: ficam os nomes atuais, mais os que eu incluí, menos
+    os que eu retirei. Campos simples: vale o lado que mudou; se os dois mudaram
+    para valores diferentes, vale o meu e o campo é listado em conflitos.
+    Retorna (mesclado, conflitos) com as listas como listas de nomes.
+    """
+    mesclado = {}
+    conflitos = []
+    for campo in campos_lista:
+        antes, meus, deles = _lista(base.get(campo)), _lista(minha.get(campo)), _lista(atual.get(campo))
+        incluidos = [nome for nome in meus if nome not in antes]
+        retirados = set(antes) - set(meus)
+        resultado = [nome for nome in deles if nome not in retirados]
+        resultado += [nome for nome in incluidos if nome not in resultado]
+        mesclado[campo] = resultado
+    for campo in campos_simples:
+        antes, meu, deles = base.get(campo) or '', minha.get(campo) or '', atual.get(campo) or ''
+        if meu == antes:
+            mesclado[campo] = deles
+        else:
+            mesclado[campo] = meu
+            if deles != antes and deles != meu:
+                conflitos.append(campo)
+    return mesclado, conflitos
+
+
+def comparacao(minha, atual, mesclado, rotulos, campos_lista=()):
+    """Linhas da tela de conflito, uma por campo de `rotulos` ({campo: rótulo}, na ordem de exibição)"""
+    def texto(campo, valor):
+        return SEPARADOR_NOMES.join(_lista(valor)) if campo in campos_lista else (valor or '')
+    linhas = []
+    for campo, rotulo in rotulos.items():
+        linha = {'rotulo': rotulo, 'minha': texto(campo, minha.get(campo)),
+                 'atual': texto(campo, atual.get(campo)), 'mesclado': texto(campo, mesclado.get(campo))}
+        linha['diferente'] = linha['minha'] != linha['atual']
+        linhas.append(linha)
+    return linhas
+
+
+def montar_conflito(versao_lida, base, minha, atual, rotulos, campos_lista=(), campos_simples=()):
+    """
+    (mesclado, conflito) para mostrar a tela de edição de novo depois de um
+    conflito de versão; `conflito` alimenta templates/conflito_versao.html.
+    """
+    atual = dict(atual)
+    mesclado, conflitos = mesclar(base, minha, atual, campos_lista, campos_simples)
+    return mesclado, {
+        'versao_lida': versao_lida,
+        'versao_atual': atual.get('versao'),
+        'campos_em_conflito': [rotulos[campo] for campo in conflitos],
+        'linhas': comparacao(minha, atual, mesclado, rotulos, campos_lista),
+    }
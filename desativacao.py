@@ -0,0 +1,141 @@
+"""
+Desativação de pessoas
+Remover uma pessoa não apaga mais a linha de pessoas: ela fica com ativo = 0 e
+a data da desativação (desativado_em, AAAA-MM-DD), e some do cadastro, do
+gerador e das sugestões de nomes. O histórico (escalas passadas, frequência)
+continua com o nome.
+
+limpar() retira as pessoas desativadas das escalas a partir de uma data e dos
+candidatos dos modelos, em conjunto e na transação de quem chamou:
+- modelos: um DELETE em template_candidatos para todas as pessoas;
+- escalas: as ocorrências vêm do índice escala_membros e busca.reescrever_nomes
+  tira os nomes das listas; só as escalas que mudam são gravadas, versionadas e
+  reindexadas;
+- rollups e visão do mês são recalculados uma vez por mês afetado.
+
+Uso (limpeza de pessoas já desativadas, ex.: depois de restaurar um backup):
+    python desativacao.py [--a-partir-de AAAA-MM-DD]
+"""
+import argparse
+import sys
+from datetime import date
+
+import busca
+import rollups
+import visao_mes
+from database import get_db_connection, marcadores
+
+
+def desativar(conn, pessoa_ids, hoje=None):
+    """
+    Marca as pessoas como inativas e as retira das escalas a partir de `hoje`
+    (date, padrão: hoje) e dos modelos, sem commit. Retorna o resultado de limpar().
+    """
+    hoje = (hoje or date.today()).isoformat()
+    pessoa_ids = sorted(set(pessoa_ids))
+    if not pessoa_ids:
+        return limpar(conn, hoje, [])
+    conn.execute(
+        f'''UPDATE pessoas SET ativo = 0, desativado_em = ?, versao = versao + 1
+            WHERE id IN ({marcadores(pessoa_ids)}) AND ativo = 1''',
+        [hoje] + pessoa_ids
+    )
+    return limpar(conn, hoje, pessoa_ids)
+
+
+def reativar(conn, pessoa_id):
+    """Volta a pessoa ao cadastro (as escalas de que foi retirada não são refeitas). Retorna True se mudou."""
+    return conn.execute(
+        'UPDATE pessoas SET ativo = 1, desativado_em = NULL, versao = versao + 1 WHERE id = ? AND ativo = 0',
+        (pessoa_id,)
+    ).rowcount == 1
+
+
+def limpar(conn, a_partir_de, pessoa_ids=None):
+    """
+    Retira as pessoas inativas (todas ou só `pessoa_ids`) das escalas com data
+    >= `a_partir_de` (AAAA-MM-DD) e dos modelos, sem commit. Retorna
+    {'escalas': [{'id', 'data', 'antes', 'depois'}], 'modelos': [ids], 'meses': [(ano, mes)]},
+    com antes/depois só das colunas de nomes que mudaram.
+    """
+    resultado = {'escalas': [], 'modelos': [], 'meses': []}
+    query = 'SELECT id, nome FROM pessoas WHERE ativo = 0'
+    params = []
+    if pessoa_ids is not None:
+        if not pessoa_ids:
+            return resultado
+        query += f' AND id IN ({marcadores(pessoa_ids)})'
+        params = list(pessoa_ids)
+    inativas = conn.execute(query, params).fetchall()
+    if not inativas:
+        return resultado
+    ids = [row['id'] for row in inativas]
+    nomes = sorted(row['nome'] for row in inativas)
+
+    # Modelos: os candidatos saem de uma vez; a versão dos modelos tocados sobe
+    resultado['modelos'] = [row['template_id'] for row in conn.execute(
+        f'SELECT DISTINCT template_id FROM template_candidatos WHERE pessoa_id IN ({marcadores(ids)}) ORDER BY template_id',
+        ids
+    ).fetchall()]
+    if resultado['modelos']:
+        conn.execute(
+            f"UPDATE escala_templates SET versao = versao + 1 WHERE id IN ({marcadores(resultado['modelos'])})",
+            resultado['modelos']
+        )
+        conn.execute(f'DELETE FROM template_candidatos WHERE pessoa_id IN ({marcadores(ids)})', ids)
+
+    # Escalas: ocorrências pelo índice; as listas são refeitas aqui e só o que muda é gravado
+    ocorrencias = conn.execute(
+        f'SELECT escala_id, funcao FROM escala_membros WHERE nome IN ({marcadores(nomes)}) AND data_iso >= ?',
+        nomes + [a_partir_de]
+    ).fetchall()
+    if not ocorrencias:
+        return resultado
+    funcoes_por_id = {}
+    for row in ocorrencias:
+        funcoes_por_id.setdefault(row['escala_id'], set()).add(row['funcao'])
+    removidos = set(nomes)
+    alteradas = busca.reescrever_nomes(conn, funcoes_por_id,
+                                       lambda lista: [nome for nome in lista if nome not in removidos])
+
+    meses = set()
+    for escala, novos in sorted(alteradas.values(), key=lambda item: (busca.data_para_iso(item[0]['data']), item[0]['tipo_escala'])):
+        resultado['escalas'].append({'id': escala['id'], 'data': escala['data'],
+                                     'antes': {funcao: escala[funcao] for funcao in novos},
+                                     'depois': dict(novos)})
+        _, mes, ano = escala['data'].split('/')
+        meses.add((int(ano), int(mes)))
+    for ano, mes in sorted(meses):
+        rollups.atualizar_mes(conn, mes, ano)
+        visao_mes.atualizar_mes(conn, mes, ano)
+    resultado['meses'] = sorted(meses)
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retira as pessoas desativadas das escalas futuras e dos modelos")
+    parser.add_argument('--a-partir-de', default=date.today().isoformat(), help="data inicial (AAAA-MM-DD, padrão: hoje)")
+    args = parser.parse_args(argv)
+
+    import alteracoes
+    import caches
+    import notificacoes
+    conn = get_db_connection()
+    try:
+        resultado = limpar(conn, args.a_partir_de)
+        for escala in resultado['escalas']:
+            alteracoes.registrar_escala(conn, 'atualizar', escala['id'], escala['data'], escala['antes'], escala['depois'],
+                                        autor='linha de comando')
+        escopos = ['modelos'] if resultado['modelos'] else []
+        for ano, mes in resultado['meses']:
+            escopos.extend(caches.escopos_do_mes(ano, mes))
+        notificacoes.confirmar(conn, *escopos)
+        print(f"Limpeza concluída: {len(resultado['escalas'])} escala(s) em {len(resultado['meses'])} mês(es), "
+              f"{len(resultado['modelos'])} modelo(s).")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
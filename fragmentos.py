@@ -0,0 +1,75 @@
+"""
+Cache de templates
+- Bytecode: o Jinja grava os templates compilados em disco (JINJA_CACHE_DIR,
+  padrão: pasta temporária do sistema). Um processo novo (cold start no
+  serverless) carrega o bytecode em vez de compilar index.html de novo; o
+  arquivo é descartado sozinho quando o template muda.
+- Fragmentos: partes das páginas que só dependem de um conjunto de dados são
+  renderizadas uma vez por versão desses dados e guardadas já como HTML (a
+  seleção de pessoas pela versão do cadastro; a lista de escalas e os eventos
+  do calendário de cada mês pela versão do mês). Assim uma página só renderiza
+  de novo o que mudou.
+
+Para gerar o bytecode de todos os templates na implantação (antes do primeiro acesso):
+    python fragmentos.py
+"""
+import os
+import sys
+import tempfile
+
+from cachetools import TTLCache
+from flask import current_app, render_template
+from jinja2 import FileSystemBytecodeCache
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
+
+import caches
+
+DIRETORIO_BYTECODE = os.environ.get('JINJA_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'appigreja-jinja')
+
+# {(template ou 'json', *chave): Markup}; as chaves levam as versões dos dados, o TTL só libera memória
+_fragmentos = TTLCache(maxsize=256, ttl=3600)
+
+
+def cache_de_bytecode(diretorio=DIRETORIO_BYTECODE):
+    """FileSystemBytecodeCache em `diretorio`, ou None se não der para gravar nele"""
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+    except OSError as e:
+        print(f"Cache de bytecode dos templates desativado ({diretorio}): {e}")
+        return None
+    return FileSystemBytecodeCache(diretorio)
+
+
+def renderizar(template, chave, **contexto):
+    """
+    HTML (Markup) do template parcial. Com `chave` (que deve incluir as versões
+    dos dados usados), renderiza uma vez por chave; com None, sempre renderiza.
+    """
+    if chave is None:
+        return Markup(render_template(template, **contexto))
+    return caches.obter_ou_calcular(_fragmentos, (template,) + tuple(chave),
+                                    lambda: Markup(render_template(template, **contexto)))
+
+
+def json_seguro(chave, valor):
+    """`valor` como o filtro tojson (JSON seguro dentro de <script>), serializado uma vez por chave"""
+    def serializar():
+        return Markup(htmlsafe_json_dumps(valor, dumps=current_app.json.dumps))
+    if chave is None:
+        return serializar()
+    return caches.obter_ou_calcular(_fragmentos, ('json',) + tuple(chave), serializar)
+
+
+def compilar_templates(app):
+    """Carrega todos os templates (o que grava o bytecode em disco). Retorna quantos."""
+    nomes = app.jinja_env.list_templates(extensions=['html'])
+    for nome in nomes:
+        app.jinja_env.get_template(nome)
+    return len(nomes)
+
+
+if __name__ == '__main__':
+    from app import app as aplicacao
+    print(f"{compilar_templates(aplicacao)} template(s) compilado(s) em {DIRETORIO_BYTECODE}")
+    sys.exit(0)
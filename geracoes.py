@@ -0,0 +1,294 @@
+"""
+Execuções do gerador (tabela geracoes)
+Cada geração guarda a semente, as entradas (instantâneo de pessoas, modelos,
+dias de missa, ausências e escalas mantidas) e as escalas produzidas. Como
+gerador.gerar é determinístico, qualquer geração pode ser reproduzida
+exatamente, e rodar a versão atual do gerador sobre as entradas de uma geração
+antiga mostra se o resultado e o tempo mudaram.
+
+melhor_de() sorteia várias candidatas do mesmo mês, pontua cada uma com
+gerador.pontuar e fica com a de menor pontuação; a semente gravada é a da
+vencedora. Por padrão as candidatas são sorteadas em sequência: cada uma leva
+poucos milissegundos e um pool de processos custa mais do que economiza (iniciar
+os processos leva ~1 s, o que pesa no cold start do serverless). O pool é
+opcional (GERACAO_PROCESSOS > 1), para servidores de longa duração que usam
+muitas candidatas.
+
+Pedidos simultâneos para o mesmo mês não geram em paralelo: voo_unico() faz
+quem chega depois, no mesmo processo, esperar a geração em andamento e receber
+o mesmo resultado, e travar_mes() serializa as gerações do mês entre processos
+(pg_advisory_xact_lock no PostgreSQL, a tabela travas_geracao no SQLite).
+"""
+import json
+import multiprocessing
+import os
+import secrets
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from threading import Event, Lock
+
+import gerador
+from database import USE_POSTGRES, inserir_retornando_id
+
+# Quantas candidatas sortear por geração e quantos processos usar (1 = sem pool)
+CANDIDATOS_POR_GERACAO = int(os.environ.get('GERACAO_CANDIDATOS', '8'))
+PROCESSOS = int(os.environ.get('GERACAO_PROCESSOS', '1'))
+
+# Primeiro inteiro da trava consultiva do PostgreSQL (o segundo é ano * 100 + mes),
+# para não colidir com outras travas consultivas do mesmo banco
+TRAVA_GERACAO = 4501
+
+_pool = None
+_pool_lock = Lock()
+
+_voos = {}  # (ano, mes) -> _Voo da geração em andamento neste processo
+_voos_lock = Lock()
+
+
+def nova_semente():
+    # 31 bits: cabe em INTEGER no SQLite e em BIGINT no PostgreSQL com folga
+    return secrets.randbits(31)
+
+
+def resumo(contagem):
+    """Indicadores de equilíbrio de uma geração a partir da contagem de serviços"""
+    total = len(contagem)
+    com_2_ou_mais = sum(1 for c in contagem.values() if c >= 2)
+    return {
+        'pessoas': total,
+        'sem_servico': sum(1 for c in contagem.values() if c == 0),
+        'com_2_ou_mais': com_2_ou_mais,
+        'percentual_meta': (com_2_ou_mais / total * 100) if total else 0,
+    }
+
+
+class Execucao:
+    """Uma execução do gerador: entradas + semente -> resultado, com o tempo gasto e a pontuação"""
+    def __init__(self, entradas, semente=None, versao_gerador=None):
+        self.entradas = entradas
+        self.semente = nova_semente() if semente is None else int(semente)
+        self.versao_gerador = gerador.VERSAO_GERADOR if versao_gerador is None else versao_gerador
+        self.resultado = None
+        self.duracao_ms = None
+        self.pontuacao = None
+        self.candidatas = []  # [{'semente', 'total'}] quando veio de melhor_de()
+        self.duracao_total_ms = None
+
+    def executar(self):
+        inicio = time.perf_counter()
+        self.resultado = gerador.gerar(self.entradas, self.semente)
+        self.duracao_ms = (time.perf_counter() - inicio) * 1000
+        self.pontuacao = gerador.pontuar(self.entradas, self.resultado)
+        return self.resultado
+
+
+def _executar_candidata(entradas, semente):
+    # Função de módulo para poder ser enviada ao pool de processos
+    execucao = Execucao(entradas, semente)
+    execucao.executar()
+    return execucao.semente, execucao.resultado, execucao.duracao_ms, execucao.pontuacao
+
+
+def _obter_pool():
+    """
+    Pool de processos reutilizado entre gerações (criar um a cada requisição custaria
+    mais que o sorteio). Os processos são iniciados com spawn: um fork do processo do
+    Flask copiaria threads (a de notificacoes, as das requisições) e travas no meio do
+    uso, e o filho poderia ficar preso para sempre numa trava que ninguém vai soltar.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PROCESSOS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def melhor_de(entradas, n=None, semente=None):
+    """
+    Sorteia n candidatas e devolve a Execucao de menor pontuação (empate: a primeira).
+    Com `semente`, repete exatamente aquele sorteio (uma única candidata).
+    """
+    if semente is not None:
+        execucao = Execucao(entradas, semente)
+        execucao.executar()
+        execucao.candidatas = [{'semente': execucao.semente, 'total': execucao.pontuacao['total']}]
+        execucao.duracao_total_ms = execucao.duracao_ms
+        return execucao
+
+    n = max(1, n or CANDIDATOS_POR_GERACAO)
+    sementes = []
+    while len(sementes) < n:
+        nova = nova_semente()
+        if nova not in sementes:
+            sementes.append(nova)
+
+    inicio = time.perf_counter()
+    saidas = None
+    # Sem pool configurado, ou com uma candidata só, sorteia aqui mesmo
+    if n > 1 and PROCESSOS > 1:
+        try:
+            pool = _obter_pool()
+            saidas = list(pool.map(_executar_candidata, [entradas] * n, sementes))
+        except (BrokenProcessPool, OSError, NotImplementedError) as e:
+            # Ambientes sem multiprocessing (ex.: algumas plataformas serverless): sortear aqui mesmo
+            print(f"AVISO: pool de processos indisponível, sorteando as candidatas em sequência: {e}")
+            _descartar_pool()
+    if saidas is None:
+        saidas = [_executar_candidata(entradas, s) for s in sementes]
+
+    melhor = min(range(n), key=lambda i: saidas[i][3]['total'])
+    execucao = Execucao(entradas, sementes[melhor])
+    _, execucao.resultado, execucao.duracao_ms, execucao.pontuacao = saidas[melhor]
+    # duracao_ms é a da vencedora (comparável com uma reprodução); este é o custo de escolher entre todas
+    execucao.duracao_total_ms = (time.perf_counter() - inicio) * 1000
+    execucao.candidatas = [{'semente': s, 'total': saida[3]['total']} for s, saida in zip(sementes, saidas)]
+    return execucao
+
+
+class _Voo:
+    """Uma geração em andamento; quem chega depois espera `concluido`"""
+    def __init__(self, parametros):
+        self.parametros = parametros
+        self.concluido = Event()
+        self.resultado = None
+        self.erro = None
+
+
+def voo_unico(ano, mes, parametros, funcao):
+    """
+    Executa funcao() no máximo uma vez por vez para (ano, mes) neste processo.
+    Quem chega enquanto outra geração do mês está em andamento espera por ela:
+    com os mesmos `parametros`, recebe o mesmo resultado (ou o mesmo erro) sem
+    gerar de novo; com parâmetros diferentes, espera terminar e gera a sua.
+    Retorna (resultado, compartilhado).
+    """
+    chave = (ano, mes)
+    while True:
+        with _voos_lock:
+            voo = _voos.get(chave)
+            if voo is None:
+                voo = _voos[chave] = _Voo(parametros)
+                break
+        voo.concluido.wait()
+        if voo.parametros == parametros:
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado, True
+
+    try:
+        voo.resultado = funcao()
+        return voo.resultado, False
+    except Exception as e:
+        voo.erro = e
+        raise
+    finally:
+        with _voos_lock:
+            del _voos[chave]
+        voo.concluido.set()
+
+
+def travar_mes(conn, ano, mes):
+    """
+    Trava a geração de (ano, mes) entre processos até o commit/rollback de `conn`.
+    Deve vir antes de ler e apagar as escalas do mês, para que a segunda geração
+    leia o que a primeira gravou. Levanta ValueError se a espera esgotar (SQLite).
+    """
+    if USE_POSTGRES:
+        conn.execute('SELECT pg_advisory_xact_lock(?, ?)', (TRAVA_GERACAO, ano * 100 + mes))
+        return
+    # Gravar a linha já pega a trava de escrita do banco, mantida até o fim da transação
+    # (e evita que a transação comece só lendo e falhe ao tentar escrever depois, no WAL)
+    try:
+        conn.execute(
+            '''INSERT INTO travas_geracao (ano, mes, criado_em) VALUES (?, ?, ?)
+               ON CONFLICT (ano, mes) DO UPDATE SET criado_em = excluded.criado_em''',
+            (ano, mes, datetime.now().isoformat(timespec='seconds'))
+        )
+    except sqlite3.OperationalError as e:
+        if 'locked' not in str(e):
+            raise
+        raise ValueError(f"A escala de {mes}/{ano} está sendo gerada em outro processo; tente novamente em instantes.")
+
+
+def salvar(conn, execucao):
+    """Grava a execução na transação de `conn` (sem commit) e retorna o id"""
+    return inserir_retornando_id(
+        conn,
+        '''INSERT INTO geracoes (ano, mes, semente, versao_gerador, entradas, saidas, pontuacao, duracao_ms, criado_em)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (execucao.entradas['ano'], execucao.entradas['mes'], execucao.semente, execucao.versao_gerador,
+         json.dumps(execucao.entradas, ensure_ascii=False, separators=(',', ':')),
+         json.dumps(execucao.resultado, ensure_ascii=False, separators=(',', ':')),
+         json.dumps(dict(execucao.pontuacao, candidatas=execucao.candidatas,
+                         duracao_total_ms=execucao.duracao_total_ms), separators=(',', ':')),
+         round(execucao.duracao_ms, 3), datetime.now().isoformat(timespec='seconds'))
+    )
+
+
+def carregar(conn, geracao_id):
+    """Execução gravada (com o resultado original) ou None"""
+    row = conn.execute('SELECT * FROM geracoes WHERE id = ?', (geracao_id,)).fetchone()
+    if row is None:
+        return None
+    execucao = Execucao(json.loads(row['entradas']), row['semente'], row['versao_gerador'])
+    execucao.resultado = json.loads(row['saidas'])
+    execucao.duracao_ms = row['duracao_ms']
+    return execucao
+
+
+def listar(conn, limite=50):
+    """Gerações mais recentes com o resumo de equilíbrio de cada uma"""
+    rows = conn.execute(
+        'SELECT id, ano, mes, semente, versao_gerador, saidas, pontuacao, duracao_ms, criado_em FROM geracoes ORDER BY id DESC LIMIT ?',
+        (limite,)
+    ).fetchall()
+    geracoes = []
+    for row in rows:
+        registro = dict(row)
+        saidas = json.loads(registro.pop('saidas'))
+        registro['total_escalas'] = len(saidas['escalas'])
+        registro.update(resumo(saidas['contagem']))
+        registro['pontuacao'] = json.loads(registro['pontuacao']) if registro['pontuacao'] else None
+        geracoes.append(registro)
+    return geracoes
+
+
+def reproduzir(conn, geracao_id):
+    """
+    Roda o gerador atual com as entradas e a semente gravadas e compara com o
+    resultado original. Retorna None se a geração não existir.
+    """
+    original = carregar(conn, geracao_id)
+    if original is None:
+        return None
+    nova = Execucao(original.entradas, original.semente)
+    nova.executar()
+
+    escalas_antes = original.resultado['escalas']
+    escalas_depois = nova.resultado['escalas']
+    diferentes = sum(1 for a, b in zip(escalas_antes, escalas_depois) if a != b)
+    diferentes += abs(len(escalas_antes) - len(escalas_depois))
+    return {
+        'id': geracao_id,
+        'identico': diferentes == 0,
+        'escalas_diferentes': diferentes,
+        'versao_original': original.versao_gerador,
+        'versao_atual': nova.versao_gerador,
+        'duracao_original_ms': original.duracao_ms,
+        'duracao_ms': nova.duracao_ms,
+        'resumo_original': resumo(original.resultado['contagem']),
+        'resumo_atual': resumo(nova.resultado['contagem']),
+        'pontuacao_original': gerador.pontuar(original.entradas, original.resultado)['total'],
+        'pontuacao_atual': nova.pontuacao['total'],
+    }
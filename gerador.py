@@ -0,0 +1,470 @@
+"""
+Gerador de escalas
+O sorteio de um mês é uma função de (entradas, semente) que não acessa o banco:
+as entradas são um instantâneo serializável em JSON (pessoas, modelos, dias de
+missa, ausências e, no modo incremental, as escalas mantidas) e toda a
+aleatoriedade vem de random.Random(semente). Com as mesmas entradas e a mesma
+semente o resultado é sempre o mesmo (veja geracoes.py).
+"""
+import random
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import groupby
+from operator import attrgetter
+
+import numpy as np
+
+import cadastro
+import indisponibilidades
+import liturgia
+from busca import FUNCOES_ESCALA as FUNCOES, SEPARADOR_NOMES, juntar_nomes, parsear_nomes
+from database import OperationalError
+
+# Incrementar ao mudar a lógica do sorteio, para comparar gerações antigas e novas
+VERSAO_GERADOR = 2
+
+# --- GRUPOS E TIPOS DE ESCALA (PADRONIZADO) ---
+GRUPO_MIRINS = 'mirins'
+GRUPO_VETERANO = 'veterano'
+GRUPO_CERIMONIARIO = 'cerimoniario'
+TIPO_ESCALA_DOMINGO_MANHA = 'Domingo Manhã'
+TIPO_ESCALA_DOMINGO_NOITE = 'Domingo Noite'
+
+# --- CONSTANTES DE HORÁRIOS ---
+HORARIO_DOMINGO_MANHA = '07:00'
+HORARIO_DOMINGO_NOITE = '18:00'
+HORARIO_SEMANA = '19:00'
+
+QUANTIDADES_POR_FUNCAO = {
+    'domingo_e_solenidade': {
+        # DOMINGOS: 2 Cerimoniários, 2 Veteranos, 2 Mirins, 2 Tochas, 1 Turíbulo, 1 Naveta
+        'cerimoniarios': 2, 'veteranos': 2, 'mirins': 2,
+        'turibulo': 1, 'naveta': 1, 'tochas': 2
+    },
+    'semana': {
+        # TERÇA E QUINTA: 1 Cerimoniário, 2 Veteranos, 2 Mirins
+        'cerimoniarios': 1, 'veteranos': 2, 'mirins': 2,
+        'turibulo': 0, 'naveta': 0, 'tochas': 0
+    }
+}
+
+
+# Uma missa a sortear: tudo o que depende só do calendário e de dias_missa é decidido aqui
+Missa = namedtuple('Missa', 'data data_db dia_semana tipo_escala regras modelo evento_especial solenidade celebracao')
+
+PALAVRAS_EVENTOS_ESPECIAIS = ['festejo', 'casamento', 'solenidade', 'especial', 'batizado', 'primeira comunhão', 'confirmação', 'ordenação']
+
+
+def montar_missa(data, tipo_escala, celebracao=None, solenidade=False):
+    """Missa de `tipo_escala` em `data` (date), com o modelo e as regras de quantidade"""
+    # Determinar template base - SEMPRE usar o template correspondente ao tipo_escala
+    if solenidade:
+        # Dia solene que não é domingo - usar template de domingo manhã
+        modelo = TIPO_ESCALA_DOMINGO_MANHA
+    elif "Noite" in tipo_escala or tipo_escala == TIPO_ESCALA_DOMINGO_NOITE:
+        modelo = TIPO_ESCALA_DOMINGO_NOITE
+    elif "Manhã" in tipo_escala or tipo_escala == TIPO_ESCALA_DOMINGO_MANHA:
+        modelo = TIPO_ESCALA_DOMINGO_MANHA
+    else:
+        # Usar o tipo_escala diretamente como nome do template
+        modelo = tipo_escala
+
+    dia_semana = data.weekday()
+    # Domingos e solenidades usam regras de domingo
+    if solenidade or dia_semana == 6 or tipo_escala in [TIPO_ESCALA_DOMINGO_MANHA, TIPO_ESCALA_DOMINGO_NOITE]:
+        regras = 'domingo_e_solenidade'
+    else:
+        regras = 'semana'
+    # Eventos especiais podem ter turíbulo, naveta e tochas mesmo em dias de semana
+    evento_especial = any(palavra in tipo_escala.lower() for palavra in PALAVRAS_EVENTOS_ESPECIAIS)
+    return Missa(data, data.strftime('%d/%m/%Y'), dia_semana, tipo_escala, regras, modelo,
+                 evento_especial, solenidade, celebracao)
+
+
+def _missas_do_dia(data, dia_semana, tipos_por_dia, celebracao):
+    """Missas configuradas para um dia, considerando o calendário litúrgico"""
+    if celebracao is not None and celebracao.missa_propria and dia_semana != 6:
+        # Solenidade em dia de semana: uma missa própria com regras de domingo
+        return [montar_missa(data, celebracao.nome, celebracao, solenidade=True)]
+    # Domingo solene usa as missas normais de domingo (manhã e noite)
+    return [montar_missa(data, tipo, celebracao) for tipo in tipos_por_dia.get(dia_semana, ())]
+
+
+@lru_cache(maxsize=16)
+def missas_do_ano(ano, dias_missa):
+    """
+    Missas do ano agrupadas por mês: tupla de 12 tuplas de Missa, em ordem.
+    `dias_missa` = ((dia_semana, (tipo_escala, ...)), ...), como em chave_dias_missa().
+    Os dias com missa saem de aritmética de calendário sobre o ano inteiro e o
+    resultado fica em cache por (ano, configuração): as candidatas do mesmo mês
+    e o planejamento de vários anos não repetem o trabalho.
+    """
+    tipos_por_dia = dict(dias_missa)
+    primeiro = date(ano, 1, 1)
+    dias = np.arange(np.datetime64(primeiro), np.datetime64(date(ano + 1, 1, 1)), dtype='datetime64[D]')
+    dias_semana = (dias.astype(np.int64) + 3) % 7  # 1970-01-01 foi uma quinta-feira (0=Segunda)
+    meses = dias.astype('datetime64[M]').astype(np.int64) % 12
+
+    com_missa = np.isin(dias_semana, list(tipos_por_dia))
+    celebracoes = liturgia.tabela_do_ano(ano)
+    com_missa[[(d - primeiro).days for d, c in celebracoes.items() if c.missa_propria]] = True
+
+    por_mes = [[] for _ in range(12)]
+    for indice in np.flatnonzero(com_missa).tolist():
+        data = primeiro + timedelta(days=indice)
+        por_mes[int(meses[indice])].extend(
+            _missas_do_dia(data, int(dias_semana[indice]), tipos_por_dia, celebracoes.get(data))
+        )
+    return tuple(tuple(missas) for missas in por_mes)
+
+
+def chave_dias_missa(dias_missa_map):
+    """{dia_semana: [(tipo_escala, horario), ...]} -> chave imutável para missas_do_ano"""
+    return tuple(sorted((dia, tuple(tipo for tipo, _ in tipos)) for dia, tipos in dias_missa_map.items()))
+
+
+def missas_do_mes(ano, mes, dias_missa):
+    return missas_do_ano(ano, dias_missa)[mes - 1]
+
+
+def _missas_a_refazer(missas, refazer):
+    """Modo incremental: missas do intervalo pedido mais as escalas apagadas a refazer"""
+    dia_inicio, dia_fim, escala_ids = refazer['dia_inicio'], refazer['dia_fim'], refazer['escala_ids']
+    refazer_por_data = refazer['por_data']  # {data: [tipo_escala, ...]} das escalas apagadas
+    configuradas = {}
+    for missa in missas:
+        configuradas.setdefault(missa.data, []).append(missa)
+    datas = set(configuradas) | {datetime.strptime(d, '%d/%m/%Y').date() for d in refazer_por_data}
+
+    selecionadas = []
+    for data in sorted(datas):
+        refeitos = refazer_por_data.get(data.strftime('%d/%m/%Y'), [])
+        if (escala_ids or not dia_inicio <= data.day <= dia_fim) and not refeitos:
+            # Fora do alvo: só os horários apagados deste dia (se houver) são refeitos
+            continue
+        # Escalas apagadas são refeitas mesmo que o tipo não seja gerado automaticamente
+        # (ex.: um casamento adicionado à mão); com escala_ids, apenas elas
+        do_dia = [] if escala_ids else configuradas.get(data, [])
+        tipos = {missa.tipo_escala for missa in do_dia}
+        celebracao = liturgia.celebracao_do_dia(data)
+        solenidade = celebracao is not None and celebracao.missa_propria and data.weekday() != 6
+        selecionadas += do_dia
+        selecionadas += [montar_missa(data, tipo, celebracao, solenidade) for tipo in refeitos if tipo not in tipos]
+    return selecionadas
+
+
+def montar_entradas(conn, mes, ano, escalas_mantidas=(), refazer=None):
+    """
+    Instantâneo de tudo o que o sorteio usa, a partir dos caches de referência.
+    `refazer` (modo incremental) = {'dia_inicio', 'dia_fim', 'escala_ids',
+    'por_data': {data: [tipo_escala]}, 'cores': [[data, tipo_escala, bata_cor]]}.
+    """
+    # Modelos (com candidatos de template_candidatos) e pessoas vêm do cache de referência
+    templates = cadastro.obter_modelos(conn).candidatos_por_tipo
+    pessoas = cadastro.obter_pessoas(conn)
+    try:
+        dias_missa = cadastro.obter_dias_missa(conn).ativos
+    except OperationalError:
+        # Tabela pode não existir ainda, usar configuração padrão
+        print("Tabela dias_missa não encontrada, usando configuração padrão.")
+        dias_missa = []
+
+    # Verificar se há pelo menos um template para os tipos de escala necessários
+    tipos_necessarios = {TIPO_ESCALA_DOMINGO_MANHA, TIPO_ESCALA_DOMINGO_NOITE, 'Terça', 'Quinta'}
+    templates_faltando = tipos_necessarios - set(templates.keys())
+    if templates_faltando:
+        print(f"AVISO: Alguns templates não foram encontrados: {templates_faltando}. A função tentará usar fallback.")
+    ausencias = indisponibilidades.carregar_registros(conn, mes, ano)
+    print(f"Dias de missa ativos: {[(d['dia_semana'], d['tipo_escala']) for d in dias_missa]}")
+    print(f"Templates disponíveis: {list(templates.keys())}")
+    print(f"Total de pessoas cadastradas: {len(pessoas.lista)}; ausências no mês: {len(ausencias)}")
+
+    return {
+        'mes': mes,
+        'ano': ano,
+        'pessoas': [
+            {'nome': p['nome'], 'grupo': p['grupo'], 'funcoes': sorted(pessoas.funcoes[p['nome']])}
+            for p in pessoas.lista
+        ],
+        'templates': {
+            tipo: {funcao: list(nomes) for funcao, nomes in candidatos.items()}
+            for tipo, candidatos in templates.items()
+        },
+        'dias_missa': [
+            {'dia_semana': d['dia_semana'], 'tipo_escala': d['tipo_escala'], 'horario': d['horario']}
+            for d in dias_missa
+        ],
+        'ausencias': ausencias,
+        'escalas_mantidas': [
+            {'data': e['data'], 'tipo_escala': e['tipo_escala'],
+             'nomes': [nome for funcao in FUNCOES for nome in parsear_nomes(e[funcao])]}
+            for e in escalas_mantidas
+        ],
+        'refazer': refazer,
+    }
+
+
+def gerar(entradas, semente):
+    """
+    Sorteia as escalas do mês com regras avançadas de sorteio e distribuição.
+    Retorna {'escalas': [{data, tipo_escala, bata_cor, <funções>}], 'contagem': {nome: serviços},
+    'vagas_vazias': n}.
+    Levanta ValueError se não houver pessoas ou modelos.
+    """
+    rng = random.Random(semente)
+    mes, ano = entradas['mes'], entradas['ano']
+    templates = entradas['templates']
+    pessoas_e_grupos = {p['nome']: p['grupo'] for p in entradas['pessoas']}
+    pessoas_e_funcoes = {p['nome']: frozenset(p['funcoes']) for p in entradas['pessoas']}
+    ausencias = indisponibilidades.Calendario(entradas['ausencias'])
+
+    # Modo incremental: só os dias/escalas de `refazer` são sorteados
+    refazer = entradas.get('refazer')
+    incremental = refazer is not None
+    if incremental:
+        cores_anteriores = {(data, tipo): cor for data, tipo, cor in refazer['cores']}  # para não perder a cor escolhida
+    else:
+        cores_anteriores = {}
+
+    def sortear_pessoas(lista_candidatos, quantidade, ja_escalados, data=None):
+        if not lista_candidatos: return []
+
+        candidatos_disponiveis = [nome for nome in lista_candidatos if nome not in ja_escalados]
+        # Ausências cadastradas (busca binária no calendário carregado uma vez por geração)
+        if data is not None and ausencias:
+            candidatos_disponiveis = [nome for nome in candidatos_disponiveis if not ausencias.indisponivel(nome, data)]
+        
+        # ESTRATÉGIA MELHORADA: Priorizar fortemente pessoas que ainda não serviram 2 vezes
+        # Ordenar por: primeiro quem tem menos de 2 serviços (0 ou 1), depois por quantidade de serviços
+        def prioridade_servico(nome):
+            servicos = contagem_servicos.get(nome, 0)
+            # Prioridade máxima: quem tem 0 serviços
+            if servicos == 0:
+                return (0, 0)  # Máxima prioridade
+            # Segunda prioridade: quem tem 1 serviço
+            elif servicos == 1:
+                return (1, 1)  # Alta prioridade
+            # Terceira prioridade: quem tem exatamente 2 serviços
+            elif servicos == 2:
+                return (2, 2)  # Prioridade média
+            # Última prioridade: quem já tem 3 ou mais serviços
+            else:
+                return (3, servicos)  # Baixa prioridade
+        
+        # Separar candidatos por prioridade
+        candidatos_0_servicos = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) == 0]
+        candidatos_1_servico = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) == 1]
+        candidatos_2_servicos = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) == 2]
+        candidatos_3_mais = [n for n in candidatos_disponiveis if contagem_servicos.get(n, 0) >= 3]
+        
+        # Embaralhar cada grupo para ter aleatoriedade dentro da mesma prioridade
+        rng.shuffle(candidatos_0_servicos)
+        rng.shuffle(candidatos_1_servico)
+        rng.shuffle(candidatos_2_servicos)
+        rng.shuffle(candidatos_3_mais)
+        
+        # Montar lista ordenada por prioridade
+        candidatos_ordenados = candidatos_0_servicos + candidatos_1_servico + candidatos_2_servicos + candidatos_3_mais
+        
+        # Selecionar apenas a quantidade necessária, respeitando a prioridade
+        quantidade_real = min(len(candidatos_ordenados), quantidade)
+        selecionados = candidatos_ordenados[:quantidade_real]
+
+        for nome in selecionados:
+            ja_escalados.add(nome)
+            contagem_servicos[nome] = contagem_servicos.get(nome, 0) + 1
+
+        return selecionados
+
+    # Validar que há pessoas cadastradas
+    if not pessoas_e_grupos:
+        raise ValueError("Não há pessoas cadastradas no sistema. Por favor, cadastre pessoas antes de gerar escalas.")
+    
+    # Validar que há templates configurados
+    if not templates:
+        raise ValueError("Não há modelos de escala configurados. Por favor, configure os modelos antes de gerar escalas.")
+    
+    contagem_servicos = {nome: 0 for nome in pessoas_e_grupos.keys()}
+
+    # Escalas mantidas (modo incremental) contam como serviços já feitos no mês
+    escalados_por_data = {}
+    for escala in entradas['escalas_mantidas']:
+        for nome in escala['nomes']:
+            escalados_por_data.setdefault(escala['data'], set()).add(nome)
+            if nome in contagem_servicos:
+                contagem_servicos[nome] += 1
+
+    # Configuração de dias de missa (instantâneo das linhas ativas)
+    # IMPORTANTE: Na geração automática, apenas gerar para Domingo, Terça e Quinta
+    # 0=Segunda, 1=Terça, 2=Quarta, 3=Quinta, 4=Sexta, 5=Sábado, 6=Domingo
+    DIAS_PERMITIDOS_GERACAO = {6, 1, 3}  # Domingo, Terça, Quinta
+    
+    dias_missa_config = entradas['dias_missa']
+    
+    dias_missa_map = {}  # {dia_semana: [(tipo_escala, horario), ...]}
+    for config in dias_missa_config:
+        try:
+            dia_sem = config['dia_semana']
+            # FILTRO: Apenas incluir dias permitidos na geração automática
+            if dia_sem not in DIAS_PERMITIDOS_GERACAO:
+                continue
+                
+            tipo_escala = config['tipo_escala']
+            # Verificar se a coluna horario existe e não é None
+            horario = ''
+            try:
+                horario_val = config['horario']
+                horario = horario_val if horario_val else ''
+            except (KeyError, IndexError):
+                horario = ''
+            
+            if dia_sem not in dias_missa_map:
+                dias_missa_map[dia_sem] = []
+            dias_missa_map[dia_sem].append((tipo_escala, horario))
+        except (KeyError, IndexError) as e:
+            print(f"Erro ao processar configuração de dia de missa: {e}")
+            continue
+    
+    # Se não houver configuração no banco, usar padrão: Domingo (manhã e noite), Terça, Quinta
+    if not dias_missa_map:
+        print("Usando configuração padrão: Domingo (Manhã e Noite), Terça, Quinta")
+        dias_missa_map = {
+            6: [(TIPO_ESCALA_DOMINGO_MANHA, HORARIO_DOMINGO_MANHA), (TIPO_ESCALA_DOMINGO_NOITE, HORARIO_DOMINGO_NOITE)],  # Domingo
+            1: [('Terça', HORARIO_SEMANA)],  # Terça
+            3: [('Quinta', HORARIO_SEMANA)]  # Quinta
+        }
+
+    # Missas do mês já expandidas (em cache por ano e configuração de dias de missa)
+    missas = missas_do_mes(ano, mes, chave_dias_missa(dias_missa_map))
+    if incremental:
+        missas = _missas_a_refazer(missas, refazer)
+
+    # Candidatos aptos e regras dependem só do modelo e do tipo de missa: calculados uma vez
+    todas_pessoas_nomes = list(pessoas_e_grupos.keys())
+    # Para funções especiais sem candidatos no modelo, apenas pessoas com a função cadastrada
+    # (NUNCA todas as pessoas como fallback)
+    pessoas_com_funcao = {
+        funcao: [nome for nome in todas_pessoas_nomes if funcao in pessoas_e_funcoes.get(nome, set())]
+        for funcao in ('turibulo', 'naveta', 'tochas')
+    }
+    aptos_por_modelo = {}
+    regras_por_missa = {}
+
+    def aptos_do_modelo(modelo):
+        if modelo in aptos_por_modelo:
+            return aptos_por_modelo[modelo]
+        # SEMPRE tentar usar o template - se não existir, usar fallback
+        if modelo in templates:
+            template = templates[modelo]
+        else:
+            print(f"AVISO: Template '{modelo}' não encontrado. Usando fallback com todas as pessoas.")
+            template = {}
+        # Se o template estiver vazio, usar todas as pessoas do grupo correspondente
+        aptos = {
+            'cerimoniarios': template.get('cerimoniarios') or [nome for nome in todas_pessoas_nomes if pessoas_e_grupos.get(nome) == GRUPO_CERIMONIARIO],
+            'veteranos': template.get('veteranos') or [nome for nome in todas_pessoas_nomes if pessoas_e_grupos.get(nome) == GRUPO_VETERANO],
+            'mirins': template.get('mirins') or [nome for nome in todas_pessoas_nomes if pessoas_e_grupos.get(nome) == GRUPO_MIRINS],
+        }
+        for funcao, com_funcao in pessoas_com_funcao.items():
+            aptos[funcao] = template.get(funcao) or com_funcao
+        # Garantir que apenas pessoas que existem no banco sejam consideradas
+        aptos = {funcao: [nome for nome in nomes if nome in pessoas_e_grupos] for funcao, nomes in aptos.items()}
+        aptos_por_modelo[modelo] = (template, aptos)
+        return template, aptos
+
+    def regras_da_missa(missa, template):
+        chave = (missa.regras, missa.evento_especial, missa.modelo)
+        if chave not in regras_por_missa:
+            regras_qtd = dict(QUANTIDADES_POR_FUNCAO[missa.regras])
+            # Evento especial em dia de semana: funções especiais se o template tiver candidatos
+            if missa.regras == 'semana' and missa.evento_especial:
+                if template.get('turibulo'):
+                    regras_qtd['turibulo'] = 1
+                if template.get('naveta'):
+                    regras_qtd['naveta'] = 1
+                if template.get('tochas'):
+                    regras_qtd['tochas'] = 2
+            regras_por_missa[chave] = regras_qtd
+        return regras_por_missa[chave]
+
+    escalas = []
+    vagas_vazias = 0  # Funções que ficaram com menos pessoas que o previsto (faltaram candidatos)
+    for data_db, missas_do_dia in groupby(missas, key=attrgetter('data_db')):
+        # Previne repetição no mesmo dia em funções diferentes (inclui escalas mantidas)
+        escalados_no_dia_inteiro = set(escalados_por_data.get(data_db, ()))
+        escalados_domingo = set(escalados_no_dia_inteiro)  # Previne repetição entre manhã e noite no domingo
+
+        for missa in missas_do_dia:
+            tipo_escala = missa.tipo_escala
+            # Se for domingo (incluindo domingo solene), garantir que ninguém serve na manhã E à noite
+            is_domingo = missa.dia_semana == 6
+            template, aptos = aptos_do_modelo(missa.modelo)
+            regras_qtd = regras_da_missa(missa, template)
+
+            # Para domingos, garantir que ninguém serve na manhã E à noite
+            # Se for domingo, usar escalados_domingo além de escalados_no_dia_inteiro
+            conjunto_restricao = escalados_no_dia_inteiro.copy()
+            if is_domingo:
+                conjunto_restricao.update(escalados_domingo)
+            
+            # ESTRATÉGIA: Sempre priorizar pessoas com menos de 2 serviços
+            # Se houver pessoas com menos de 2 serviços disponíveis, tentar usá-las primeiro
+            selecionados = {
+                funcao: sortear_pessoas(aptos[funcao], regras_qtd[funcao], conjunto_restricao, missa.data)
+                for funcao in FUNCOES
+            }
+            todos_escalados_esta_missa = [nome for funcao in FUNCOES for nome in selecionados[funcao]]
+            vagas_vazias += sum(regras_qtd[funcao] for funcao in FUNCOES) - len(todos_escalados_esta_missa)
+            
+            # Adicionar todos os escalados ao conjunto do dia
+            escalados_no_dia_inteiro.update(todos_escalados_esta_missa)
+            
+            # Se for domingo, adicionar também ao conjunto de domingo para prevenir repetição entre manhã/noite
+            if is_domingo:
+                escalados_domingo.update(todos_escalados_esta_missa)
+            nova_escala = {funcao: juntar_nomes(selecionados[funcao]) for funcao in FUNCOES}
+            nova_escala.update({
+                'data': data_db, 'tipo_escala': tipo_escala,
+                'bata_cor': (cores_anteriores.get((data_db, tipo_escala))
+                             or (missa.celebracao.bata_cor if missa.celebracao else liturgia.BATA_BRANCA))
+            })
+            escalas.append(nova_escala)
+
+    return {'escalas': escalas, 'contagem': contagem_servicos, 'vagas_vazias': vagas_vazias}
+
+
+# Pesos do objetivo de equilíbrio/cobertura (quanto menor a pontuação, melhor a escala)
+PESOS_PONTUACAO = {
+    'abaixo_de_2': 10,    # pessoas com menos de 2 serviços no mês
+    'vagas_vazias': 8,    # funções que ficaram sem gente suficiente
+    'domingo_duplo': 5,   # pessoa em duas missas do mesmo domingo
+    'repeticoes': 1,      # mesma pessoa de novo no mesmo tipo de missa no mês
+}
+
+
+def pontuar(entradas, resultado):
+    """Pontuação de um resultado de gerar(): {'total': n, <critério>: quantidade, ...}"""
+    contagem = resultado['contagem']
+    nomes_por_escala = [(e['data'], e['tipo_escala'], e['nomes']) for e in entradas['escalas_mantidas']]
+    nomes_por_escala += [
+        (e['data'], e['tipo_escala'], [nome for funcao in FUNCOES for nome in parsear_nomes(e[funcao])])
+        for e in resultado['escalas']
+    ]
+    missas_no_domingo = {}
+    por_tipo = {}
+    for data, tipo_escala, nomes in nomes_por_escala:
+        domingo = datetime.strptime(data, '%d/%m/%Y').weekday() == 6
+        for nome in set(nomes):
+            por_tipo[(tipo_escala, nome)] = por_tipo.get((tipo_escala, nome), 0) + 1
+            if domingo:
+                missas_no_domingo[(data, nome)] = missas_no_domingo.get((data, nome), 0) + 1
+
+    detalhes = {
+        'abaixo_de_2': sum(1 for c in contagem.values() if c < 2),
+        'vagas_vazias': resultado.get('vagas_vazias', 0),
+        'domingo_duplo': sum(1 for n in missas_no_domingo.values() if n > 1),
+        'repeticoes': sum(n - 1 for n in por_tipo.values() if n > 1),
+    }
+    detalhes['total'] = sum(PESOS_PONTUACAO[criterio] * valor for criterio, valor in detalhes.items())
+    return detalhes
@@ -0,0 +1,190 @@
+"""
+Importação de pessoas em massa (planilha .xlsx ou .csv)
+A planilha precisa de uma linha de cabeçalho com as colunas Nome e Grupo;
+Funções é opcional (ex.: "Turíbulo, Tochas"). O arquivo é lido linha a linha
+(openpyxl em modo read_only, csv em streaming), cada linha é validada e as
+pessoas novas ou alteradas são gravadas com INSERT ... ON CONFLICT (nome) em
+lotes de muitas linhas por comando, na transação de quem chamou.
+
+Grupos aceitos: cerimoniário, veterano, mirim/mirins (com ou sem acento, em
+qualquer caixa). Funções aceitas: turíbulo, naveta, tochas.
+"""
+import codecs
+import csv
+import io
+
+import busca
+from database import USE_POSTGRES
+
+GRUPOS = {
+    'cerimoniario': 'cerimoniario', 'cerimoniarios': 'cerimoniario', 'mestre de cerimonia': 'cerimoniario',
+    'veterano': 'veterano', 'veteranos': 'veterano', 'experiente': 'veterano', 'experientes': 'veterano',
+    'mirim': 'mirins', 'mirins': 'mirins',
+}
+FUNCOES = ['turibulo', 'naveta', 'tochas']
+COLUNAS = {
+    'nome': 'nome', 'pessoa': 'nome',
+    'grupo': 'grupo', 'grupo principal': 'grupo',
+    'funcoes': 'funcoes', 'funcao': 'funcoes', 'funcoes adicionais': 'funcoes',
+}
+
+# Linhas por comando: 4 parâmetros por linha, abaixo do limite de variáveis de SQLites antigos (999)
+LINHAS_POR_COMANDO = 1000 if USE_POSTGRES else 200
+
+# Elenco inicial, usado quando o banco está vazio e não há planilha para importar
+PESSOAS_INICIAIS = {
+    'cerimoniario': [
+        "Alejandro", "João Pedro", "Pedro Reis", "Adriano",
+        "Lucas", "André", "Pedro Barroso"
+    ],
+    'veterano': [
+        "Ana Julia", "Vitória", "Sofia Reis", "Armando", "Karla",
+        "Mateus", "João Raffael", "Pedro Cutrim", "Gabriel Mendes"
+    ],
+    'mirins': [
+        "João Gabriel", "Luiza", "Miguel", "Rafael", "Antony",
+        "Maria Celida", "Cauan", "Theo", "Alexia", "Davi Barbalho",
+        "Helisa", "Thiago Alex", "Gabriel Carvalho", "Mariana Jansen",
+        "Bernardo"
+    ]
+}
+
+
+class Resultado:
+    """Contagens e mensagens de uma importação"""
+    def __init__(self):
+        self.inseridos = []   # nomes
+        self.atualizados = []
+        self.ignorados = []   # mensagens (linha e motivo)
+
+    def resumo(self):
+        return (f"{len(self.inseridos)} inserida(s), {len(self.atualizados)} atualizada(s), "
+                f"{len(self.ignorados)} ignorada(s)")
+
+
+def linhas_iniciais():
+    """PESSOAS_INICIAIS no formato de ler_arquivo(): (número da linha, {'nome', 'grupo', 'funcoes'})"""
+    numero = 0
+    for grupo, nomes in PESSOAS_INICIAIS.items():
+        for nome in nomes:
+            numero += 1
+            yield numero, {'nome': nome, 'grupo': grupo, 'funcoes': ''}
+
+
+def _linhas_xlsx(arquivo):
+    from openpyxl import load_workbook
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from planilha.active.iter_rows(values_only=True)
+    finally:
+        planilha.close()
+
+
+def _linhas_csv(arquivo):
+    texto = codecs.getreader('utf-8-sig')(arquivo)
+    inicio = texto.readline()
+    # Planilhas exportadas em português costumam usar ';'
+    delimitador = ';' if inicio.count(';') > inicio.count(',') else ','
+    yield from csv.reader(io.StringIO(inicio), delimiter=delimitador)
+    yield from csv.reader(texto, delimiter=delimitador)
+
+
+def ler_arquivo(arquivo, nome_arquivo):
+    """
+    Gera (número da linha, {'nome', 'grupo', 'funcoes'}) de um arquivo binário
+    .xlsx ou .csv. Levanta ValueError se o formato ou o cabeçalho forem inválidos.
+    """
+    extensao = nome_arquivo.rsplit('.', 1)[-1].lower() if '.' in nome_arquivo else ''
+    if extensao == 'xlsx':
+        linhas = _linhas_xlsx(arquivo)
+    elif extensao == 'csv':
+        linhas = _linhas_csv(arquivo)
+    else:
+        raise ValueError("Formato não suportado: envie um arquivo .xlsx ou .csv.")
+
+    indices = None
+    for numero, valores in enumerate(linhas, start=1):
+        valores = ['' if v is None else str(v).strip() for v in valores]
+        if not any(valores):
+            continue
+        if indices is None:
+            # Primeira linha preenchida é o cabeçalho
+            indices = {}
+            for i, titulo in enumerate(valores):
+                coluna = COLUNAS.get(busca.normalizar_nome(titulo))
+                if coluna and coluna not in indices:
+                    indices[coluna] = i
+            if 'nome' not in indices or 'grupo' not in indices:
+                raise ValueError("Cabeçalho inválido: a planilha precisa das colunas 'Nome' e 'Grupo'.")
+            continue
+        yield numero, {coluna: valores[i] if i < len(valores) else '' for coluna, i in indices.items()}
+    if indices is None:
+        raise ValueError("A planilha está vazia.")
+
+
+def validar_linha(dados):
+    """(nome, grupo, funcoes) normalizados; levanta ValueError com o motivo se a linha for inválida"""
+    nome = ' '.join((dados.get('nome') or '').split())
+    if not nome:
+        raise ValueError("nome vazio")
+    if len(nome) > 255:
+        raise ValueError("nome com mais de 255 caracteres")
+    grupo = GRUPOS.get(busca.normalizar_nome(dados.get('grupo')))
+    if grupo is None:
+        raise ValueError(f"grupo '{dados.get('grupo') or ''}' inválido")
+    funcoes = []
+    for funcao in (dados.get('funcoes') or '').replace(';', ',').split(','):
+        funcao = busca.normalizar_nome(funcao)
+        if not funcao:
+            continue
+        if funcao not in FUNCOES:
+            raise ValueError(f"função '{funcao}' inválida")
+        if funcao not in funcoes:
+            funcoes.append(funcao)
+    return nome, grupo, ','.join(f for f in FUNCOES if f in funcoes)
+
+
+def importar(conn, linhas, atualizar=True):
+    """
+    Valida as linhas de ler_arquivo() e grava as pessoas na transação de `conn`
+    (sem commit). Com atualizar=False, nomes que já existem são ignorados em
+    vez de terem grupo e funções substituídos. Pessoas desativadas que estão na
+    planilha voltam ao cadastro (contam como atualizadas). Retorna um Resultado.
+    """
+    resultado = Resultado()
+    existentes = {row['nome']: (row['grupo'], row['funcoes'] or '', row['ativo'])
+                  for row in conn.execute('SELECT nome, grupo, funcoes, ativo FROM pessoas').fetchall()}
+    gravar = {}
+    for numero, dados in linhas:
+        try:
+            nome, grupo, funcoes = validar_linha(dados)
+        except ValueError as e:
+            resultado.ignorados.append(f"Linha {numero}: {e}")
+            continue
+        if nome in gravar:
+            resultado.ignorados.append(f"Linha {numero}: '{nome}' repetido(a) na planilha")
+            continue
+        if nome in existentes:
+            if not atualizar:
+                resultado.ignorados.append(f"Linha {numero}: '{nome}' já está cadastrado(a)")
+                continue
+            if existentes[nome] == (grupo, funcoes, 1):
+                resultado.ignorados.append(f"Linha {numero}: '{nome}' sem alterações")
+                continue
+            resultado.atualizados.append(nome)
+        else:
+            resultado.inseridos.append(nome)
+        gravar[nome] = (nome, grupo, funcoes, busca.normalizar_nome(nome))
+
+    valores = list(gravar.values())
+    for inicio in range(0, len(valores), LINHAS_POR_COMANDO):
+        lote = valores[inicio:inicio + LINHAS_POR_COMANDO]
+        conn.execute(
+            f'''INSERT INTO pessoas (nome, grupo, funcoes, nome_busca)
+                VALUES {', '.join('(?, ?, ?, ?)' for _ in lote)}
+                ON CONFLICT (nome) DO UPDATE SET grupo = excluded.grupo, funcoes = excluded.funcoes,
+                                                 nome_busca = excluded.nome_busca, ativo = 1, desativado_em = NULL,
+                                                 versao = pessoas.versao + 1''',
+            [valor for linha in lote for valor in linha]
+        )
+    return resultado
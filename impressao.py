@@ -0,0 +1,165 @@
+"""
+Escala para impressão (PDF e HTML)
+Gera a escala de um mês, ou só as missas de uma pessoa no mês, em PDF (A4,
+para o mural da paróquia) e em HTML otimizado para impressão. Os dados são os
+mesmos do Excel de exportar_mes: as escalas da visão pré-processada do mês
+(visao_mes.obter_mes), já com data formatada, horário, túnica e celebração.
+
+Cada arquivo é gerado uma vez por versão do mês e guardado em disco
+(IMPRESSAO_CACHE_DIR, padrão: pasta temporária do sistema). A versão é um hash
+das escalas impressas e do formato do arquivo, então vale entre processos e
+reinícios: downloads repetidos são só o envio do arquivo. Ao gravar uma versão
+nova, as anteriores do mesmo mês (e pessoa) são apagadas.
+
+O PDF usa o reportlab; sem ele instalado, os pedidos de PDF recebem o HTML.
+"""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from flask import render_template
+
+import visao_mes
+from busca import parsear_nomes
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+except ImportError:  # reportlab é opcional: sem ele só há a versão HTML
+    SimpleDocTemplate = None
+
+DIRETORIO = os.environ.get('IMPRESSAO_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'appigreja-impressao')
+# Mudar quando o layout do PDF ou de templates/impressao.html mudar (invalida os arquivos em disco)
+VERSAO_FORMATO = 1
+TIPOS = {'pdf': 'application/pdf', 'html': 'text/html'}  # send_file acrescenta o charset aos tipos text/*
+
+
+def pdf_disponivel():
+    return SimpleDocTemplate is not None
+
+
+def montar_linhas(escalas, nome=None):
+    """
+    Linhas da escala impressa a partir das escalas de visao_mes: data, missa,
+    túnica e equipe por função. Com `nome`, só as missas da pessoa, com a função dela.
+    """
+    linhas = []
+    for escala in escalas:
+        equipe = []
+        funcoes_da_pessoa = []
+        for funcao, rotulo in visao_mes.ROTULOS_DESCRICAO:
+            nomes = parsear_nomes(escala.get(funcao))
+            if nome is not None and nome in nomes:
+                funcoes_da_pessoa.append(rotulo)
+            if nomes:
+                equipe.append((rotulo, ', '.join(nomes)))
+        if nome is not None and not funcoes_da_pessoa:
+            continue
+        linhas.append({
+            'data': escala['data_formatada'],
+            'tipo_escala': escala.get('tipo_escala') or '',
+            'horario': escala.get('horario') or '',
+            'bata_cor': escala.get('bata_cor') or '',
+            'celebracao': escala.get('celebracao'),
+            'equipe': equipe,
+            'funcoes_da_pessoa': funcoes_da_pessoa,
+        })
+    return linhas
+
+
+def _titulo(mes, ano, nome):
+    titulo = f"Escala dos Coroinhas — {visao_mes.MESES[mes - 1]} de {ano}"
+    return f"{titulo} — {nome}" if nome else titulo
+
+
+def _gerar_html(mes, ano, nome, linhas):
+    return render_template('impressao.html', titulo=_titulo(mes, ano, nome), nome=nome, linhas=linhas).encode('utf-8')
+
+
+def _gerar_pdf(mes, ano, nome, linhas, caminho):
+    estilos = getSampleStyleSheet()
+    celula = ParagraphStyle('celula', parent=estilos['BodyText'], fontSize=8.5, leading=10.5)
+    cabecalho = ParagraphStyle('cabecalho', parent=celula, fontName='Helvetica-Bold', textColor=colors.white)
+
+    tabela = [[Paragraph(texto, cabecalho) for texto in ('Data', 'Missa', 'Túnica', 'Equipe')]]
+    for linha in linhas:
+        data = escape(linha['data'])
+        if linha['celebracao']:
+            data += f"<br/><i>{escape(linha['celebracao'])}</i>"
+        missa = escape(linha['tipo_escala'])
+        if linha['horario']:
+            missa += f"<br/>{escape(linha['horario'])}"
+        if nome:
+            equipe = f"<b>{escape(', '.join(linha['funcoes_da_pessoa']))}</b>"
+        else:
+            equipe = '<br/>'.join(f"<b>{escape(rotulo)}:</b> {escape(nomes)}" for rotulo, nomes in linha['equipe'])
+        tabela.append([Paragraph(data, celula), Paragraph(missa, celula),
+                       Paragraph(escape(linha['bata_cor']), celula), Paragraph(equipe, celula)])
+
+    largura = A4[0] - 24 * mm
+    conteudo = Table(tabela, colWidths=[largura * 0.26, largura * 0.16, largura * 0.12, largura * 0.46], repeatRows=1)
+    conteudo.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#374151')),
+        ('GRID', (0, 0), (-1, -1), 0.4, colors.HexColor('#9ca3af')),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')]),
+    ]))
+    documento = SimpleDocTemplate(caminho, pagesize=A4, title=_titulo(mes, ano, nome),
+                                  leftMargin=12 * mm, rightMargin=12 * mm, topMargin=12 * mm, bottomMargin=12 * mm)
+    documento.build([Paragraph(escape(_titulo(mes, ano, nome)), estilos['Title']), Spacer(1, 4 * mm), conteudo])
+
+
+def _versao(mes, ano, nome, formato, linhas):
+    conteudo = json.dumps([VERSAO_FORMATO, formato, mes, ano, nome, linhas], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()[:16]
+
+
+def obter_arquivo(escalas, mes, ano, formato, pessoa=None):
+    """
+    Caminho do arquivo impresso (gerado agora ou reaproveitado do disco) e o
+    formato realmente usado ('pdf' vira 'html' sem reportlab). `escalas` são as
+    de visao_mes.obter_mes; `pessoa` ({'id', 'nome'}) restringe às missas dela.
+    Retorna (None, formato) se não houver nada a imprimir.
+    """
+    if formato == 'pdf' and not pdf_disponivel():
+        formato = 'html'
+    nome = pessoa['nome'] if pessoa else None
+    linhas = montar_linhas(escalas, nome)
+    if not linhas:
+        return None, formato
+
+    prefixo = f"escala_{ano:04d}_{mes:02d}" + (f"_pessoa{pessoa['id']}" if pessoa else '')
+    caminho = os.path.join(DIRETORIO, f"{prefixo}_{_versao(mes, ano, nome, formato, linhas)}.{formato}")
+    if os.path.exists(caminho):
+        return caminho, formato
+
+    os.makedirs(DIRETORIO, exist_ok=True)
+    # Grava em um arquivo temporário e renomeia: outro processo nunca lê um arquivo pela metade
+    descritor, temporario = tempfile.mkstemp(dir=DIRETORIO, prefix=f"{prefixo}_", suffix='.tmp')
+    os.close(descritor)
+    try:
+        if formato == 'pdf':
+            _gerar_pdf(mes, ano, nome, linhas, temporario)
+        else:
+            with open(temporario, 'wb') as arquivo:
+                arquivo.write(_gerar_html(mes, ano, nome, linhas))
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    print(f"Impressão gerada: {os.path.basename(caminho)}")
+
+    # Versões anteriores deste mês (e pessoa); o padrão da versão não pega os arquivos de pessoas do mês
+    for antigo in glob.glob(os.path.join(DIRETORIO, f"{prefixo}_{'[0-9a-f]' * 16}.{formato}")):
+        if antigo != caminho:
+            try:
+                os.remove(antigo)
+            except OSError:
+                pass  # outro processo já apagou
+    return caminho, formato
@@ -0,0 +1,109 @@
+"""
+Indisponibilidades (ausências) das pessoas
+Cada registro diz que uma pessoa não pode servir de data_inicio a data_fim
+(inclusive, 'YYYY-MM-DD'), opcionalmente só em alguns dias da semana
+(dias_semana = '6' ou '1,3', com 0=Segunda ... 6=Domingo, como em dias_missa).
+
+O gerador monta um Calendario com os registros do mês uma vez por execução:
+por pessoa e por conjunto de dias da semana, os intervalos são unidos e
+ordenados, e cada consulta é uma busca binária (bisect) em vez de varrer a lista.
+"""
+from bisect import bisect_right
+from datetime import date
+
+import busca
+
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+
+def parsear_dias_semana(texto):
+    """'1,3' -> frozenset({1, 3}); vazio -> None (todos os dias)"""
+    dias = frozenset(int(d) for d in (texto or '').split(',') if d.strip())
+    return dias or None
+
+
+def validar(data_inicio, data_fim, dias_semana):
+    """Normaliza os dados do formulário; levanta ValueError se inválidos"""
+    try:
+        inicio = date.fromisoformat(data_inicio)
+        fim = date.fromisoformat(data_fim or data_inicio)
+    except (TypeError, ValueError):
+        raise ValueError("As datas devem estar no formato AAAA-MM-DD.")
+    if fim < inicio:
+        raise ValueError("A data final deve ser igual ou posterior à inicial.")
+    dias = sorted({int(d) for d in dias_semana or []})
+    if any(d < 0 or d > 6 for d in dias):
+        raise ValueError("Dia da semana inválido.")
+    return inicio.isoformat(), fim.isoformat(), ','.join(str(d) for d in dias) or None
+
+
+class Calendario:
+    """Estrutura de intervalos em memória: {nome: [(dias_semana, inicios, fins), ...]}"""
+    def __init__(self, registros):
+        agrupados = {}
+        for nome, data_inicio, data_fim, dias_semana in registros:
+            agrupados.setdefault((nome, parsear_dias_semana(dias_semana)), []).append(
+                (date.fromisoformat(data_inicio).toordinal(), date.fromisoformat(data_fim).toordinal())
+            )
+
+        self._por_nome = {}
+        for (nome, dias), intervalos in agrupados.items():
+            # Unir intervalos sobrepostos ou encostados para que fiquem disjuntos
+            intervalos.sort()
+            unidos = [list(intervalos[0])]
+            for inicio, fim in intervalos[1:]:
+                if inicio <= unidos[-1][1] + 1:
+                    unidos[-1][1] = max(unidos[-1][1], fim)
+                else:
+                    unidos.append([inicio, fim])
+            self._por_nome.setdefault(nome, []).append(
+                (dias, [i for i, _ in unidos], [f for _, f in unidos])
+            )
+
+    def __len__(self):
+        return len(self._por_nome)
+
+    def indisponivel(self, nome, data):
+        """True se `nome` está ausente em `data` (date ou datetime)"""
+        grupos = self._por_nome.get(nome)
+        if not grupos:
+            return False
+        ordinal = data.toordinal()
+        dia_semana = data.weekday()
+        for dias, inicios, fins in grupos:
+            if dias is not None and dia_semana not in dias:
+                continue
+            i = bisect_right(inicios, ordinal) - 1
+            if i >= 0 and fins[i] >= ordinal:
+                return True
+        return False
+
+
+def carregar_registros(conn, mes, ano):
+    """[[nome, data_inicio, data_fim, dias_semana], ...] que tocam o mês (serializável, vai nas entradas da geração)"""
+    inicio, fim = busca.intervalo_mes_iso(mes, ano)
+    rows = conn.execute(
+        '''SELECT p.nome, i.data_inicio, i.data_fim, i.dias_semana
+           FROM indisponibilidades i JOIN pessoas p ON p.id = i.pessoa_id
+           WHERE i.data_fim >= ? AND i.data_inicio <= ?
+           ORDER BY i.id''',
+        (inicio, fim)
+    ).fetchall()
+    return [[row['nome'], row['data_inicio'], row['data_fim'], row['dias_semana']] for row in rows]
+
+
+def listar(conn, a_partir_de=None):
+    """Registros para a tela de gerenciamento (mais recentes por último)"""
+    query = '''SELECT i.id, i.pessoa_id, p.nome, i.data_inicio, i.data_fim, i.dias_semana, i.motivo
+               FROM indisponibilidades i JOIN pessoas p ON p.id = i.pessoa_id'''
+    params = ()
+    if a_partir_de:
+        query += ' WHERE i.data_fim >= ?'
+        params = (a_partir_de,)
+    registros = []
+    for row in conn.execute(query + ' ORDER BY i.data_inicio, p.nome', params).fetchall():
+        registro = dict(row)
+        dias = parsear_dias_semana(registro['dias_semana'])
+        registro['dias_semana_nomes'] = ', '.join(DIAS_SEMANA[d] for d in sorted(dias)) if dias else 'Todos os dias'
+        registros.append(registro)
+    return registros
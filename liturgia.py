@@ -0,0 +1,95 @@
+"""
+Calendário litúrgico
+Calcula as celebrações móveis de cada ano a partir da Páscoa (computus
+gregoriano) e monta, uma vez por ano, uma tabela data -> Celebracao com o nome,
+a cor litúrgica e a cor da túnica correspondente. O gerador e as visões do mês
+consultam a tabela com um acesso de dicionário por dia.
+
+Segue o calendário usado no Brasil: Epifania, Ascensão, São Pedro e São Paulo,
+Assunção e Todos os Santos são celebrados no domingo.
+
+`missa_propria`: em dia de semana, a celebração substitui as missas do dia por
+uma única missa com as regras de domingo. Só as antigas DIAS_SOLENES (Santa
+Maria Mãe de Deus, Imaculada Conceição e Natal) têm missa própria; as demais
+celebrações só mudam a cor da túnica das missas já configuradas para o dia
+(Cinzas, Tríduo Pascal, Corpus Christi e Aparecida, quando tiverem coroinhas,
+entram como escala adicionada à mão). Nos domingos as missas normais são
+mantidas e só a cor da túnica muda.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+
+Celebracao = namedtuple('Celebracao', 'nome cor_liturgica bata_cor missa_propria')
+
+# A túnica dos coroinhas só tem duas cores: vermelha nas celebrações vermelhas, branca nas demais
+BATA_BRANCA = 'Bata Branca'
+BATA_VERMELHA = 'Bata Vermelha'
+
+
+def pascoa(ano):
+    """Domingo de Páscoa (algoritmo anônimo gregoriano / Meeus-Jones-Butcher)"""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(ano, mes, dia + 1)
+
+
+def _domingo_a_partir_de(data):
+    """O próprio dia, se for domingo, ou o domingo seguinte"""
+    return data + timedelta(days=(6 - data.weekday()) % 7)
+
+
+def _celebracao(nome, cor, missa_propria=False):
+    bata = BATA_VERMELHA if cor == 'vermelho' else BATA_BRANCA
+    return Celebracao(nome, cor, bata, missa_propria)
+
+
+@lru_cache(maxsize=32)
+def tabela_do_ano(ano):
+    """{date: Celebracao} do ano (calculada uma vez por processo e por ano)"""
+    p = pascoa(ano)
+    natal = date(ano, 12, 25)
+    # 1º domingo do Advento: 4 domingos antes do Natal; Cristo Rei é o domingo anterior
+    advento = natal - timedelta(days=natal.weekday() + 1 + 21)
+
+    celebracoes = [
+        (date(ano, 1, 1), _celebracao("Solenidade de Santa Maria, Mãe de Deus", 'branco', missa_propria=True)),
+        (_domingo_a_partir_de(date(ano, 1, 2)), _celebracao("Epifania do Senhor", 'branco')),
+        (p - timedelta(days=46), _celebracao("Quarta-feira de Cinzas", 'roxo')),
+        (p - timedelta(days=7), _celebracao("Domingo de Ramos", 'vermelho')),
+        (p - timedelta(days=3), _celebracao("Quinta-feira Santa", 'branco')),
+        (p - timedelta(days=2), _celebracao("Sexta-feira da Paixão", 'vermelho')),
+        (p - timedelta(days=1), _celebracao("Vigília Pascal", 'branco')),
+        (p, _celebracao("Páscoa do Senhor", 'branco')),
+        (p + timedelta(days=42), _celebracao("Ascensão do Senhor", 'branco')),
+        (p + timedelta(days=49), _celebracao("Pentecostes", 'vermelho')),
+        (p + timedelta(days=56), _celebracao("Santíssima Trindade", 'branco')),
+        (p + timedelta(days=60), _celebracao("Corpus Christi", 'branco')),
+        (_domingo_a_partir_de(date(ano, 6, 29)), _celebracao("São Pedro e São Paulo", 'vermelho')),
+        (_domingo_a_partir_de(date(ano, 8, 15)), _celebracao("Assunção de Nossa Senhora", 'branco')),
+        (date(ano, 10, 12), _celebracao("Nossa Senhora Aparecida", 'branco')),
+        (_domingo_a_partir_de(date(ano, 11, 1)), _celebracao("Todos os Santos", 'branco')),
+        (advento - timedelta(days=7), _celebracao("Cristo Rei", 'branco')),
+        (date(ano, 12, 8), _celebracao("Solenidade da Imaculada Conceição", 'branco', missa_propria=True)),
+        (natal, _celebracao("Natal do Senhor", 'branco', missa_propria=True)),
+    ]
+    tabela = {}
+    for data, celebracao in celebracoes:
+        # Coincidências raras (ex.: Imaculada no domingo do Advento): fica a primeira da lista
+        tabela.setdefault(data, celebracao)
+    return tabela
+
+
+def celebracao_do_dia(data):
+    """Celebracao da data (date ou datetime) ou None"""
+    if hasattr(data, 'date'):
+        data = data.date()
+    return tabela_do_ano(data.year).get(data)
@@ -0,0 +1,184 @@
+"""
+Edição de escalas em lote
+Aplica várias alterações (trocar uma pessoa por outra em um intervalo de datas,
+mudar a cor da túnica de muitas escalas) em uma única transação, com UPDATEs
+em lote em vez de um POST por escala, e devolve o diff campo a campo.
+
+Formato das alterações (JSON):
+    {
+        "inicio": "2026-03-01", "fim": "2026-03-31",
+        "operacoes": [
+            {"tipo": "trocar_pessoa", "de": "João", "para": "Pedro",
+             "funcoes": ["cerimoniarios"], "tipos_escala": ["Domingo Manhã"]},
+            {"tipo": "bata_cor", "bata_cor": "Bata Vermelha", "tipos_escala": ["Terça"]}
+        ],
+        "simular": false
+    }
+"funcoes" e "tipos_escala" são opcionais (padrão: todas).
+"""
+from datetime import date
+
+import busca
+import cadastro
+import rollups
+import visao_mes
+from database import marcadores
+
+FUNCOES = busca.FUNCOES_ESCALA
+CORES_BATA = ['Bata Branca', 'Bata Vermelha']
+
+# 'DD/MM/YYYY' -> 'YYYY-MM-DD' em SQL (funciona no SQLite e no PostgreSQL)
+DATA_ISO_SQL = "substr(data, 7, 4) || '-' || substr(data, 4, 2) || '-' || substr(data, 1, 2)"
+
+
+def _validar_data(texto, campo):
+    try:
+        return date.fromisoformat(texto).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"'{campo}' deve estar no formato AAAA-MM-DD.")
+
+
+def _lista_de_textos(valor, campo):
+    if valor is None:
+        return []
+    if not isinstance(valor, list) or not all(isinstance(item, str) for item in valor):
+        raise ValueError(f"'{campo}' deve ser uma lista de textos.")
+    return valor
+
+
+def _texto(valor, campo):
+    if valor is None:
+        return ''
+    if not isinstance(valor, str):
+        raise ValueError(f"'{campo}' deve ser um texto.")
+    return valor.strip()
+
+
+def _validar_operacao(op, ativos):
+    """Operação normalizada; `ativos` são os nomes das pessoas ativas (destino de trocar_pessoa)"""
+    if not isinstance(op, dict):
+        raise ValueError("Cada operação deve ser um objeto JSON.")
+    tipo = op.get('tipo')
+    tipos_escala = _lista_de_textos(op.get('tipos_escala'), 'tipos_escala')
+    if tipo == 'trocar_pessoa':
+        de, para = _texto(op.get('de'), 'de'), _texto(op.get('para'), 'para')
+        if not de or not para or de == para:
+            raise ValueError("trocar_pessoa exige 'de' e 'para' diferentes.")
+        if para not in ativos:
+            raise ValueError(f"'{para}' não é uma pessoa ativa do cadastro.")
+        funcoes = _lista_de_textos(op.get('funcoes'), 'funcoes') or FUNCOES
+        invalidas = [f for f in funcoes if f not in FUNCOES]
+        if invalidas:
+            raise ValueError(f"Funções inválidas: {', '.join(invalidas)}")
+        return {'tipo': tipo, 'de': de, 'para': para, 'funcoes': funcoes, 'tipos_escala': tipos_escala}
+    if tipo == 'bata_cor':
+        if op.get('bata_cor') not in CORES_BATA:
+            raise ValueError(f"'bata_cor' deve ser uma de: {', '.join(CORES_BATA)}")
+        return {'tipo': tipo, 'bata_cor': op['bata_cor'], 'tipos_escala': tipos_escala}
+    raise ValueError(f"Operação desconhecida: {tipo!r}")
+
+
+def _ids_no_intervalo(conn, inicio, fim, tipos_escala):
+    query = f"SELECT id FROM escalas WHERE {DATA_ISO_SQL} BETWEEN ? AND ?"
+    params = [inicio, fim]
+    if tipos_escala:
+        query += f" AND tipo_escala IN ({marcadores(tipos_escala)})"
+        params.extend(tipos_escala)
+    return [row['id'] for row in conn.execute(query, params).fetchall()]
+
+
+def _trocar_pessoa(conn, op, inicio, fim, conflitos):
+    """Troca op['de'] por op['para'] nas escalas em que o índice escala_membros encontra a pessoa"""
+    query = ("SELECT m.escala_id, m.funcao FROM escala_membros m JOIN escalas e ON e.id = m.escala_id"
+             f" WHERE m.nome = ? AND m.data_iso BETWEEN ? AND ? AND m.funcao IN ({marcadores(op['funcoes'])})")
+    params = [op['de'], inicio, fim] + list(op['funcoes'])
+    if op['tipos_escala']:
+        query += f" AND e.tipo_escala IN ({marcadores(op['tipos_escala'])})"
+        params.extend(op['tipos_escala'])
+    ocorrencias = conn.execute(query, params).fetchall()
+    if not ocorrencias:
+        return set()
+
+    # Não colocar a pessoa nova em uma missa em que ela já está escalada
+    ids = sorted({row['escala_id'] for row in ocorrencias})
+    ja_escalados = {row['escala_id'] for row in conn.execute(
+        f"SELECT DISTINCT escala_id FROM escala_membros WHERE nome = ? AND escala_id IN ({marcadores(ids)})",
+        [op['para']] + ids
+    ).fetchall()}
+    for escala_id in sorted(ja_escalados):
+        conflitos.append({'id': escala_id, 'motivo': f"{op['para']} já está escalado(a) nesta missa"})
+
+    funcoes_por_id = {}
+    for row in ocorrencias:
+        if row['escala_id'] not in ja_escalados:
+            funcoes_por_id.setdefault(row['escala_id'], set()).add(row['funcao'])
+
+    # Já reindexadas: as operações seguintes do lote veem os nomes novos
+    return set(busca.reescrever_nomes(
+        conn, funcoes_por_id, lambda nomes: [op['para'] if nome == op['de'] else nome for nome in nomes]
+    ))
+
+
+def _bata_cor(conn, op, inicio, fim):
+    ids = _ids_no_intervalo(conn, inicio, fim, op['tipos_escala'])
+    if not ids:
+        return set()
+    conn.execute(
+        f"UPDATE escalas SET bata_cor = ?, versao = versao + 1 WHERE id IN ({marcadores(ids)}) AND COALESCE(bata_cor, '') <> ?",
+        [op['bata_cor']] + ids + [op['bata_cor']]
+    )
+    return set(ids)
+
+
+def aplicar(conn, dados):
+    """
+    Valida e aplica as operações na transação de `conn` (sem commit).
+    Retorna (diff, meses_afetados) onde diff = {'escalas': [...], 'conflitos': [...], 'total_alteradas': n}.
+    Índice de busca, rollups e visão do mês das escalas alteradas são atualizados juntos.
+    Levanta ValueError para dados inválidos.
+    """
+    inicio = _validar_data(dados.get('inicio'), 'inicio')
+    fim = _validar_data(dados.get('fim'), 'fim')
+    if fim < inicio:
+        raise ValueError("'fim' deve ser igual ou posterior a 'inicio'.")
+    operacoes = dados.get('operacoes') or []
+    if not isinstance(operacoes, list):
+        raise ValueError("'operacoes' deve ser uma lista.")
+    ativos = cadastro.obter_pessoas(conn).por_nome
+    operacoes = [_validar_operacao(op, ativos) for op in operacoes]
+    if not operacoes:
+        raise ValueError("Nenhuma operação informada.")
+
+    # Estado anterior de todas as escalas que alguma operação pode tocar
+    candidatos = set(_ids_no_intervalo(conn, inicio, fim, []))
+    antes = busca.carregar_escalas(conn, candidatos)
+
+    conflitos = []
+    tocados = set()
+    for op in operacoes:
+        if op['tipo'] == 'trocar_pessoa':
+            tocados |= _trocar_pessoa(conn, op, inicio, fim, conflitos)
+        else:
+            tocados |= _bata_cor(conn, op, inicio, fim)
+
+    depois = busca.carregar_escalas(conn, tocados)
+    escalas = []
+    meses = set()
+    for escala_id in sorted(depois, key=lambda i: (busca.data_para_iso(depois[i]['data']), depois[i]['tipo_escala'])):
+        novo, velho = depois[escala_id], antes.get(escala_id, {})
+        alteracoes = {
+            campo: {'antes': velho.get(campo), 'depois': novo[campo]}
+            for campo in ['bata_cor'] + FUNCOES
+            if velho.get(campo) != novo[campo]
+        }
+        if not alteracoes:
+            continue
+        escalas.append({'id': escala_id, 'data': novo['data'], 'tipo_escala': novo['tipo_escala'], 'alteracoes': alteracoes})
+        _, mes, ano = novo['data'].split('/')
+        meses.add((int(ano), int(mes)))
+
+    for ano, mes in sorted(meses):
+        rollups.atualizar_mes(conn, mes, ano)
+        visao_mes.atualizar_mes(conn, mes, ano)
+
+    return {'escalas': escalas, 'conflitos': conflitos, 'total_alteradas': len(escalas)}, sorted(meses)
@@ -0,0 +1,108 @@
+"""
+Candidatos dos modelos de escala
+Cada modelo (escala_templates) tem suas listas de candidatos por função na tabela
+template_candidatos (template_id, pessoa_id, funcao), com chaves estrangeiras para
+pessoas. Substitui as antigas colunas *_template com nomes separados por vírgula.
+"""
+import alteracoes
+from busca import FUNCOES_ESCALA as FUNCOES_TEMPLATE, juntar_nomes, parsear_nomes
+from database import executar_em_lote
+
+
+def carregar_candidatos(conn):
+    """
+    Carrega os candidatos de todos os modelos em uma única query indexada.
+    Retorna {template_id: {funcao: [nomes na ordem cadastrada]}}.
+    """
+    rows = conn.execute(
+        '''SELECT tc.template_id, tc.funcao, p.nome
+           FROM template_candidatos tc
+           JOIN pessoas p ON p.id = tc.pessoa_id
+           ORDER BY tc.template_id, tc.funcao, tc.posicao'''
+    ).fetchall()
+    candidatos = {}
+    for row in rows:
+        candidatos.setdefault(row['template_id'], {}).setdefault(row['funcao'], []).append(row['nome'])
+    return candidatos
+
+
+def carregar_candidatos_template(conn, template_id):
+    """Candidatos de um único modelo: {funcao: [nomes]} (todas as funções presentes)"""
+    rows = conn.execute(
+        '''SELECT tc.funcao, p.nome
+           FROM template_candidatos tc
+           JOIN pessoas p ON p.id = tc.pessoa_id
+           WHERE tc.template_id = ?
+           ORDER BY tc.funcao, tc.posicao''',
+        (template_id,)
+    ).fetchall()
+    candidatos = {funcao: [] for funcao in FUNCOES_TEMPLATE}
+    for row in rows:
+        candidatos.setdefault(row['funcao'], []).append(row['nome'])
+    return candidatos
+
+
+def salvar_candidatos_template(conn, template_id, candidatos_por_funcao):
+    """
+    Substitui os candidatos de um modelo. candidatos_por_funcao: {funcao: [nomes]}.
+    Nomes são resolvidos para pessoa_id em uma única query. Não faz commit.
+    Retorna a lista de nomes que não existem em pessoas ativas (ignorados).
+    """
+    ids_por_nome = {row['nome']: row['id'] for row in conn.execute('SELECT id, nome FROM pessoas WHERE ativo = 1').fetchall()}
+    linhas = []
+    nao_encontrados = []
+    for funcao in FUNCOES_TEMPLATE:
+        vistos = set()
+        for posicao, nome in enumerate(candidatos_por_funcao.get(funcao, [])):
+            pessoa_id = ids_por_nome.get(nome)
+            if pessoa_id is None:
+                nao_encontrados.append(nome)
+                continue
+            if pessoa_id in vistos:
+                continue
+            vistos.add(pessoa_id)
+            linhas.append((template_id, pessoa_id, funcao, posicao))
+
+    conn.execute('DELETE FROM template_candidatos WHERE template_id = ?', (template_id,))
+    executar_em_lote(
+        conn,
+        'INSERT INTO template_candidatos (template_id, pessoa_id, funcao, posicao) VALUES (?, ?, ?, ?)',
+        linhas
+    )
+    return sorted(set(nao_encontrados))
+
+
+def migrar_templates_legados(conn):
+    """
+    Migração: copia as listas das colunas *_template (nomes separados por vírgula)
+    para template_candidatos e limpa as colunas antigas do modelo migrado.
+    Só atua em modelos que ainda têm conteúdo nas colunas antigas (por exemplo os
+    modelos iniciais) e depois que existem pessoas cadastradas. Cada modelo migrado
+    fica registrado em alteracoes com as listas antigas e, em 'ignorados', os nomes
+    sem cadastro ativo, que não viram candidatos (as colunas antigas são limpas).
+    """
+    # Sem pessoas cadastradas não há como resolver os nomes: aguardar o cadastro
+    if not conn.execute('SELECT COUNT(*) AS total FROM pessoas').fetchone()['total']:
+        return
+    colunas = [f'{funcao}_template' for funcao in FUNCOES_TEMPLATE]
+    filtro = ' OR '.join(f"COALESCE({coluna}, '') <> ''" for coluna in colunas)
+    templates = conn.execute(f'SELECT * FROM escala_templates WHERE {filtro}').fetchall()
+    if not templates:
+        return
+    for template in templates:
+        candidatos = {funcao: parsear_nomes(template[f'{funcao}_template']) for funcao in FUNCOES_TEMPLATE}
+        nao_encontrados = salvar_candidatos_template(conn, template['id'], candidatos)
+        conn.execute(
+            f"UPDATE escala_templates SET {', '.join(f'{coluna} = NULL' for coluna in colunas)}, versao = versao + 1 WHERE id = ?",
+            (template['id'],)
+        )
+        ignorados = set(nao_encontrados)
+        depois = {funcao: juntar_nomes(nome for nome in nomes if nome not in ignorados) for funcao, nomes in candidatos.items()}
+        depois['ignorados'] = juntar_nomes(nao_encontrados)
+        alteracoes.registrar(conn, 'modelo', 'migrar', template['id'],
+                             antes={funcao: template[f'{funcao}_template'] or '' for funcao in FUNCOES_TEMPLATE},
+                             depois=depois, autor='sistema')
+        if nao_encontrados:
+            print(f"AVISO: modelo '{template['tipo_escala']}' tinha nomes sem cadastro (ignorados): {', '.join(nao_encontrados)}")
+    conn.commit()
+    print(f"Modelos migrados para template_candidatos: {len(templates)}")
@@ -0,0 +1,146 @@
+"""
+Invalidação de caches entre instâncias
+Os caches de caches.py são locais ao processo. Com vários workers (ou várias
+instâncias serverless) usando o mesmo banco, uma escrita em uma instância
+precisa invalidar os caches das outras:
+
+- PostgreSQL: a escrita emite NOTIFY no canal CANAL (dentro da mesma transação,
+  então só é entregue se o commit acontecer) e cada processo mantém uma thread
+  com LISTEN que invalida os escopos recebidos.
+- SQLite: toda escrita grava suas linhas em alteracoes (ver alteracoes.py), com
+  os escopos que invalida, e cada processo consulta as linhas novas no início
+  das requisições (no máximo uma vez por INTERVALO_POLL_SEGUNDOS).
+
+Eventos da própria instância são ignorados, pois ela já invalidou localmente.
+"""
+import json
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+
+import caches
+from database import USE_POSTGRES, get_db_connection
+
+CANAL = 'appigreja_cache'
+INTERVALO_POLL_SEGUNDOS = 1.0
+
+# Identifica este processo nos eventos
+ORIGEM = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_lock = threading.Lock()
+_ouvinte = None
+_ultimo_evento_id = None
+_ultimo_poll = 0.0
+
+
+def publicar(conn, *escopos):
+    """
+    Registra o evento de invalidação na transação corrente (antes do commit). No
+    SQLite não há o que fazer: as linhas de alteracoes gravadas pela escrita já
+    são o evento.
+    """
+    if not escopos or not USE_POSTGRES:
+        return
+    payload = json.dumps({'o': ORIGEM, 'e': list(escopos)})
+    conn.execute('SELECT pg_notify(?, ?)', (CANAL, payload))
+
+
+def confirmar(conn, *escopos):
+    """
+    Publica o evento, faz commit e só então invalida os caches locais (invalidar
+    antes do commit deixaria outra requisição guardar dados antigos na versão nova).
+    """
+    publicar(conn, *escopos)
+    conn.commit()
+    caches.invalidar(*escopos)
+
+
+def _aplicar(origem, escopos):
+    if origem != ORIGEM and escopos:
+        caches.invalidar(*escopos)
+
+
+def _ouvir_postgres():
+    """Thread do LISTEN; reconecta em caso de falha e invalida tudo ao reconectar"""
+    primeira = True
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection().conn
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f'LISTEN {CANAL}')
+            if not primeira:
+                # Eventos emitidos enquanto estávamos desconectados foram perdidos
+                caches.invalidar_tudo()
+            primeira = False
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notificacao = conn.notifies.pop(0)
+                    try:
+                        evento = json.loads(notificacao.payload)
+                        _aplicar(evento.get('o'), evento.get('e') or [])
+                    except ValueError:
+                        print(f"AVISO: evento de cache inválido: {notificacao.payload!r}")
+        except Exception as e:
+            print(f"AVISO: ouvinte de invalidação de cache desconectado: {e}")
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def _consultar_eventos_sqlite():
+    global _ultimo_evento_id
+    conn = get_db_connection()
+    try:
+        if _ultimo_evento_id is None:
+            # Primeira consulta do processo: os caches estão vazios, basta marcar a posição
+            row = conn.execute('SELECT MAX(id) AS ultimo FROM alteracoes').fetchone()
+            _ultimo_evento_id = row['ultimo'] or 0
+            return
+        eventos = conn.execute(
+            'SELECT id, escopos, origem FROM alteracoes WHERE id > ? ORDER BY id',
+            (_ultimo_evento_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    for evento in eventos:
+        _aplicar(evento['origem'], [e for e in evento['escopos'].split(',') if e])
+        _ultimo_evento_id = evento['id']
+
+
+def sincronizar():
+    """
+    Chamado no início de cada requisição. No PostgreSQL garante que a thread de
+    LISTEN está rodando; no SQLite aplica os eventos novos de outras instâncias.
+    """
+    global _ouvinte, _ultimo_poll
+    if USE_POSTGRES:
+        if _ouvinte is None or not _ouvinte.is_alive():
+            with _lock:
+                if _ouvinte is None or not _ouvinte.is_alive():
+                    _ouvinte = threading.Thread(target=_ouvir_postgres, name='ouvinte-cache', daemon=True)
+                    _ouvinte.start()
+        return
+
+    agora = time.monotonic()
+    if agora - _ultimo_poll < INTERVALO_POLL_SEGUNDOS:
+        return
+    with _lock:
+        if agora - _ultimo_poll < INTERVALO_POLL_SEGUNDOS:
+            return
+        _ultimo_poll = agora
+        try:
+            _consultar_eventos_sqlite()
+        except Exception as e:
+            print(f"AVISO: não foi possível consultar eventos de cache: {e}")
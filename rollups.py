@@ -0,0 +1,141 @@
+"""
+Rollups mensais de frequência
+A tabela frequencia_mensal guarda, por mês, quantas vezes cada pessoa serviu em
+cada função e tipo de escala. Ela é recalculada (em SQL, a partir de
+escala_membros) na mesma transação de cada escrita em escalas, então relatórios
+de vários meses leem poucas linhas já agregadas e fazem as contas em NumPy.
+"""
+import numpy as np
+
+from busca import FUNCOES_ESCALA as FUNCOES, intervalo_mes_iso
+
+
+def atualizar_mes(conn, mes, ano):
+    """Recalcula o rollup de um mês a partir do índice escala_membros (sem commit)"""
+    inicio, fim = intervalo_mes_iso(mes, ano)
+    conn.execute('DELETE FROM frequencia_mensal WHERE ano = ? AND mes = ?', (ano, mes))
+    conn.execute(
+        '''INSERT INTO frequencia_mensal (ano, mes, nome, funcao, tipo_escala, total)
+           SELECT ?, ?, m.nome, m.funcao, e.tipo_escala, COUNT(*)
+           FROM escala_membros m
+           JOIN escalas e ON e.id = m.escala_id
+           WHERE m.data_iso BETWEEN ? AND ?
+           GROUP BY m.nome, m.funcao, e.tipo_escala''',
+        (ano, mes, inicio, fim)
+    )
+
+
+def atualizar_mes_da_data(conn, data_br):
+    """Atalho para escritas de uma única escala ('DD/MM/YYYY')"""
+    _, mes, ano = data_br.split('/')
+    atualizar_mes(conn, int(mes), int(ano))
+
+
+def reconstruir(conn):
+    """Recalcula todos os meses que têm escalas"""
+    conn.execute('DELETE FROM frequencia_mensal')
+    meses = conn.execute(
+        'SELECT DISTINCT substr(data_iso, 1, 7) AS ano_mes FROM escala_membros'
+    ).fetchall()
+    for row in meses:
+        ano, mes = row['ano_mes'].split('-')
+        atualizar_mes(conn, int(mes), int(ano))
+    conn.commit()
+    print(f"Rollups de frequência reconstruídos ({len(meses)} meses).")
+
+
+def reconstruir_se_necessario(conn):
+    """Na inicialização: popula os rollups de bancos que já tinham escalas"""
+    total_membros = conn.execute('SELECT COUNT(*) AS total FROM escala_membros').fetchone()['total']
+    total_rollups = conn.execute('SELECT COUNT(*) AS total FROM frequencia_mensal').fetchone()['total']
+    if total_membros and not total_rollups:
+        reconstruir(conn)
+
+
+def meses_do_periodo(mes_final, ano_final, quantidade):
+    """Lista [(ano, mes), ...] dos `quantidade` meses terminando em mes_final/ano_final"""
+    indice_final = ano_final * 12 + (mes_final - 1)
+    return [((i // 12), (i % 12) + 1) for i in range(indice_final - quantidade + 1, indice_final + 1)]
+
+
+def carregar_periodo(conn, meses):
+    """Lê os rollups dos meses informados (lista de (ano, mes))"""
+    (ano_ini, mes_ini), (ano_fim, mes_fim) = meses[0], meses[-1]
+    # Intervalo em ano (prefixo da chave primária) e o mês só nos anos das pontas
+    return conn.execute(
+        '''SELECT ano, mes, nome, funcao, tipo_escala, total FROM frequencia_mensal
+           WHERE ano BETWEEN ? AND ? AND (ano > ? OR mes >= ?) AND (ano < ? OR mes <= ?)''',
+        (ano_ini, ano_fim, ano_ini, mes_ini, ano_fim, mes_fim)
+    ).fetchall()
+
+
+def analisar_periodo(rows, meses, pessoas_info):
+    """
+    Monta as matrizes pessoa x mês, pessoa x função e pessoa x tipo de escala com
+    NumPy e calcula os indicadores de equilíbrio do período.
+    pessoas_info: {nome: grupo} das pessoas cadastradas (entram mesmo com 0 serviços).
+    """
+    nomes = sorted(set(pessoas_info) | {row['nome'] for row in rows})
+    tipos = sorted({row['tipo_escala'] for row in rows})
+    indice_nome = {nome: i for i, nome in enumerate(nomes)}
+    indice_mes = {ano_mes: i for i, ano_mes in enumerate(meses)}
+    indice_funcao = {funcao: i for i, funcao in enumerate(FUNCOES)}
+    indice_tipo = {tipo: i for i, tipo in enumerate(tipos)}
+
+    n = len(rows)
+    idx_pessoa = np.fromiter((indice_nome[row['nome']] for row in rows), dtype=np.int32, count=n)
+    idx_mes = np.fromiter((indice_mes[(row['ano'], row['mes'])] for row in rows), dtype=np.int32, count=n)
+    idx_funcao = np.fromiter((indice_funcao.get(row['funcao'], 0) for row in rows), dtype=np.int32, count=n)
+    idx_tipo = np.fromiter((indice_tipo[row['tipo_escala']] for row in rows), dtype=np.int32, count=n)
+    totais_linha = np.fromiter((row['total'] for row in rows), dtype=np.int64, count=n)
+
+    por_mes = np.zeros((len(nomes), len(meses)), dtype=np.int64)
+    por_funcao = np.zeros((len(nomes), len(FUNCOES)), dtype=np.int64)
+    por_tipo = np.zeros((len(nomes), len(tipos)), dtype=np.int64)
+    np.add.at(por_mes, (idx_pessoa, idx_mes), totais_linha)
+    np.add.at(por_funcao, (idx_pessoa, idx_funcao), totais_linha)
+    np.add.at(por_tipo, (idx_pessoa, idx_tipo), totais_linha)
+
+    totais = por_mes.sum(axis=1)
+    media = float(totais.mean()) if len(totais) else 0.0
+    desvio = float(totais.std()) if len(totais) else 0.0
+    z = (totais - media) / desvio if desvio > 0 else np.zeros_like(totais, dtype=float)
+    meses_sem_servico = (por_mes == 0).sum(axis=1)
+
+    # Coeficiente de Gini dos totais (0 = todos serviram igual, 1 = concentração total)
+    if len(totais) and totais.sum() > 0:
+        ordenados = np.sort(totais)
+        posicoes = np.arange(1, len(ordenados) + 1)
+        gini = float((2 * (posicoes * ordenados).sum()) / (len(ordenados) * ordenados.sum()) - (len(ordenados) + 1) / len(ordenados))
+    else:
+        gini = 0.0
+
+    pessoas = []
+    for i, nome in enumerate(nomes):
+        pessoas.append({
+            'nome': nome,
+            'grupo': pessoas_info.get(nome, '-'),
+            'total': int(totais[i]),
+            'por_mes': por_mes[i].tolist(),
+            'por_funcao': dict(zip(FUNCOES, por_funcao[i].tolist())),
+            'por_tipo': dict(zip(tipos, por_tipo[i].tolist())),
+            'z': round(float(z[i]), 2),
+            'meses_sem_servico': int(meses_sem_servico[i]),
+            'cadastrado': nome in pessoas_info,
+        })
+    pessoas.sort(key=lambda p: (p['total'], p['nome']))
+
+    return {
+        'meses': meses,
+        'tipos': tipos,
+        'pessoas': pessoas,
+        'total_servicos': int(totais.sum()),
+        'media': media,
+        'desvio': desvio,
+        'gini': gini,
+        'totais_por_mes': por_mes.sum(axis=0).tolist(),
+        'totais_por_funcao': dict(zip(FUNCOES, por_funcao.sum(axis=0).tolist())),
+        'totais_por_tipo': dict(zip(tipos, por_tipo.sum(axis=0).tolist())),
+        'abaixo_da_media': [p for p in pessoas if p['cadastrado'] and p['z'] <= -1],
+        'acima_da_media': [p for p in pessoas if p['z'] >= 1],
+    }
@@ -60,6 +60,115 @@ CREATE TABLE IF NOT EXISTS dias_missa (
 CREATE INDEX IF NOT EXISTS idx_dias_missa_dia ON dias_missa(dia_semana);
 CREATE INDEX IF NOT EXISTS idx_dias_missa_ativo ON dias_missa(ativo);
 
+-- Índice de busca por nome (uma linha por pessoa escalada, nome sem acentos/minúsculo)
+CREATE TABLE IF NOT EXISTS escala_membros (
+    id SERIAL PRIMARY KEY,
+    escala_id INTEGER NOT NULL REFERENCES escalas(id) ON DELETE CASCADE,
+    data_iso VARCHAR(10) NOT NULL,
+    funcao VARCHAR(20) NOT NULL,
+    nome VARCHAR(255) NOT NULL,
+    nome_busca VARCHAR(255) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_escala_membros_escala ON escala_membros(escala_id);
+CREATE INDEX IF NOT EXISTS idx_escala_membros_data ON escala_membros(data_iso);
+CREATE INDEX IF NOT EXISTS idx_escala_membros_nome_data ON escala_membros(nome, data_iso);
+
+ALTER TABLE pessoas ADD COLUMN IF NOT EXISTS nome_busca VARCHAR(255);
+
+-- Versão de cada linha para o controle de concorrência otimista (UPDATE ... WHERE versao = ?)
+ALTER TABLE escalas ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE escala_templates ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE pessoas ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+
+-- Desativação de pessoas: a linha fica (histórico), fora do cadastro ativo e das escalas futuras
+ALTER TABLE pessoas ADD COLUMN IF NOT EXISTS ativo INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE pessoas ADD COLUMN IF NOT EXISTS desativado_em VARCHAR(10);
+
+-- Rollup mensal de frequência (mantido pelo app a cada escrita em escalas)
+CREATE TABLE IF NOT EXISTS frequencia_mensal (
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    nome VARCHAR(255) NOT NULL,
+    funcao VARCHAR(20) NOT NULL,
+    tipo_escala VARCHAR(100) NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (ano, mes, nome, funcao, tipo_escala)
+);
+
+-- Candidatos dos modelos de escala (substitui as colunas *_template)
+CREATE TABLE IF NOT EXISTS template_candidatos (
+    template_id INTEGER NOT NULL REFERENCES escala_templates(id) ON DELETE CASCADE,
+    pessoa_id INTEGER NOT NULL REFERENCES pessoas(id) ON DELETE CASCADE,
+    funcao VARCHAR(20) NOT NULL,
+    posicao INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (template_id, funcao, pessoa_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_template_candidatos_pessoa ON template_candidatos(pessoa_id);
+
+-- Visão pré-processada de cada mês (JSON), mantida pelo app nas escritas em escalas
+CREATE TABLE IF NOT EXISTS visao_mensal (
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    atualizado_em VARCHAR(19) NOT NULL,
+    PRIMARY KEY (ano, mes)
+);
+
+-- Ausências: pessoa indisponível de data_inicio a data_fim ('YYYY-MM-DD'), opcionalmente só em alguns dias da semana
+CREATE TABLE IF NOT EXISTS indisponibilidades (
+    id SERIAL PRIMARY KEY,
+    pessoa_id INTEGER NOT NULL REFERENCES pessoas(id) ON DELETE CASCADE,
+    data_inicio VARCHAR(10) NOT NULL,
+    data_fim VARCHAR(10) NOT NULL,
+    dias_semana VARCHAR(20),
+    motivo TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_indisponibilidades_periodo ON indisponibilidades(data_fim, data_inicio);
+CREATE INDEX IF NOT EXISTS idx_indisponibilidades_pessoa ON indisponibilidades(pessoa_id);
+
+-- Execuções do gerador: semente, entradas e saídas (JSON) para reproduzir e comparar gerações
+CREATE TABLE IF NOT EXISTS geracoes (
+    id SERIAL PRIMARY KEY,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    semente BIGINT NOT NULL,
+    versao_gerador INTEGER NOT NULL,
+    entradas TEXT NOT NULL,
+    saidas TEXT NOT NULL,
+    duracao_ms DOUBLE PRECISION,
+    criado_em VARCHAR(19) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_geracoes_mes ON geracoes(ano, mes);
+-- Pontuação da candidata escolhida e das demais (JSON)
+ALTER TABLE geracoes ADD COLUMN IF NOT EXISTS pontuacao TEXT;
+
+-- Registro de alterações: entidade, mês, antes/depois (JSON); só recebe INSERTs
+CREATE TABLE IF NOT EXISTS alteracoes (
+    id SERIAL PRIMARY KEY,
+    entidade VARCHAR(30) NOT NULL,
+    entidade_id INTEGER,
+    ano INTEGER,
+    mes INTEGER,
+    acao VARCHAR(30) NOT NULL,
+    antes TEXT,
+    depois TEXT,
+    escopos TEXT NOT NULL,
+    autor VARCHAR(255),
+    origem VARCHAR(255) NOT NULL,
+    criado_em VARCHAR(19) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_alteracoes_mes ON alteracoes(ano, mes, id);
+
+-- pg_trgm: LIKE '%termo%' indexado e busca tolerante a erros de digitação
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_escala_membros_nome_trgm ON escala_membros USING gin (nome_busca gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_pessoas_nome_busca_trgm ON pessoas USING gin (nome_busca gin_trgm_ops);
+
 -- ============================================
 -- 2. INSERIR PESSOAS
 -- ============================================
@@ -107,6 +216,10 @@ INSERT INTO pessoas (nome, grupo, funcoes) VALUES
 ('Bernardo', 'mirins', '')
 ON CONFLICT (nome) DO NOTHING;
 
+-- Nome normalizado para busca (sem acentos, minúsculo; o app também preenche isso ao iniciar)
+CREATE EXTENSION IF NOT EXISTS unaccent;
+UPDATE pessoas SET nome_busca = LOWER(unaccent(nome)) WHERE nome_busca IS NULL;
+
 -- ============================================
 -- 3. INSERIR TEMPLATES DE ESCALA
 -- ============================================
@@ -188,6 +301,29 @@ ON CONFLICT (tipo_escala) DO UPDATE SET
     naveta_template = EXCLUDED.naveta_template,
     tochas_template = EXCLUDED.tochas_template;
 
+-- Migrar as listas acima (nomes separados por vírgula) para template_candidatos
+-- e limpar as colunas antigas (o app faz o mesmo ao iniciar, se encontrar conteúdo nelas)
+INSERT INTO template_candidatos (template_id, pessoa_id, funcao, posicao)
+SELECT t.id, p.id, l.funcao, MIN(n.posicao - 1)
+FROM escala_templates t
+CROSS JOIN LATERAL (VALUES
+    ('cerimoniarios', t.cerimoniarios_template),
+    ('veteranos', t.veteranos_template),
+    ('mirins', t.mirins_template),
+    ('turibulo', t.turibulo_template),
+    ('naveta', t.naveta_template),
+    ('tochas', t.tochas_template)
+) AS l(funcao, nomes)
+CROSS JOIN LATERAL unnest(string_to_array(l.nomes, ',')) WITH ORDINALITY AS n(nome, posicao)
+JOIN pessoas p ON p.nome = TRIM(n.nome)
+WHERE COALESCE(l.nomes, '') <> ''
+GROUP BY t.id, p.id, l.funcao
+ON CONFLICT DO NOTHING;
+
+UPDATE escala_templates SET
+    cerimoniarios_template = NULL, veteranos_template = NULL, mirins_template = NULL,
+    turibulo_template = NULL, naveta_template = NULL, tochas_template = NULL;
+
 -- ============================================
 -- 4. INSERIR DIAS DE MISSA
 -- ============================================
@@ -0,0 +1,147 @@
+"""
+Visão pré-processada do mês
+Para cada escala, a página do mês precisa da data formatada, data ISO, horário,
+cor da túnica, listas de membros por função e contagem. Esses registros são
+montados uma vez, nas escritas em escalas (mesma transação), e guardados como um
+JSON compacto por mês na tabela visao_mensal. Renderizar um mês passa a ser uma
+leitura desse JSON (ou do cache em memória) sem trabalho por linha.
+"""
+import json
+from datetime import datetime
+
+from cachetools import TTLCache
+
+import caches
+import cadastro
+import liturgia
+from busca import FUNCOES_ESCALA as FUNCOES, parsear_nomes
+from database import build_date_filter_query
+
+ROTULOS_DESCRICAO = [
+    ('cerimoniarios', 'Cerimoniários'), ('veteranos', 'Veteranos'), ('mirins', 'Mirins'),
+    ('turibulo', 'Turíbulo'), ('naveta', 'Naveta'), ('tochas', 'Tochas'),
+]
+DIAS_SEMANA = ['Segunda-Feira', 'Terça-Feira', 'Quarta-Feira', 'Quinta-Feira', 'Sexta-Feira', 'Sábado', 'Domingo']
+MESES = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+         'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+
+# Payload desserializado por (ano, mes, versões); as versões tornam entradas antigas inalcançáveis
+_visoes = TTLCache(maxsize=64, ttl=3600)
+
+
+def montar_registro(escala, horarios):
+    """Monta (registro da lista, evento do calendário) de uma escala; None se a data for inválida"""
+    escala = dict(escala)
+    try:
+        data_obj = datetime.strptime(escala['data'], '%d/%m/%Y')
+    except (ValueError, TypeError):
+        return None
+
+    membros = {funcao: parsear_nomes(escala.get(funcao)) for funcao in FUNCOES}
+    bata_cor = escala.get('bata_cor') or 'Bata Branca'
+    if 'Vermelha' in bata_cor or 'vermelha' in bata_cor or 'Vermelho' in bata_cor:
+        cor_class, bata_cor = 'vermelho', 'Bata Vermelha'
+    else:
+        cor_class, bata_cor = 'branco', 'Bata Branca'
+    horario = horarios.get(escala.get('tipo_escala', ''), '') or ''
+    celebracao = liturgia.celebracao_do_dia(data_obj)
+
+    escala.update({
+        'data_formatada': f"{DIAS_SEMANA[data_obj.weekday()]}, {data_obj.day} De {MESES[data_obj.month - 1]} De {data_obj.year}",
+        'data_iso': data_obj.strftime('%Y-%m-%d'),
+        'horario': horario,
+        'bata_cor_class': cor_class,
+        'bata_cor': bata_cor,
+        'celebracao': celebracao.nome if celebracao else None,
+        'membros': [nome for funcao in FUNCOES for nome in membros[funcao]],
+    })
+
+    desc = f"<b>Celebração:</b> {celebracao.nome}<br>" if celebracao else ""
+    desc += f"<b>Cor da Túnica:</b> {bata_cor}<br><br>"
+    desc += "<br>".join(
+        f"<b>{rotulo}:</b> {escala.get(funcao) or ''}"
+        for funcao, rotulo in ROTULOS_DESCRICAO
+        if funcao in ('cerimoniarios', 'veteranos', 'mirins') or escala.get(funcao)
+    )
+    evento = {
+        'id': escala['id'],
+        'title': escala.get('tipo_escala', ''),
+        'start': escala['data_iso'],
+        'extendedProps': {
+            'description': desc,
+            'bataCor': bata_cor,
+            'corClass': cor_class,
+            'horario': horario,
+            'celebracao': escala['celebracao'],
+            'memberCount': len(escala['membros']),
+            'members': membros,
+        },
+        'classNames': [cor_class],
+    }
+    return escala, evento
+
+
+def montar_mes(conn, mes, ano):
+    """Monta o payload do mês a partir da tabela escalas"""
+    horarios = cadastro.obter_dias_missa(conn).horarios
+    date_filter, date_params = build_date_filter_query(mes, ano)
+    escalas = conn.execute(f"SELECT * FROM escalas {date_filter} ORDER BY data, tipo_escala", date_params).fetchall()
+    payload = {'escalas': [], 'eventos': []}
+    for escala in escalas:
+        montado = montar_registro(escala, horarios)
+        if montado:
+            payload['escalas'].append(montado[0])
+            payload['eventos'].append(montado[1])
+    return payload
+
+
+def _gravar(conn, mes, ano, payload):
+    conn.execute(
+        '''INSERT INTO visao_mensal (ano, mes, payload, atualizado_em) VALUES (?, ?, ?, ?)
+           ON CONFLICT (ano, mes) DO UPDATE SET payload = excluded.payload, atualizado_em = excluded.atualizado_em''',
+        (ano, mes, json.dumps(payload, ensure_ascii=False, separators=(',', ':')),
+         datetime.now().isoformat(timespec='seconds'))
+    )
+
+
+def atualizar_mes(conn, mes, ano):
+    """Recalcula e grava a visão do mês (sem commit, na transação da escrita)"""
+    _gravar(conn, mes, ano, montar_mes(conn, mes, ano))
+
+
+def atualizar_mes_da_data(conn, data_br):
+    """Atalho para escritas de uma única escala ('DD/MM/YYYY')"""
+    _, mes, ano = data_br.split('/')
+    atualizar_mes(conn, int(mes), int(ano))
+
+
+def descartar_todas(conn):
+    """Apaga as visões gravadas (ex.: horários de dias_missa mudaram); são refeitas sob demanda"""
+    conn.execute('DELETE FROM visao_mensal')
+
+
+def versao_do_mes(mes, ano):
+    """Versões de que o payload do mês depende (também chave dos fragmentos HTML do mês)"""
+    return caches.versoes(caches.escopo_mes(ano, mes), 'dias_missa')
+
+
+def obter_mes(conn, mes, ano):
+    """
+    Payload do mês: {'escalas': [...], 'eventos': [...]}. Usa o cache em memória,
+    depois o JSON gravado e, se ainda não existir, monta e grava.
+    O resultado é compartilhado entre requisições: não altere.
+    """
+    chave = (ano, mes) + versao_do_mes(mes, ano)
+
+    def calcular():
+        row = conn.execute('SELECT payload FROM visao_mensal WHERE ano = ? AND mes = ?', (ano, mes)).fetchone()
+        if row is not None:
+            return json.loads(row['payload'])
+        payload = montar_mes(conn, mes, ano)
+        if not getattr(conn, 'somente_leitura', False):
+            # Na réplica de leitura não dá para gravar; a próxima leitura no primário grava
+            _gravar(conn, mes, ano, payload)
+            conn.commit()
+        return payload
+
+    return caches.obter_ou_calcular(_visoes, chave, calcular)